@@ -1,4 +1,6 @@
-from jwtblogapp import app
+from jwtblogapp import create_app
+
+app = create_app()
 
 if __name__ == '__main__':
     app.run()
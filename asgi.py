@@ -0,0 +1,6 @@
+from jwtblogapp.asgi import create_asgi_app
+
+# The async serving mode of the RESTful API, run it with an ASGI server, e.g.
+#   uvicorn asgi:app --host 0.0.0.0 --port 8080 --workers 4
+#   gunicorn -k uvicorn.workers.UvicornWorker -w 4 asgi:app
+app = create_asgi_app()
@@ -1,4 +1,4 @@
-from os import getenv
+from os import environ, getenv
 import multiprocessing
 
 bind = f'0.0.0.0:{getenv("APP_PORT", default=8080)}'
@@ -8,3 +8,12 @@ workers = multiprocessing.cpu_count() * 2 + 1
 preload_app = True
 
 accesslog = "-"
+
+# every worker writes its metrics to this directory, so '/metrics' sums the metrics of all workers
+metrics_dir = environ.setdefault('METRICS_DIR', '/tmp/jwtblogapp_metrics')
+
+
+def on_starting(server):  # noqa
+    # start the metrics of the new run from zero
+    from jwtblogapp.metrics import clear_directory
+    clear_directory(metrics_dir)
@@ -1,42 +1,122 @@
-from sqlalchemy import exc
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_restful import Api
 from flask_jwt_extended import JWTManager
 from jwtblogapp import config
+from jwtblogapp.hashing import PasswordHasher
 
-# Initialize application object
-app = Flask(__name__)
-
-# Configure app from python object i.e. from python module (config.py)
-app.config.from_object(config)
+# The extension objects are created unbound and bound to the app by create_app,
+# so importing the package neither creates the app nor connects to the database
 
 # Initialize database object
 database = SQLAlchemy()
+# Initialize JWT support object
+jwt = JWTManager()
+# Initialize password hashing executor
+password_hasher = PasswordHasher()
 
-database.init_app(app)
+# All that modules must be imported after the extension objects created, they use them
+from jwtblogapp import models  # noqa
+from jwtblogapp.blocklist import RevokedTokenCache, RevokedTokenPruner  # noqa
+from jwtblogapp.feed_cache import FeedCache  # noqa
+from jwtblogapp.metrics import RequestMetrics  # noqa
+from jwtblogapp.querylog import QueryLog  # noqa
+from jwtblogapp.profiling import RequestProfiler  # noqa
+from jwtblogapp.events import EventBroker  # noqa
+from jwtblogapp.groupcommit import GroupCommit  # noqa
 
-# Initialize api object
-blog_api = Api(app)
-# Initialize JWT support object
-jwt = JWTManager(app)
-
-# All that modules must be imported after app object created due Flask developers recommendation
-from jwtblogapp import views, models  # noqa
-from jwtblogapp.resources import SignupUser, LoginUser, LogoutUser, Posts, PostRating  # noqa
-
-# Create endpoints with paths by adding resource classes
-blog_api.add_resource(SignupUser, '/api/signup', endpoint='api_signup_user')
-blog_api.add_resource(LoginUser, '/api/login', endpoint='api_login_user')
-blog_api.add_resource(LogoutUser, '/api/logout', endpoint='api_logout_user')
-blog_api.add_resource(Posts, '/api/posts', endpoint='api_posts')
-blog_api.add_resource(PostRating, '/api/rating', endpoint='api_rating')
-
-# Trying to request to a database engine in application context to check the connectivity
-with app.app_context():
-    try:
-        database.create_all()
-    # If no connect print error message and exit application
-    except exc.OperationalError as error:
-        print(error, flush=True)
-        exit(1)
+# Initialize per worker cache of revoked tokens
+revoked_tokens_cache = RevokedTokenCache()
+# Initialize optional background pruning of expired revoked tokens
+revoked_tokens_pruner = RevokedTokenPruner()
+# Initialize cache of the public part of the posts feed
+feed_cache = FeedCache()
+# Initialize per request timing and SQL statements metrics
+request_metrics = RequestMetrics()
+# Initialize opt-in per request log of SQL statements with N+1 and slow statements detection
+query_log = QueryLog()
+# Initialize opt-in profiler of requests with the profiling header or sampled ones
+request_profiler = RequestProfiler()
+# Initialize per worker fan-out of the posts feed events to the streaming clients
+event_broker = EventBroker()
+# Initialize optional group commit of the concurrent writes of a worker
+group_commit = GroupCommit()
+
+# The counters use the feed cache and the event broker
+from jwtblogapp.counters import PostCounters  # noqa
+
+# Initialize optional write-behind mode of the posts likes and dislikes counts
+post_counters = PostCounters()
+
+
+def create_app(config_overrides=None):
+    """
+    Create and configure the application object. The database schema is not created here,
+    run 'flask init-db' before the app is started or set CREATE_SCHEMA_ON_STARTUP.
+
+    :param config_overrides: Gets the dictionary of configuration values replacing the ones of config.py
+    :return: the Flask application object
+    """
+    # Initialize application object
+    app = Flask(__name__)
+
+    # Configure app from python object i.e. from python module (config.py)
+    app.config.from_object(config)
+    app.config.update(config_overrides or {})
+
+    # Bind the extension objects to the app, the order matters: the metrics and logs use the database engine
+    database.init_app(app)
+    jwt.init_app(app)
+    password_hasher.init_app(app)
+    revoked_tokens_cache.init_app(app)
+    revoked_tokens_pruner.init_app(app)
+    feed_cache.init_app(app)
+    request_metrics.init_app(app)
+    query_log.init_app(app)
+    request_profiler.init_app(app)
+    event_broker.init_app(app)
+    group_commit.init_app(app)
+    post_counters.init_app(app)
+
+    # The views, the resources and the commands are imported with the app, they are not needed by the package users
+    from jwtblogapp import commands
+    from jwtblogapp.views import web
+    from jwtblogapp.resources import (SignupUser, LoginUser, LogoutUser, Posts, PostsImport, PostsExport, PostChanges,
+                                      PostEvents, PostRating, PostRatingBatch, Stats)
+
+    app.register_blueprint(web)
+    commands.init_app(app)
+
+    # Initialize api object
+    blog_api = Api(app)
+    # Create endpoints with paths by adding resource classes
+    blog_api.add_resource(SignupUser, '/api/signup', endpoint='api_signup_user')
+    blog_api.add_resource(LoginUser, '/api/login', endpoint='api_login_user')
+    blog_api.add_resource(LogoutUser, '/api/logout', endpoint='api_logout_user')
+    blog_api.add_resource(Posts, '/api/posts', endpoint='api_posts')
+    blog_api.add_resource(PostsImport, '/api/posts/import', endpoint='api_posts_import')
+    blog_api.add_resource(PostsExport, '/api/posts/export', endpoint='api_posts_export')
+    blog_api.add_resource(PostChanges, '/api/posts/changes', endpoint='api_post_changes')
+    blog_api.add_resource(PostEvents, '/api/posts/events', endpoint='api_post_events')
+    blog_api.add_resource(PostRating, '/api/rating', endpoint='api_rating')
+    blog_api.add_resource(PostRatingBatch, '/api/rating/batch', endpoint='api_rating_batch')
+    blog_api.add_resource(Stats, '/api/stats', endpoint='api_stats')
+    # Create the metrics endpoint in the Prometheus text format
+    app.add_url_rule('/metrics', endpoint='metrics', view_func=request_metrics.export)
+
+    if app.config['CREATE_SCHEMA_ON_STARTUP']:
+        with app.app_context():
+            database.create_all()
+
+    return app
+
+
+def __getattr__(name):
+    """
+    Create the default application object on the first access to 'jwtblogapp.app',
+    e.g. by 'gunicorn jwtblogapp:app' or 'from jwtblogapp import app'
+    """
+    if name == 'app':
+        globals()['app'] = create_app()
+        return globals()['app']
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
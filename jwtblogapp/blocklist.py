@@ -0,0 +1,246 @@
+import os
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from threading import Event, Lock, Thread
+from time import monotonic
+
+from sqlalchemy import func
+
+from jwtblogapp.models import RevokedToken
+
+
+class RevokedTokenCache:
+    """
+    Represents a per worker cache of revoked tokens identifiers (JTI).
+    Keeps a bounded set of revoked JTIs refreshed incrementally from the database by id high-water mark
+    (with a window behind it, because concurrent transactions may commit the ids out of order)
+    and a bounded set of recently checked not revoked JTIs with a short time to live.
+    """
+
+    def __init__(self, app=None):
+        """
+        Initialize instance of class
+
+        :param app: Gets the Flask application object to take the configuration from
+        """
+        self.max_size = 100000
+        self.negative_ttl = 5
+        self.rescan_window = 100
+        self.enabled = True
+        self.lock = Lock()
+        self.counters = {'hits': 0, 'misses': 0, 'refreshes': 0, 'db_lookups': 0, 'evictions': 0, 'expired': 0}
+        self.leeway = 0
+        self.reset()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Take the cache parameters from the app config
+
+        :param app: Gets the Flask application object
+        """
+        self.max_size = app.config.get('REVOKED_TOKENS_CACHE_SIZE', self.max_size)
+        self.negative_ttl = app.config.get('REVOKED_TOKENS_NEGATIVE_TTL', self.negative_ttl)
+        self.rescan_window = app.config.get('REVOKED_TOKENS_RESCAN_WINDOW', self.rescan_window)
+        self.enabled = app.config.get('REVOKED_TOKENS_CACHE_ENABLED', self.enabled)
+        self.leeway = app.config.get('JWT_DECODE_LEEWAY', self.leeway)
+
+    def cutoff(self):
+        """
+        Return the UTC time before which expired tokens can not be used anymore
+        :rtype: datetime
+        """
+        return datetime.utcnow() - timedelta(seconds=self.leeway)
+
+    def reset(self):
+        """
+        Forget all cached identifiers
+        """
+        self.revoked = OrderedDict()  # revoked JTIs in order of insertion
+        self.not_revoked = OrderedDict()  # not revoked JTIs with their expiry time
+        self.high_water_id = None  # the largest revoked token id seen in the database
+        self.window_ids = set()  # ids seen in the rescan window behind the high-water mark
+        self.complete = True  # True while the revoked set holds every revoked token up to high-water mark
+
+    def add(self, jti, expires_time=None):
+        """
+        Remember a revoked token identifier, e.g. right after logout
+
+        :param jti: Gets the JW token identifier
+        :param expires_time: Gets the token expiry UTC datetime
+        """
+        with self.lock:
+            self.not_revoked.pop(jti, None)
+            self._remember(jti, expires_time)
+
+    def is_revoked(self, jti, expires_time=None):
+        """
+        Check if the token identifier is revoked.
+        A token expired before the cutoff is unusable and its record may be pruned, so it is treated as revoked
+        without any lookup. Otherwise looks up the cache first, then refreshes it from the database
+        and remembers not revoked result.
+
+        :param jti: Gets the JW token identifier
+        :param expires_time: Gets the token expiry UTC datetime
+        :return: True if token is revoked, False otherwise
+        :rtype: bool
+        """
+        if expires_time is not None and expires_time < self.cutoff():
+            self.counters['expired'] += 1
+            return True
+
+        if not self.enabled:
+            return RevokedToken.query.filter_by(jti=jti).first() is not None
+
+        with self.lock:
+            if jti in self.revoked:
+                self.counters['hits'] += 1
+                return True
+            expires = self.not_revoked.get(jti)
+            if expires is not None and expires > monotonic():
+                self.counters['hits'] += 1
+                return False
+
+            self.counters['misses'] += 1
+            self._refresh()
+            if jti in self.revoked:
+                return True
+            # the cache may have forgotten an old token, so ask the database
+            if not self.complete:
+                self.counters['db_lookups'] += 1
+                token = RevokedToken.query.filter_by(jti=jti).first()
+                if token is not None:
+                    self._remember(jti, token.expires_time)
+                    return True
+
+            self.not_revoked.pop(jti, None)
+            self.not_revoked[jti] = monotonic() + self.negative_ttl
+            while len(self.not_revoked) > self.max_size:
+                self.not_revoked.popitem(last=False)
+            return False
+
+    def refresh(self):
+        """
+        Load revoked tokens stored since the last refresh, e.g. by other workers
+        """
+        with self.lock:
+            self._refresh()
+
+    def stats(self):
+        """
+        Return the cache counters and sizes
+        :rtype: dict
+        """
+        with self.lock:
+            return dict(self.counters, revoked_size=len(self.revoked), not_revoked_size=len(self.not_revoked),
+                        high_water_id=self.high_water_id)
+
+    def _remember(self, jti, expires_time=None):
+        self.revoked.pop(jti, None)
+        self.revoked[jti] = expires_time
+        if len(self.revoked) > self.max_size:
+            cutoff = self.cutoff()
+            while len(self.revoked) > self.max_size:
+                _, evicted_expires_time = self.revoked.popitem(last=False)
+                self.counters['evictions'] += 1
+                # forgetting an expired token does not make the cache incomplete
+                if evicted_expires_time is None or evicted_expires_time >= cutoff:
+                    self.complete = False
+
+    def _refresh(self):
+        self.counters['refreshes'] += 1
+        query = RevokedToken.query.with_entities(RevokedToken.id, RevokedToken.jti, RevokedToken.expires_time)
+        if self.high_water_id is None:
+            high_water_id = RevokedToken.query.with_entities(func.max(RevokedToken.id)).scalar() or 0
+            # expired tokens are never looked up, so they are not loaded
+            query = query.filter(RevokedToken.id <= high_water_id,
+                                 (RevokedToken.expires_time >= self.cutoff()) | (RevokedToken.expires_time.is_(None)))
+            # the first load takes only the newest tokens which fit in the cache
+            rows = query.order_by(RevokedToken.id.desc()).limit(self.max_size + 1).all()
+            if len(rows) > self.max_size:
+                self.complete = False
+            rows.reverse()
+            self.high_water_id = high_water_id
+        else:
+            # a lower id may become visible after a higher one, so the window behind the mark is read again
+            # and the ids already seen are skipped, the expired tokens are skipped like by the first load
+            query = query.filter(RevokedToken.id > self.high_water_id - self.rescan_window,
+                                 (RevokedToken.expires_time >= self.cutoff()) | (RevokedToken.expires_time.is_(None)))
+            rows = [row for row in query.order_by(RevokedToken.id).all() if row.id not in self.window_ids]
+
+        for token_id, jti, expires_time in rows:
+            self._remember(jti, expires_time)
+            self.not_revoked.pop(jti, None)
+            self.high_water_id = max(self.high_water_id, token_id)
+            self.window_ids.add(token_id)
+        self.window_ids = {token_id for token_id in self.window_ids
+                           if token_id > self.high_water_id - self.rescan_window}
+
+
+class RevokedTokenPruner:
+    """
+    Represents an optional background scheduler which periodically deletes expired revoked tokens.
+    The thread is started lazily in each worker process because threads do not survive the gunicorn fork.
+    """
+
+    def __init__(self, app=None):
+        """
+        Initialize instance of class
+
+        :param app: Gets the Flask application object to take the configuration from
+        """
+        self.app = None
+        self.interval = 0
+        self.batch_size = 1000
+        self.pid = None
+        self.stopped = Event()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Take the pruner parameters from the app config and start it before the first request of the worker
+
+        :param app: Gets the Flask application object
+        """
+        self.app = app
+        self.interval = app.config.get('REVOKED_TOKENS_PRUNE_INTERVAL', self.interval)
+        self.batch_size = app.config.get('REVOKED_TOKENS_PRUNE_BATCH_SIZE', self.batch_size)
+        if self.interval:
+            app.before_request(self.ensure_started)
+
+    def ensure_started(self):
+        """
+        Start the pruning thread once per process
+        """
+        if self.pid != os.getpid():
+            self.pid = os.getpid()
+            self.stopped.clear()
+            Thread(target=self.run, daemon=True).start()
+
+    def prune(self):
+        """
+        Delete expired revoked tokens in batches
+        :return: number of deleted records
+        :rtype: int
+        """
+        cutoff = datetime.utcnow() - timedelta(seconds=self.app.config.get('JWT_DECODE_LEEWAY', 0))
+        return RevokedToken.prune_expired(cutoff, batch_size=self.batch_size)
+
+    def run(self):
+        """
+        Prune expired tokens every interval seconds until stopped
+        """
+        while not self.stopped.wait(self.interval):
+            with self.app.app_context():
+                try:
+                    self.prune()
+                except Exception as error:  # noqa
+                    self.app.logger.warning('Revoked tokens pruning failed: %s', error)
+
+    def stop(self):
+        """
+        Stop the pruning thread
+        """
+        self.stopped.set()
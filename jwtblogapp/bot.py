@@ -30,38 +30,39 @@ class BlogBot:
         """
         Bot logic
         """
-        # loop of random number of users
-        for _ in range(self.number_of_users):
-            # assign fake credentials
-            username, password = self.fake.email(), self.fake.password(length=7, special_chars=False,
-                                                                       digits=True, upper_case=True,
-                                                                       lower_case=True)
-            # send post request to API signup endpoint and create the new user and obtain the token
-            payload = {'username': username, 'password': password}
-            requests.post(f'{self.api_url}/api/signup', json=payload)
-            # send post request to API login endpoint and and obtain the token
-            response = requests.post(f'{self.api_url}/api/login', json=payload)
-            token = response.json()['token']
-            headers = {'Authorization': f'Bearer {token}'}
-            # loop of random number of posts
-            for _ in range(randint(1, self.max_posts_per_user)):
-                # assign fake text
-                post_text = self.fake.text(max_nb_chars=200, ext_word_list=None)
-                # send post
-                payload = {'post_text': post_text}
-                requests.post(f'{self.api_url}/api/posts', headers=headers, json=payload)
-            # loop of random number of likes
-            for _ in range(randint(1, self.max_likes_per_user)):
-                # get possible post's ids
-                response = requests.get(f'{self.api_url}/api/posts', headers=headers)
-                posts = response.json()['posts']
-                post_ids = [post['post_id'] for post in posts]
-                # randomly assign post id
-                payload = {'post_id': choice(post_ids), 'like': 1}
-                # send like rating
-                requests.post(f'{self.api_url}/api/rating', headers=headers, json=payload)
-            # logout user
-            requests.post(f'{self.api_url}/api/logout', headers=headers)
+        # use one keep-alive connection for all requests of the bot
+        with requests.Session() as session:
+            # loop of random number of users
+            for _ in range(self.number_of_users):
+                # assign fake credentials
+                username, password = self.fake.email(), self.fake.password(length=7, special_chars=False,
+                                                                           digits=True, upper_case=True,
+                                                                           lower_case=True)
+                # send post request to API signup endpoint and create the new user and obtain the token
+                payload = {'username': username, 'password': password}
+                session.post(f'{self.api_url}/api/signup', json=payload)
+                # send post request to API login endpoint and and obtain the token
+                response = session.post(f'{self.api_url}/api/login', json=payload)
+                token = response.json()['token']
+                headers = {'Authorization': f'Bearer {token}'}
+                # loop of random number of posts
+                for _ in range(randint(1, self.max_posts_per_user)):
+                    # assign fake text
+                    post_text = self.fake.text(max_nb_chars=200, ext_word_list=None)
+                    # send post
+                    payload = {'post_text': post_text}
+                    session.post(f'{self.api_url}/api/posts', headers=headers, json=payload)
+                # get possible post's ids once per user
+                response = session.get(f'{self.api_url}/api/posts', headers=headers)
+                post_ids = [post['post_id'] for post in response.json()['posts']]
+                # loop of random number of likes
+                for _ in range(randint(1, self.max_likes_per_user)):
+                    # randomly assign post id
+                    payload = {'post_id': choice(post_ids), 'like': 1}
+                    # send like rating
+                    session.post(f'{self.api_url}/api/rating', headers=headers, json=payload)
+                # logout user
+                session.post(f'{self.api_url}/api/logout', headers=headers)
 
     def background_run(self):
         """
@@ -0,0 +1,149 @@
+import click
+from flask import current_app
+from flask.cli import AppGroup, with_appcontext
+
+from jwtblogapp import counters, database, exporting, migrations, post_counters, revoked_tokens_pruner, seeding
+
+
+def init_app(app):
+    """
+    Add the commands to the app's 'flask' command line interface
+
+    :param app: Gets the Flask application object
+    """
+    for command in (export, init_db, prune_tokens, reconcile_counters, schema, seed):
+        app.cli.add_command(command)
+
+
+@click.command('export')
+@click.argument('table', type=click.Choice(list(exporting.TABLES)), default='posts')
+@click.option('--format', 'export_format', type=click.Choice(list(exporting.FORMATS)), default='ndjson',
+              show_default=True, help='Export format')
+@click.option('--output', type=click.File('wb'), default='-', help='Output file, the standard output by default')
+@click.option('--gzip', 'compress', is_flag=True, help='Compress the output by gzip')
+@click.option('--user-id', type=int, default=None, help='Export the records of the user only')
+@click.option('--batch-size', type=int, default=None, help='Number of rows read and encoded at once')
+@with_appcontext
+def export(table, export_format, output, compress, user_id, batch_size):
+    """
+    Stream the posts or the ratings to the file in batches
+    """
+    config = current_app.config
+    for chunk in exporting.export(table, export_format, user_id, batch_size or config['EXPORT_BATCH_SIZE'],
+                                  compress, config['EXPORT_GZIP_LEVEL']):
+        output.write(chunk)
+
+
+@click.command('init-db')
+@with_appcontext
+def init_db():
+    """
+    Create the database tables and apply the schema migrations, run it before the app is started
+    """
+    database.create_all()
+    version = migrations.upgrade(echo=click.echo)
+    click.echo(f'Schema version is {version}')
+
+
+@click.command('prune-tokens')
+@click.option('--batch-size', type=int, default=None, help='Maximal number of records deleted in one transaction')
+@with_appcontext
+def prune_tokens(batch_size):
+    """
+    Delete revoked tokens which are already expired
+    """
+    if batch_size:
+        revoked_tokens_pruner.batch_size = batch_size
+    deleted = revoked_tokens_pruner.prune()
+    click.echo(f'Deleted {deleted} expired revoked tokens')
+
+
+@click.command('reconcile-counters')
+@click.option('--batch-size', type=int, default=1000, help='Number of posts checked in one transaction')
+@click.option('--dry-run', is_flag=True, help='Only count the posts with drifted counts')
+@with_appcontext
+def reconcile_counters(batch_size, dry_run):
+    """
+    Apply the pending write-behind changes and recompute the posts likes and dislikes counts from the ratings
+    """
+    if not dry_run:
+        click.echo(f'Applied {post_counters.flush()} pending counts changes')
+    drifted = counters.reconcile(batch_size, dry_run)
+    click.echo(f'Found {drifted} posts with drifted counts' if dry_run else f'Repaired {drifted} posts counts')
+
+
+@click.group('schema', cls=AppGroup)
+def schema():
+    """
+    Manage the database schema versions
+    """
+
+
+@schema.command('upgrade')
+@click.option('--to', 'target', type=int, default=None, help='Target schema version, the latest by default')
+def schema_upgrade(target):
+    """
+    Apply the schema migrations to the database
+    """
+    database.create_all()
+    version = migrations.upgrade(target, echo=click.echo)
+    click.echo(f'Schema version is {version}')
+
+
+@schema.command('downgrade')
+@click.option('--to', 'target', type=int, required=True, help='Target schema version')
+def schema_downgrade(target):
+    """
+    Revert the schema migrations newer than the target version
+    """
+    version = migrations.downgrade(target, echo=click.echo)
+    click.echo(f'Schema version is {version}')
+
+
+@schema.command('current')
+def schema_current():
+    """
+    Print the applied schema version
+    """
+    with database.engine.connect() as connection:
+        version = migrations.current_version(connection)
+    click.echo(f'Schema version is {version}, the latest is {migrations.LATEST_VERSION}')
+
+
+@schema.command('explain')
+def schema_explain():
+    """
+    Print the query plans of the app's hot queries
+    """
+    for name, sql, rows in migrations.explain_hot_queries():
+        click.echo(f'--- {name}')
+        click.echo(sql)
+        for row in rows:
+            click.echo('    ' + ' | '.join(str(value) for value in row))
+
+
+@click.command('seed')
+@click.option('--users', type=int, default=100, show_default=True, help='Number of users')
+@click.option('--posts', type=int, default=10000, show_default=True, help='Number of posts')
+@click.option('--ratings', type=int, default=50000, show_default=True, help='Number of ratings')
+@click.option('--revoked-tokens', type=int, default=10000, show_default=True, help='Number of revoked tokens')
+@click.option('--like-share', type=float, default=0.8, show_default=True, help='Share of likes among ratings')
+@click.option('--zipf', type=float, default=1.1, show_default=True,
+              help='Exponent of the posts popularity, 0 rates all posts equally')
+@click.option('--expired-share', type=float, default=0.5, show_default=True,
+              help='Share of revoked tokens which are already expired')
+@click.option('--seed', type=int, default=1, show_default=True, help='Random seed')
+@click.option('--batch-size', type=int, default=10000, show_default=True, help='Number of rows inserted at once')
+@click.option('--password', default=seeding.DEFAULT_PASSWORD, show_default=True, help='Password of all users')
+@click.option('--reset', is_flag=True, help='Delete users, posts, ratings and revoked tokens first')
+@with_appcontext
+def seed(users, posts, ratings, revoked_tokens, like_share, zipf, expired_share, seed, batch_size, password,
+         reset):
+    """
+    Fill the database with generated users, posts, ratings and revoked tokens
+    """
+    seeder = seeding.Seeder(users=users, posts=posts, ratings=ratings, revoked_tokens=revoked_tokens,
+                            like_share=like_share, zipf_exponent=zipf, expired_share=expired_share, seed=seed,
+                            batch_size=batch_size, password=password)
+    report = seeder.run(reset=reset, echo=click.echo)
+    click.echo(f'Seeded users from id {report["first_user_id"]} and posts from id {report["first_post_id"]}')
@@ -5,9 +5,13 @@ PREFERRED_URL_SCHEME = 'http'
 
 SECRET_KEY = getenv("SECRET_KEY")
 SQLALCHEMY_DATABASE_URI = getenv("DATABASE_URI")
+# database URI of the async serving mode ('asgi.py'), by default DATABASE_URI with the async driver of its backend
+ASYNC_DATABASE_URI = getenv("ASYNC_DATABASE_URI", default="")
 SQLALCHEMY_TRACK_MODIFICATIONS = False
 SQLALCHEMY_ENGINE_OPTIONS = {"pool_pre_ping": True}
 SQLALCHEMY_ECHO = False
+# create the missing tables when the app is created, otherwise run 'flask init-db' before the app is started
+CREATE_SCHEMA_ON_STARTUP = getenv("CREATE_SCHEMA_ON_STARTUP", default="") == "1"
 JWT_SECRET_KEY = getenv("JWT_SECRET_KEY")
 JWT_BLACKLIST_ENABLED = True
 JWT_BLACKLIST_TOKEN_CHECKS = ['access']
@@ -15,9 +19,117 @@ JWT_TOKEN_LOCATION = ['headers', 'cookies', 'json']
 JWT_COOKIE_CSRF_PROTECT = False
 JWT_CSRF_CHECK_FORM = False
 JWT_ACCESS_TOKEN_EXPIRES = 3600
+# size of the per worker cache of user identities for tokens issued without the 'user_id' claim
+IDENTITY_CACHE_SIZE = 1024
 PROPAGATE_EXCEPTIONS = True
 
+# ----- Password hashing executor configuration section -----
+# 'process' runs pbkdf2 hashing in a per worker process pool, 'inline' runs it on the request thread
+HASHING_EXECUTOR = getenv("HASHING_EXECUTOR", default="process")
+HASHING_POOL_SIZE = int(getenv("HASHING_POOL_SIZE", default="2"))
+# number of hashing tasks allowed to wait for a free process, above it requests get 503
+HASHING_QUEUE_SIZE = int(getenv("HASHING_QUEUE_SIZE", default="8"))
+HASHING_TIMEOUT = 5
+
+# ----- Revoked tokens cache configuration section -----
+REVOKED_TOKENS_CACHE_ENABLED = True
+REVOKED_TOKENS_CACHE_SIZE = 100000
+REVOKED_TOKENS_NEGATIVE_TTL = 5
+# number of ids behind the high-water mark read again on every refresh, concurrent logouts may commit out of id order
+REVOKED_TOKENS_RESCAN_WINDOW = 100
+# seconds between background pruning of expired revoked tokens, 0 disables it (use 'flask prune-tokens' instead)
+REVOKED_TOKENS_PRUNE_INTERVAL = int(getenv("REVOKED_TOKENS_PRUNE_INTERVAL", default="0"))
+REVOKED_TOKENS_PRUNE_BATCH_SIZE = 1000
+
+# ----- Posts feed configuration section -----
+POSTS_PAGE_LIMIT = 20
+POSTS_PAGE_MAX_LIMIT = 100
+# maximal number of ratings in one request of the batch rating endpoint
+RATING_BATCH_MAX_SIZE = 100
+# number of posts inserted by one statement of the posts import
+POSTS_IMPORT_BATCH_SIZE = 1000
+POSTS_IMPORT_MAX_LINE_BYTES = 64 * 1024
+# maximal number of the per line errors in the import response, the rest are counted only
+POSTS_IMPORT_MAX_ERRORS = 1000
+# maximal number of posts in one response of the changes since a feed version
+POSTS_CHANGES_LIMIT = 500
+# number of rows read from the database cursor and encoded at once by the posts and ratings export
+EXPORT_BATCH_SIZE = 1000
+EXPORT_GZIP_LEVEL = 6
+# 'memory' is the per worker LRU cache, 'sqlite' is the cache file shared by all workers, 'none' disables caching,
+# the entries are keyed by the feed version, so no backend serves a feed older than the last write
+FEED_CACHE_BACKEND = getenv("FEED_CACHE_BACKEND", default="memory")
+FEED_CACHE_PATH = getenv("FEED_CACHE_PATH", default="/tmp/jwtblogapp_feed_cache.sqlite")
+FEED_CACHE_SIZE = 256
+FEED_CACHE_TTL = 30
+# the feed of all posts (no page requested) is not cached above this number of posts
+FEED_CACHE_MAX_POSTS = 1000
+
+# ----- Posts counts configuration section -----
+# 'immediate' changes the post's counts in every rating write, 'write_behind' records the changes and applies them
+# in batches by a thread per worker, so the counts lag behind the ratings by the flush interval at most,
+# the feed ETag includes the user's last pending change, so the user's own 'like_it' is never served stale
+COUNTERS_MODE = getenv("COUNTERS_MODE", default="immediate")
+COUNTERS_FLUSH_INTERVAL_MS = int(getenv("COUNTERS_FLUSH_INTERVAL_MS", default="200"))
+# number of the worker's ratings waking the flush before the interval ends
+COUNTERS_FLUSH_EVENTS = 100
+# maximal number of the changes applied in one transaction
+COUNTERS_FLUSH_BATCH_SIZE = 10000
+
+# ----- Group commit configuration section -----
+# commit the post and rating writes of the concurrent requests of a worker together in one transaction,
+# it helps only if the worker serves requests concurrently, e.g. 'gunicorn --threads 8'
+GROUP_COMMIT_ENABLED = getenv("GROUP_COMMIT_ENABLED", default="") == "1"
+# maximal number of writes in one transaction
+GROUP_COMMIT_MAX_BATCH = 64
+# maximal milliseconds the first write of a batch waits for other writes
+GROUP_COMMIT_MAX_WAIT_MS = int(getenv("GROUP_COMMIT_MAX_WAIT_MS", default="2"))
+
+# ----- Feed events stream configuration section -----
+# the post and rating writes add events to the 'feed_events' table streamed by '/api/posts/events'
+EVENTS_ENABLED = getenv("EVENTS_ENABLED", default="1") == "1"
+# seconds between the worker's polls of the events table for the events written by other workers
+EVENTS_POLL_INTERVAL = 0.5
+# number of the latest events kept in the worker's memory for the clients resuming the stream
+EVENTS_BUFFER_SIZE = 1000
+# number of the latest events kept in the table, the clients resuming from an older event get the 'reset' event
+EVENTS_LOG_SIZE = 10000
+# seconds a stream lasts before the client reconnects, keep it below the gunicorn worker timeout
+EVENTS_STREAM_TIMEOUT = int(getenv("EVENTS_STREAM_TIMEOUT", default="25"))
+EVENTS_KEEPALIVE_INTERVAL = 10
+# milliseconds the client waits before reconnecting
+EVENTS_RETRY_MS = 1000
+
+# ----- Metrics configuration section -----
+METRICS_ENABLED = True
+# directory where every worker writes its metrics for '/metrics' to sum them, empty keeps the metrics per worker
+METRICS_DIR = getenv("METRICS_DIR", default="")
+# minimal seconds between writes of the worker's metrics file
+METRICS_FLUSH_INTERVAL = 1
+# diagnostic log of every request's SQL statements, it reports repeated statement shapes (N+1) and slow statements
+QUERY_LOG_ENABLED = getenv("QUERY_LOG_ENABLED", default="") == "1"
+QUERY_LOG_SLOW_MS = int(getenv("QUERY_LOG_SLOW_MS", default="100"))
+# number of executions of one statement shape in a request reported as N+1
+QUERY_LOG_REPEAT_THRESHOLD = 3
+# 'headers' adds X-Query-* response headers, 'log' writes the summary to the app log, 'both' does both
+QUERY_LOG_OUTPUT = getenv("QUERY_LOG_OUTPUT", default="headers")
+
+# ----- Profiling configuration section -----
+# the requests are profiled only if it is enabled, otherwise the app is not wrapped at all
+PROFILING_ENABLED = getenv("PROFILING_ENABLED", default="") == "1"
+# a request with this header equal to the token is profiled, the header is ignored without the token
+PROFILING_HEADER = 'X-Profile'
+PROFILING_TOKEN = getenv("PROFILING_TOKEN", default="")
+# share of requests profiled without the header, 0 disables sampling
+PROFILING_SAMPLE_RATE = float(getenv("PROFILING_SAMPLE_RATE", default="0"))
+PROFILING_DIR = getenv("PROFILING_DIR", default="/tmp/jwtblogapp_profiles")
+# the oldest profiles are deleted when the total size of the directory is above it
+PROFILING_MAX_BYTES = 50 * 1024 * 1024
+
 API_URL = f'http://127.0.0.1:{getenv("APP_PORT", default="8080")}'
+# 'local' makes the web views call the API service layer in the same worker,
+# 'http' makes them send the loopback HTTP requests to API_URL
+WEB_API_DISPATCH = getenv("WEB_API_DISPATCH", default="local")
 
 # ----- Blog Bot configuration section -----
 BOT_NUMBER_OF_USERS = 3
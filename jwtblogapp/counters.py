@@ -0,0 +1,209 @@
+import os
+from threading import Event, Lock, Thread
+
+from sqlalchemy import select, tuple_, update
+
+from jwtblogapp import database, event_broker, feed_cache
+from jwtblogapp.models import Post, Rating, FeedVersion, FeedEvent, PostCounterDelta
+
+
+class PostCounters:
+    """
+    Represents the write-behind mode of the posts likes and dislikes counts. A rating write commits the rating
+    and the change of the counts to the 'post_counter_deltas' table, so the likers of a hot post do not wait
+    for each other on its record lock. One thread per worker applies the pending changes to the posts every
+    flush interval or after the number of the worker's ratings, one update per post per batch. The feed counts
+    lag behind the ratings by the flush interval at most, while any of the workers is running.
+    In the 'immediate' mode (default) the rating write changes the counts itself and nothing runs.
+    """
+
+    def __init__(self, app=None):
+        """
+        Initialize instance of class
+
+        :param app: Gets the Flask application object to take the configuration from
+        """
+        self.app = None
+        self.write_behind = False
+        self.flush_interval = 0.2
+        self.flush_events = 100
+        self.batch_size = 10000
+        self.recorded_events = 0
+        self.lock = Lock()
+        self.counters = {'flushes': 0, 'flushed_deltas': 0, 'flushed_posts': 0}
+        self.pid = None
+        self.woken = Event()
+        self.stopped = Event()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Take the counters mode parameters from the app config and start the flushing thread before
+        the first request of the worker in the write-behind mode
+
+        :param app: Gets the Flask application object
+        """
+        self.app = app
+        self.write_behind = app.config.get('COUNTERS_MODE', 'immediate') == 'write_behind'
+        self.flush_interval = app.config.get('COUNTERS_FLUSH_INTERVAL_MS', self.flush_interval * 1000) / 1000
+        self.flush_events = app.config.get('COUNTERS_FLUSH_EVENTS', self.flush_events)
+        self.batch_size = app.config.get('COUNTERS_FLUSH_BATCH_SIZE', self.batch_size)
+        if self.write_behind:
+            app.before_request(self.ensure_started)
+
+    def ensure_started(self):
+        """
+        Start the flushing thread once per process
+        """
+        if self.pid != os.getpid():
+            self.pid = os.getpid()
+            self.stopped.clear()
+            Thread(target=self.run, daemon=True).start()
+
+    def recorded(self):
+        """
+        Count the committed rating of the worker and wake the flushing thread every flush events
+        """
+        with self.lock:
+            self.recorded_events += 1
+            if self.recorded_events < self.flush_events:
+                return
+            self.recorded_events = 0
+        self.woken.set()
+
+    def flush_batch(self):
+        """
+        Apply one batch of the pending changes to the posts counts in one transaction. The changed posts and
+        the ratings of the batch are stamped with the bumped feed version.
+
+        :return: number of the applied changes
+        :rtype: int
+        """
+        # check without locking first, so idle polls do not bump the feed version
+        if not database.session.query(PostCounterDelta.id).limit(1).all():
+            database.session.commit()
+            return 0
+
+        # the feed version record lock makes the concurrent flushes of the workers take turns
+        FeedVersion.bump()
+        deltas = database.session.query(PostCounterDelta.id, PostCounterDelta.post_id, PostCounterDelta.user_id,
+                                        PostCounterDelta.likes_delta, PostCounterDelta.dislikes_delta).order_by(
+            PostCounterDelta.id).limit(self.batch_size).all()
+        if not deltas:
+            database.session.rollback()
+            return 0
+
+        totals = {}
+        for delta in deltas:
+            likes, dislikes = totals.get(delta.post_id, (0, 0))
+            totals[delta.post_id] = (likes + delta.likes_delta, dislikes + delta.dislikes_delta)
+        Post.add_counts_batch(totals)
+        database.session.execute(update(Rating).where(
+            tuple_(Rating.user_id, Rating.post_id).in_([(delta.user_id, delta.post_id) for delta in deltas])).values(
+            change_version=FeedVersion.version_subquery()))
+        # the changes are deleted by id, the ones committed while flushing stay for the next batch
+        database.session.query(PostCounterDelta).filter(PostCounterDelta.id.in_([delta.id for delta in deltas])).delete(
+            synchronize_session=False)
+        if event_broker.enabled:
+            for post_id, likes, dislikes in database.session.execute(
+                    select(Post.id, Post.likes, Post.dislikes).where(Post.id.in_(list(totals))).order_by(Post.id)):
+                FeedEvent.record('rating_changed', {'post_id': post_id, 'likes': likes, 'dislikes': dislikes})
+        database.session.commit()
+
+        with self.lock:
+            self.counters['flushes'] += 1
+            self.counters['flushed_deltas'] += len(deltas)
+            self.counters['flushed_posts'] += len(totals)
+        return len(deltas)
+
+    def flush(self):
+        """
+        Apply all pending changes to the posts counts in batches
+
+        :return: number of the applied changes
+        :rtype: int
+        """
+        flushed = 0
+        while True:
+            applied = self.flush_batch()
+            flushed += applied
+            if applied < self.batch_size:
+                break
+        if flushed:
+            feed_cache.invalidate()
+            event_broker.publish()
+        return flushed
+
+    def run(self):
+        """
+        Flush the pending changes every flush interval or when woken until stopped
+        """
+        while not self.stopped.is_set():
+            self.woken.wait(self.flush_interval)
+            self.woken.clear()
+            with self.app.app_context():
+                try:
+                    self.flush()
+                except Exception as error:  # noqa
+                    database.session.rollback()
+                    self.app.logger.warning('Post counters flush failed: %s', error)
+
+    def stop(self):
+        """
+        Stop the flushing thread
+        """
+        self.stopped.set()
+        self.woken.set()
+
+    def stats(self):
+        """
+        Return the flush counters of the worker and the mode
+        :rtype: dict
+        """
+        with self.lock:
+            counters = dict(self.counters)
+        counters['mode'] = 'write_behind' if self.write_behind else 'immediate'
+        return counters
+
+
+def reconcile(batch_size=1000, dry_run=False):
+    """
+    Recompute the posts likes and dislikes counts from the ratings and repair the drifted ones in batches of posts,
+    committing each batch. The pending write-behind changes are taken into account, so they may still be applied.
+    The repaired posts are stamped with the bumped feed version.
+
+    :param batch_size: Gets the number of posts checked in one transaction
+    :param dry_run: Gets True to only count the drifted posts
+    :return: number of the drifted posts
+    :rtype: int
+    """
+    def expected(value, column):
+        return select(database.func.count()).where(Rating.post_id == Post.id, Rating.value == value).scalar_subquery() \
+            - PostCounterDelta.pending_sum(column)
+
+    expected_likes = expected(1, PostCounterDelta.likes_delta)
+    expected_dislikes = expected(-1, PostCounterDelta.dislikes_delta)
+    drifted = database.or_(database.func.coalesce(Post.likes, -1) != expected_likes,
+                           database.func.coalesce(Post.dislikes, -1) != expected_dislikes)
+
+    repaired = 0
+    last_id = 0
+    while True:
+        ids = [post_id for post_id, in database.session.query(Post.id).filter(Post.id > last_id).order_by(
+            Post.id).limit(batch_size)]
+        if not ids:
+            break
+        last_id = ids[-1]
+        in_batch = Post.id.between(ids[0], last_id)
+        drifted_ids = [post_id for post_id, in database.session.query(Post.id).filter(in_batch, drifted)]
+        if drifted_ids and not dry_run:
+            FeedVersion.bump()
+            database.session.execute(update(Post).where(Post.id.in_(drifted_ids)).values(
+                likes=expected_likes, dislikes=expected_dislikes, change_version=FeedVersion.version_subquery()))
+        database.session.commit()
+        repaired += len(drifted_ids)
+
+    if repaired and not dry_run:
+        feed_cache.invalidate()
+    return repaired
@@ -0,0 +1,219 @@
+import json
+import os
+from collections import deque
+from threading import Condition, Event, Lock, Thread
+from time import monotonic
+
+from flask import Response, stream_with_context
+
+from jwtblogapp import database
+from jwtblogapp.models import FeedEvent
+
+
+def format_event(event):
+    """
+    Make the Server-Sent Events message of the event
+
+    :param event: Gets the dictionary with 'id', 'event' and 'data' (JSON text) keys
+    :rtype: str
+    """
+    return f'id: {event["id"]}\nevent: {event["event"]}\ndata: {event["data"]}\n\n'
+
+
+class EventBroker:
+    """
+    Represents the per worker fan-out of the posts feed events to the streaming clients.
+    The write paths add the events to the 'feed_events' table in their transactions, so the table is the event
+    sequence shared by all workers. One thread per worker polls it for new events (only after the first client
+    is connected) into the bounded in-memory buffer and wakes the worker's streams, so the number of clients
+    does not multiply the queries. The writing workers keep the table bounded whether any client is connected
+    or not. A client resuming from an event older than the buffer is served from the table, and gets
+    the 'reset' event if the event is already pruned from it.
+    """
+
+    def __init__(self, app=None):
+        """
+        Initialize instance of class
+
+        :param app: Gets the Flask application object to take the configuration from
+        """
+        self.app = None
+        self.enabled = True
+        self.poll_interval = 0.5
+        self.buffer_size = 1000
+        self.log_size = 10000
+        self.stream_timeout = 25
+        self.keepalive_interval = 10
+        self.retry_ms = 1000
+        self.buffer = deque()
+        self.last_id = 0
+        self.published = 0
+        self.lock = Lock()
+        self.changed = Condition()
+        self.woken = Event()
+        self.stopped = Event()
+        self.pid = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Take the broker parameters from the app config
+
+        :param app: Gets the Flask application object
+        """
+        self.app = app
+        self.enabled = app.config.get('EVENTS_ENABLED', self.enabled)
+        self.poll_interval = app.config.get('EVENTS_POLL_INTERVAL', self.poll_interval)
+        self.buffer_size = app.config.get('EVENTS_BUFFER_SIZE', self.buffer_size)
+        self.log_size = app.config.get('EVENTS_LOG_SIZE', self.log_size)
+        self.stream_timeout = app.config.get('EVENTS_STREAM_TIMEOUT', self.stream_timeout)
+        self.keepalive_interval = app.config.get('EVENTS_KEEPALIVE_INTERVAL', self.keepalive_interval)
+        self.retry_ms = app.config.get('EVENTS_RETRY_MS', self.retry_ms)
+        self.buffer = deque(maxlen=self.buffer_size)
+
+    def ensure_started(self):
+        """
+        Take the last event id and start the polling thread once per process
+        """
+        if self.pid != os.getpid():
+            self.pid = os.getpid()
+            self.buffer.clear()
+            self.last_id = database.session.query(database.func.max(FeedEvent.id)).scalar() or 0
+            self.stopped.clear()
+            Thread(target=self.run, daemon=True).start()
+
+    def publish(self, count=1):
+        """
+        Wake the worker's polling thread after a committed write, so the worker's own clients get
+        the event without waiting for the poll interval, and prune the events log once per buffer size
+        of the worker's events
+
+        :param count: Gets the number of the events recorded by the write
+        """
+        self.woken.set()
+        with self.lock:
+            self.published += count
+            if self.published < self.buffer_size:
+                return
+            self.published = 0
+        self.prune()
+
+    def prune(self):
+        """
+        Delete the events older than the log size from the table, the failure is logged only
+        """
+        try:
+            FeedEvent.prune(self.log_size)
+        except Exception as error:  # noqa
+            database.session.rollback()
+            self.app.logger.warning('Feed events pruning failed: %s', error)
+
+    def poll(self):
+        """
+        Fetch the new events from the table to the buffer and wake the waiting streams
+
+        :return: number of fetched events
+        :rtype: int
+        """
+        events = FeedEvent.after(self.last_id, self.buffer_size)
+        # end the read transaction, so the next poll sees the events committed after it
+        database.session.commit()
+        if events:
+            with self.changed:
+                self.buffer.extend(events)
+                self.last_id = events[-1]['id']
+                self.changed.notify_all()
+        return len(events)
+
+    def run(self):
+        """
+        Poll the events table every interval seconds or when woken until stopped
+        """
+        while not self.stopped.is_set():
+            self.woken.wait(self.poll_interval)
+            self.woken.clear()
+            with self.app.app_context():
+                try:
+                    # drain the backlog without waiting if there are more events than the buffer takes at once
+                    while self.poll() == self.buffer_size:
+                        pass
+                except Exception as error:  # noqa
+                    self.app.logger.warning('Feed events polling failed: %s', error)
+
+    def stop(self):
+        """
+        Stop the polling thread
+        """
+        self.stopped.set()
+        self.woken.set()
+
+    def events_after(self, event_id):
+        """
+        Return the events after the given one from the buffer or, if it is older than the buffer, from the table
+
+        :param event_id: Gets the id of the last event the client has
+        :return: list of event dictionaries oldest first or None if some of the events are pruned from the log
+        :rtype: list or None
+        """
+        with self.changed:
+            if event_id >= self.last_id:
+                return []
+            if self.buffer and self.buffer[0]['id'] <= event_id + 1:
+                return [event for event in self.buffer if event['id'] > event_id]
+
+        first_id = database.session.query(database.func.min(FeedEvent.id)).scalar()
+        events = FeedEvent.after(event_id, self.buffer_size)
+        database.session.commit()
+        if first_id is None or event_id < first_id - 1:
+            return None
+        return events
+
+    def wait(self, event_id, timeout):
+        """
+        Wait until there is an event after the given one
+
+        :param event_id: Gets the id of the last event the client has
+        :param timeout: Gets the maximal waiting time in seconds
+        :return: True if there are new events, False on timeout
+        :rtype: bool
+        """
+        with self.changed:
+            return self.changed.wait_for(lambda: self.last_id > event_id, timeout)
+
+    def stream(self, last_event_id=None):
+        """
+        Generate the Server-Sent Events messages of the events after the given one or, without it, of the events
+        happening from now on. The stream ends after the stream timeout, so a sync worker is not held by one client
+        for long, and the client reconnects with the 'Last-Event-ID' header of the last received event.
+
+        :param last_event_id: Gets the id of the last event the client has
+        :return: generator of the messages text
+        """
+        deadline = monotonic() + self.stream_timeout
+        event_id = self.last_id if last_event_id is None else last_event_id
+        yield f'retry: {self.retry_ms}\n\n'
+        while monotonic() < deadline:
+            events = self.events_after(event_id)
+            if events is None:
+                # the client missed the pruned events, it has to reload the feed
+                event_id = self.last_id
+                yield format_event({'id': event_id, 'event': 'reset', 'data': json.dumps({'last_id': event_id})})
+                continue
+            for event in events:
+                yield format_event(event)
+                event_id = event['id']
+            if not events and not self.wait(event_id, min(self.keepalive_interval, deadline - monotonic())):
+                # the comment keeps the idle connection open through proxies
+                yield ': keepalive\n\n'
+
+    def response(self, last_event_id=None):
+        """
+        Make the streaming 'text/event-stream' response of the events after the given one
+
+        :param last_event_id: Gets the id of the last event the client has
+        :rtype: Response
+        """
+        self.ensure_started()
+        return Response(stream_with_context(self.stream(last_event_id)), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
@@ -0,0 +1,111 @@
+import csv
+import io
+import json
+import zlib
+
+from sqlalchemy import select
+
+from jwtblogapp import database
+from jwtblogapp.models import Post, Rating
+
+# the media types of the export formats
+FORMATS = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+# the model, the exported fields and the condition of the exported records of every table,
+# the posts fields are the ones the posts import reads, the ratings 'value' is 1 for like and -1 for dislike
+# (not the 0/1 'like' of the rating API) and the indifferent ratings are not exported
+TABLES = {
+    'posts': (Post, (('post_id', Post.id), ('user_id', Post.user_id), ('username', Post.username),
+                     ('post_text', Post.text), ('likes', Post.likes), ('dislikes', Post.dislikes),
+                     ('created_time', Post.created_time)), None),
+    'ratings': (Rating, (('post_id', Rating.post_id), ('user_id', Rating.user_id), ('value', Rating.value),
+                         ('created_time', Rating.created_time)), Rating.value != 0),
+}
+
+
+def export_batches(table, user_id=None, batch_size=1000):
+    """
+    Read the records of the table in batches by one query, oldest first. The rows are fetched from the database
+    cursor by the batch size ('yield_per', the server side cursor where the driver has it), so the memory
+    does not depend on the table size.
+
+    :param table: Gets the table name, 'posts' or 'ratings'
+    :param user_id: Gets the id of the user whose records are exported, all records by default
+    :param batch_size: Gets the number of rows fetched at once
+    :return: generator of the lists of row tuples
+    """
+    model, fields, condition = TABLES[table]
+    statement = select(*[column for _, column in fields]).order_by(model.id)
+    if condition is not None:
+        statement = statement.where(condition)
+    if user_id is not None:
+        statement = statement.where(model.user_id == user_id)
+    result = database.session.execute(statement.execution_options(yield_per=batch_size))
+    try:
+        yield from result.partitions()
+    finally:
+        result.close()
+
+
+def export_value(value):
+    """
+    Convert the column value to its exported form, the times are in ISO 8601 format
+    """
+    return value.isoformat() if hasattr(value, 'isoformat') else value
+
+
+def encode_batches(batches, fields, export_format):
+    """
+    Encode the batches of rows in the format, one chunk per batch
+
+    :param batches: Gets the iterable of the lists of row tuples
+    :param fields: Gets the list of the field names of the row values
+    :param export_format: Gets 'ndjson' for a JSON object per line or 'csv' for the CSV with the header line
+    :return: generator of the UTF-8 encoded chunks
+    """
+    if export_format == 'ndjson':
+        for rows in batches:
+            yield ''.join(json.dumps(dict(zip(fields, map(export_value, row)))) + '\n' for row in rows).encode()
+        return
+
+    # the CSV writer writes every batch to a new buffer, so only one batch is kept
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(fields)
+    yield buffer.getvalue().encode()
+    for rows in batches:
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows([map(export_value, row) for row in rows])
+        yield buffer.getvalue().encode()
+
+
+def gzip_chunks(chunks, level=6):
+    """
+    Compress the chunks into one gzip stream while they are produced
+
+    :param chunks: Gets the iterable of the bytes chunks
+    :param level: Gets the compression level from 1 to 9
+    :return: generator of the compressed chunks
+    """
+    # 16 added to the window bits makes the gzip header and trailer
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def export(table, export_format='ndjson', user_id=None, batch_size=1000, compress=False, level=6):
+    """
+    Stream the records of the table in the format
+
+    :param table: Gets the table name, 'posts' or 'ratings'
+    :param export_format: Gets the format, 'ndjson' or 'csv'
+    :param user_id: Gets the id of the user whose records are exported, all records by default
+    :param batch_size: Gets the number of rows read and encoded at once
+    :param compress: Gets True to compress the stream by gzip
+    :param level: Gets the gzip compression level
+    :return: generator of the bytes chunks
+    """
+    fields = [name for name, _ in TABLES[table][1]]
+    chunks = encode_batches(export_batches(table, user_id, batch_size), fields, export_format)
+    return gzip_chunks(chunks, level) if compress else chunks
@@ -0,0 +1,248 @@
+import json
+import os
+import sqlite3
+from collections import OrderedDict
+from threading import Lock, local
+from time import time
+
+
+class MemoryBackend:
+    """
+    Represents the in-process LRU cache backend with time to live. Every worker has its own entries,
+    so an invalidation in one worker does not reach the others, the feed version in the keys does.
+    The entries of an older feed version can never be hit again, so they are dropped when a newer version is set.
+    """
+
+    def __init__(self, max_entries, ttl):
+        """
+        Initialize instance of class
+
+        :param max_entries: Gets the maximal number of cached entries
+        :param ttl: Gets the entry time to live in seconds
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.current_generation = 0
+        self.version = None  # the newest feed version of the cached entries
+        self.lock = Lock()
+
+    def generation(self):
+        """
+        Return the current cache generation, it is a part of every key
+        :rtype: int
+        """
+        return self.current_generation
+
+    def get(self, key):
+        """
+        Return the cached value or None if there is no such entry or it is expired
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires, _, value = entry
+            if expires < time():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, version=None):
+        """
+        Cache the value
+
+        :param key: Gets the entry key
+        :param value: Gets the value
+        :param version: Gets the feed version the value was built at, the entries of older versions are dropped
+        :return: number of evicted entries
+        :rtype: int
+        """
+        with self.lock:
+            evicted = 0
+            if version is not None and self.version is not None and version < self.version:
+                # the page was built before the newer version was cached, nobody asks for it anymore
+                return evicted
+            if version is not None and version != self.version:
+                stale = [entry_key for entry_key, (_, entry_version, _) in self.entries.items()
+                         if entry_version is not None and entry_version < version]
+                for entry_key in stale:
+                    del self.entries[entry_key]
+                evicted += len(stale)
+                self.version = version
+            self.entries[key] = (time() + self.ttl, version, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                evicted += 1
+            return evicted
+
+    def invalidate(self):
+        """
+        Drop all entries and start the new generation
+        """
+        with self.lock:
+            self.current_generation += 1
+            self.entries.clear()
+
+    def size(self):
+        return len(self.entries)
+
+
+class SQLiteBackend:
+    """
+    Represents the cache backend stored in a local SQLite file, shared by all gunicorn workers of the host.
+    The generation is stored in the same file, so an invalidation is seen by every worker at once.
+    """
+
+    def __init__(self, path, max_entries, ttl):
+        """
+        Initialize instance of class
+
+        :param path: Gets the SQLite file path
+        :param max_entries: Gets the maximal number of cached entries
+        :param ttl: Gets the entry time to live in seconds
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.connections = local()
+
+    def connection(self):
+        # sqlite3 connections can not be shared by threads or inherited by forked workers
+        connection = getattr(self.connections, 'connection', None)
+        if connection is None or self.connections.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('CREATE TABLE IF NOT EXISTS entries '
+                               '(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL)')
+            connection.execute('CREATE TABLE IF NOT EXISTS generation (id INTEGER PRIMARY KEY, value INTEGER)')
+            connection.execute('INSERT OR IGNORE INTO generation (id, value) VALUES (1, 0)')
+            self.connections.connection = connection
+            self.connections.pid = os.getpid()
+        return connection
+
+    def generation(self):
+        return self.connection().execute('SELECT value FROM generation WHERE id = 1').fetchone()[0]
+
+    def get(self, key):
+        row = self.connection().execute('SELECT value FROM entries WHERE key = ? AND expires >= ?',
+                                        (key, time())).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, key, value, version=None):  # noqa
+        # the shared file is bounded by the entries limit, the entries of older versions expire or are evicted
+        connection = self.connection()
+        connection.execute('INSERT OR REPLACE INTO entries (key, value, expires) VALUES (?, ?, ?)',
+                           (key, json.dumps(value), time() + self.ttl))
+        # evict expired entries, then the entries closest to expiry above the limit
+        evicted = connection.execute('DELETE FROM entries WHERE expires < ?', (time(),)).rowcount
+        evicted += connection.execute('DELETE FROM entries WHERE key IN (SELECT key FROM entries '
+                                      'ORDER BY expires LIMIT max(0, (SELECT COUNT(*) FROM entries) - ?))',
+                                      (self.max_entries,)).rowcount
+        return evicted
+
+    def invalidate(self):
+        connection = self.connection()
+        connection.execute('BEGIN IMMEDIATE')
+        connection.execute('UPDATE generation SET value = value + 1 WHERE id = 1')
+        connection.execute('DELETE FROM entries')
+        connection.execute('COMMIT')
+
+    def size(self):
+        return self.connection().execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+
+
+class FeedCache:
+    """
+    Represents the cache of the serialized public part of the posts feed, i.e. without the current user's
+    'like_it'. The keys include the cache generation, which is bumped by every post or rating write of
+    the worker, and the callers put the feed version in the keys, so a page built before a write of any worker
+    is never served after it.
+    """
+
+    def __init__(self, app=None):
+        """
+        Initialize instance of class
+
+        :param app: Gets the Flask application object to take the configuration from
+        """
+        self.backend = None
+        self.lock = Lock()
+        self.counters = {'hits': 0, 'misses': 0, 'sets': 0, 'evictions': 0, 'invalidations': 0}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Create the cache backend configured in the app config
+
+        :param app: Gets the Flask application object
+        """
+        backend = app.config.get('FEED_CACHE_BACKEND', 'memory')
+        max_entries = app.config.get('FEED_CACHE_SIZE', 256)
+        ttl = app.config.get('FEED_CACHE_TTL', 30)
+        if backend == 'memory':
+            self.backend = MemoryBackend(max_entries, ttl)
+        elif backend == 'sqlite':
+            self.backend = SQLiteBackend(app.config['FEED_CACHE_PATH'], max_entries, ttl)
+        else:
+            self.backend = None
+
+    def generation(self):
+        """
+        Return the current cache generation or None if the cache is disabled.
+        Take it before querying the database and pass it to get and set.
+        """
+        return self.backend.generation() if self.backend is not None else None
+
+    def get(self, generation, key):
+        """
+        Return the cached value or None
+
+        :param generation: Gets the cache generation
+        :param key: Gets the key of the feed page
+        """
+        if self.backend is None:
+            return None
+        value = self.backend.get(f'{generation}:{key}')
+        with self.lock:
+            self.counters['hits' if value is not None else 'misses'] += 1
+        return value
+
+    def set(self, generation, key, value, version=None):
+        """
+        Cache the value
+
+        :param generation: Gets the cache generation taken before the value was built
+        :param key: Gets the key of the feed page
+        :param value: Gets the JSON serializable value
+        :param version: Gets the feed version the value was built at, it is a part of the key
+        """
+        if self.backend is None:
+            return
+        evicted = self.backend.set(f'{generation}:{key}', value, version)
+        with self.lock:
+            self.counters['sets'] += 1
+            self.counters['evictions'] += evicted
+
+    def invalidate(self):
+        """
+        Drop all cached pages, call it after every post or rating write is committed
+        """
+        if self.backend is None:
+            return
+        self.backend.invalidate()
+        with self.lock:
+            self.counters['invalidations'] += 1
+
+    def stats(self):
+        """
+        Return the cache counters of the worker and the number of cached entries
+        :rtype: dict
+        """
+        with self.lock:
+            counters = dict(self.counters)
+        counters['entries'] = self.backend.size() if self.backend is not None else 0
+        return counters
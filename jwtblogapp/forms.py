@@ -1,6 +1,7 @@
 from flask_wtf import FlaskForm
-from wtforms import HiddenField, StringField, SubmitField, TextAreaField
-from wtforms.validators import DataRequired, Email
+from wtforms import IntegerField, StringField, SubmitField, TextAreaField
+from wtforms.validators import AnyOf, DataRequired, Email, InputRequired
+from wtforms.widgets import HiddenInput
 
 
 class LoginForm(FlaskForm):
@@ -24,5 +25,7 @@ class RateForm(FlaskForm):
     """
     Describes the 'like and dislike forms' in the frontend for post rating
     """
-    post_id = HiddenField()  # a hidden field for render post_id value
-    like = HiddenField()  # a hidden field for render like 0 or 1 value
+    # a hidden field for render post_id value
+    post_id = IntegerField(widget=HiddenInput(), validators=[InputRequired()])
+    # a hidden field for render like 0 or 1 value
+    like = IntegerField(widget=HiddenInput(), validators=[InputRequired(), AnyOf([0, 1])])
@@ -0,0 +1,196 @@
+import os
+from concurrent.futures import Future
+from queue import Empty, Queue
+from threading import Lock, Thread
+from time import monotonic, perf_counter
+
+from sqlalchemy import text
+
+from jwtblogapp import database
+
+
+class WriteRollback(Exception):
+    """
+    Raised by a write operation to roll back its own changes, e.g. if the written record does not exist.
+    The operation's result is the exception's result.
+    """
+
+    def __init__(self, result=None):
+        super().__init__(result)
+        self.result = result
+
+
+class GroupCommit:
+    """
+    Represents the optional group commit of the writes of a worker. A write is a function changing the records
+    through 'database.session' without committing. When enabled the writes of the concurrent requests of
+    the worker are queued to one thread, which runs up to the batch size of them, every one in its own
+    savepoint, and commits them with one transaction, so the requests share one fsync of the database log.
+    A request gets the result of its write only after its batch is committed. If the batch commit fails,
+    its writes are run again one by one. When disabled every write is committed by the request itself.
+    The group commit helps only if a worker serves requests concurrently, e.g. gunicorn '--threads'.
+    """
+
+    def __init__(self, app=None):
+        """
+        Initialize instance of class
+
+        :param app: Gets the Flask application object to take the configuration from
+        """
+        self.app = None
+        self.enabled = False
+        self.max_batch = 64
+        self.max_wait = 0.002
+        self.queue = Queue()
+        self.pid = None
+        self.started_lock = Lock()
+        self.lock = Lock()
+        self.counters = {'batches': 0, 'writes': 0, 'max_batch_size': 0, 'commit_ms': 0.0, 'max_commit_ms': 0.0,
+                         'failed_batches': 0}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Take the group commit parameters from the app config
+
+        :param app: Gets the Flask application object
+        """
+        self.app = app
+        self.enabled = app.config.get('GROUP_COMMIT_ENABLED', self.enabled)
+        self.max_batch = app.config.get('GROUP_COMMIT_MAX_BATCH', self.max_batch)
+        self.max_wait = app.config.get('GROUP_COMMIT_MAX_WAIT_MS', self.max_wait * 1000) / 1000
+
+    def ensure_started(self):
+        """
+        Start the committing thread once per process
+        """
+        with self.started_lock:
+            if self.pid != os.getpid():
+                self.pid = os.getpid()
+                self.queue = Queue()
+                Thread(target=self.run, daemon=True).start()
+
+    def run_write(self, write):
+        """
+        Run the write and commit it, by the group commit if it is enabled
+
+        :param write: Gets the function without arguments changing the records without committing
+        :return: the write's result
+        """
+        if not self.enabled:
+            return self.commit_one(write)
+
+        self.ensure_started()
+        future = Future()
+        self.queue.put((write, future))
+        return future.result()
+
+    @staticmethod
+    def commit_one(write):
+        """
+        Run the write in its own transaction
+
+        :param write: Gets the function changing the records without committing
+        :return: the write's result
+        """
+        try:
+            result = write()
+            database.session.commit()
+        except WriteRollback as rollback:
+            database.session.rollback()
+            return rollback.result
+        except Exception:
+            database.session.rollback()
+            raise
+        return result
+
+    def next_batch(self):
+        """
+        Wait for a write and take the writes queued until the batch is full or the maximal wait is over
+
+        :return: list of tuples of the write and its future
+        :rtype: list
+        """
+        batch = [self.queue.get()]
+        deadline = monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self.queue.get(timeout=max(deadline - monotonic(), 0)))
+            except Empty:
+                break
+        return batch
+
+    def commit_batch(self, batch):
+        """
+        Run every write of the batch in its savepoint and commit them together
+
+        :param batch: Gets the list of tuples of the write and its future
+        """
+        results = []
+        started = perf_counter()
+        try:
+            if database.session.get_bind().dialect.driver == 'pysqlite':
+                # pysqlite begins the transaction only before a data change, so the first savepoint would
+                # begin it and its release would commit it
+                database.session.execute(text('BEGIN'))
+            for write, future in batch:
+                savepoint = database.session.begin_nested()
+                try:
+                    results.append((future, write(), None))
+                    savepoint.commit()
+                except WriteRollback as rollback:
+                    savepoint.rollback()
+                    results.append((future, rollback.result, None))
+                except Exception as error:  # noqa
+                    savepoint.rollback()
+                    results.append((future, None, error))
+            database.session.commit()
+        except Exception:  # noqa
+            database.session.rollback()
+            with self.lock:
+                self.counters['failed_batches'] += 1
+            # the writes are run again in their own transactions, so one write does not fail the others
+            for write, future in batch:
+                try:
+                    future.set_result(self.commit_one(write))
+                except Exception as error:  # noqa
+                    future.set_exception(error)
+            return
+        commit_ms = (perf_counter() - started) * 1000
+
+        with self.lock:
+            self.counters['batches'] += 1
+            self.counters['writes'] += len(batch)
+            self.counters['max_batch_size'] = max(self.counters['max_batch_size'], len(batch))
+            self.counters['commit_ms'] += commit_ms
+            self.counters['max_commit_ms'] = max(self.counters['max_commit_ms'], commit_ms)
+        for future, result, error in results:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    def run(self):
+        """
+        Commit the queued writes in batches
+        """
+        while True:
+            batch = self.next_batch()
+            with self.app.app_context():
+                self.commit_batch(batch)
+
+    def stats(self):
+        """
+        Return the batches counters of the worker: the number of batches and writes, the average and maximal
+        batch size and commit time in milliseconds
+        :rtype: dict
+        """
+        with self.lock:
+            counters = dict(self.counters)
+        batches = counters['batches'] or 1
+        counters['enabled'] = self.enabled
+        counters['avg_batch_size'] = round(counters['writes'] / batches, 2)
+        counters['avg_commit_ms'] = round(counters.pop('commit_ms') / batches, 3)
+        counters['max_commit_ms'] = round(counters['max_commit_ms'], 3)
+        return counters
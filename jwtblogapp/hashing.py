@@ -0,0 +1,187 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from threading import BoundedSemaphore, Lock
+from time import monotonic
+
+from passlib.hash import pbkdf2_sha512
+
+# upper bounds (seconds) of the hashing latency histogram buckets
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+
+class HashingBusy(Exception):
+    """
+    Raised when the hashing executor is saturated, the hashing timed out or its process died
+    """
+
+
+def hash_password(password):
+    """
+    Make a hash of native password by sha512 algorithm
+
+    :param password: Gets the native password
+    :rtype: str
+    """
+    return pbkdf2_sha512.hash(password)
+
+
+def verify_password(password, password_hash):
+    """
+    Check if the native password matches the hash
+
+    :param password: Gets the native password
+    :param password_hash: Gets the stored hash
+    :rtype: bool
+    """
+    return pbkdf2_sha512.verify(password, password_hash)
+
+
+class PasswordHasher:
+    """
+    Represents the password hashing executor. Runs hashing and verification in a process pool
+    so it does not block the request thread on CPU, with a bounded number of waiting tasks
+    and a timeout. When the executor is saturated HashingBusy is raised immediately.
+    When a pool process dies the pool is broken, so it is discarded and the next task starts a new one.
+    """
+
+    def __init__(self, app=None):
+        """
+        Initialize instance of class
+
+        :param app: Gets the Flask application object to take the configuration from
+        """
+        self.mode = 'process'
+        self.pool_size = 2
+        self.queue_size = 8
+        self.timeout = 5
+        self.executor = None
+        self.pid = None
+        self.lock = Lock()
+        self.slots = None
+        self.counters = {'tasks': 0, 'rejected': 0, 'timeouts': 0, 'broken_pools': 0, 'in_flight': 0,
+                         'max_in_flight': 0, 'latency_sum': 0.0, 'latency_max': 0.0}
+        self.latency_buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Take the executor parameters from the app config
+
+        :param app: Gets the Flask application object
+        """
+        self.mode = app.config.get('HASHING_EXECUTOR', self.mode)
+        self.pool_size = app.config.get('HASHING_POOL_SIZE', self.pool_size)
+        self.queue_size = app.config.get('HASHING_QUEUE_SIZE', self.queue_size)
+        self.timeout = app.config.get('HASHING_TIMEOUT', self.timeout)
+        self.slots = BoundedSemaphore(self.pool_size + self.queue_size)
+
+    def hash(self, password):
+        """
+        Make a hash of native password
+        :rtype: str
+        """
+        return self.run(hash_password, password)
+
+    def verify(self, password, password_hash):
+        """
+        Check if the native password matches the hash
+        :rtype: bool
+        """
+        return self.run(verify_password, password, password_hash)
+
+    def run(self, function, *args):
+        """
+        Run the hashing function in the executor and wait for the result
+
+        :param function: Gets the hashing function
+        :param args: Gets the function arguments
+        :return: the function result
+        :raises HashingBusy: if the executor is saturated, the result is not ready in time or the pool is broken
+        """
+        if self.mode == 'inline':
+            return self._measure(monotonic(), function(*args))
+
+        if self.slots is None:
+            self.slots = BoundedSemaphore(self.pool_size + self.queue_size)
+        if not self.slots.acquire(blocking=False):
+            with self.lock:
+                self.counters['rejected'] += 1
+            raise HashingBusy('Password hashing executor is saturated')
+
+        with self.lock:
+            self.counters['in_flight'] += 1
+            self.counters['max_in_flight'] = max(self.counters['max_in_flight'], self.counters['in_flight'])
+        started = monotonic()
+        executor = self._executor()
+        try:
+            future = executor.submit(function, *args)
+        except BrokenProcessPool:
+            self._release()
+            self._discard(executor)
+            raise HashingBusy('Password hashing process pool is broken')
+        except BaseException:
+            self._release()
+            raise
+        # the slot is released when the task is really done, even if the caller stopped waiting for it
+        future.add_done_callback(lambda _: self._release())
+        try:
+            return self._measure(started, future.result(timeout=self.timeout))
+        except FutureTimeoutError:
+            with self.lock:
+                self.counters['timeouts'] += 1
+            raise HashingBusy('Password hashing timed out')
+        except BrokenProcessPool:
+            self._discard(executor)
+            raise HashingBusy('Password hashing process pool is broken')
+
+    def stats(self):
+        """
+        Return the executor counters, i.e. the queue depth and the hashing latency histogram
+        :rtype: dict
+        """
+        with self.lock:
+            buckets = dict(zip([str(bucket) for bucket in LATENCY_BUCKETS] + ['+Inf'], self.latency_buckets))
+            return dict(self.counters, latency_buckets=buckets)
+
+    def shutdown(self):
+        """
+        Stop the process pool of the current process
+        """
+        if self.executor is not None and self.pid == os.getpid():
+            self.executor.shutdown(wait=False, cancel_futures=True)
+        self.executor = None
+
+    def _executor(self):
+        # the pool is created lazily in every worker, a pool inherited from the gunicorn master is not usable
+        with self.lock:
+            if self.executor is None or self.pid != os.getpid():
+                self.executor = ProcessPoolExecutor(max_workers=self.pool_size)
+                self.pid = os.getpid()
+            return self.executor
+
+    def _discard(self, executor):
+        # a pool with a dead process fails all its tasks, the next task creates a new pool
+        with self.lock:
+            if self.executor is not executor:
+                return
+            self.executor = None
+            self.counters['broken_pools'] += 1
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _release(self):
+        self.slots.release()
+        with self.lock:
+            self.counters['in_flight'] -= 1
+
+    def _measure(self, started, result):
+        latency = monotonic() - started
+        index = next((number for number, bucket in enumerate(LATENCY_BUCKETS) if latency <= bucket),
+                     len(LATENCY_BUCKETS))
+        with self.lock:
+            self.counters['tasks'] += 1
+            self.counters['latency_sum'] += latency
+            self.counters['latency_max'] = max(self.counters['latency_max'], latency)
+            self.latency_buckets[index] += 1
+        return result
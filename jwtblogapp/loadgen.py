@@ -0,0 +1,295 @@
+import argparse
+import json
+import random
+import uuid
+from bisect import bisect_left
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import accumulate
+from math import ceil
+from threading import Event, Lock
+from time import monotonic, sleep
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# request mix used when no mix is given: the share of every operation of a virtual user
+DEFAULT_MIX = {'feed': 70, 'rate': 25, 'post': 5}
+# upper bounds (milliseconds) of the latency histogram buckets
+LATENCY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+
+def parse_mix(mix):
+    """
+    Parse the request mix like 'feed=70,rate=25,post=5'
+
+    :param mix: Gets the request mix string
+    :return: dictionary of operation names and their weights
+    :rtype: dict
+    """
+    weights = {}
+    for item in mix.split(','):
+        name, _, weight = item.partition('=')
+        if name.strip() not in DEFAULT_MIX:
+            raise ValueError(f'Unknown operation {name.strip()!r}, expected one of {", ".join(DEFAULT_MIX)}')
+        weights[name.strip()] = float(weight)
+    return weights
+
+
+class ZipfChooser:
+    """
+    Represents the random choice of posts with Zipf distributed popularity: the post of rank k
+    (the newest post has rank 1) is chosen with probability proportional to 1 / k ** exponent.
+    """
+
+    def __init__(self, exponent=1.1):
+        """
+        Initialize instance of class
+
+        :param exponent: Gets the Zipf distribution exponent, 0 makes all posts equally popular
+        """
+        self.exponent = exponent
+        self.post_ids = []
+        self.cum_weights = []
+        self.lock = Lock()
+
+    def update(self, post_ids):
+        """
+        Replace the known posts ids ordered by rank
+        """
+        post_ids = list(post_ids)
+        cum_weights = list(accumulate(1 / rank ** self.exponent for rank in range(1, len(post_ids) + 1)))
+        with self.lock:
+            self.post_ids, self.cum_weights = post_ids, cum_weights
+
+    def choice(self, rng):
+        """
+        Return a random post id or None if no post is known
+
+        :param rng: Gets the random generator of the virtual user
+        """
+        with self.lock:
+            if not self.post_ids:
+                return None
+            point = rng.random() * self.cum_weights[-1]
+            return self.post_ids[min(bisect_left(self.cum_weights, point), len(self.post_ids) - 1)]
+
+
+class RateLimiter:
+    """
+    Represents the shared pacing of requests to the target rate of all virtual users
+    """
+
+    def __init__(self, rate):
+        """
+        Initialize instance of class
+
+        :param rate: Gets the target requests per second or None for no limit
+        """
+        self.interval = 1 / rate if rate else 0
+        self.next_time = monotonic()
+        self.lock = Lock()
+
+    def wait(self):
+        """
+        Block until the next request is allowed
+        """
+        if not self.interval:
+            return
+        with self.lock:
+            now = monotonic()
+            scheduled = max(self.next_time, now)
+            self.next_time = scheduled + self.interval
+        if scheduled > now:
+            sleep(scheduled - now)
+
+
+class LatencyRecorder:
+    """
+    Represents per endpoint request counters and latencies
+    """
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.lock = Lock()
+
+    def record(self, endpoint, latency, ok):
+        """
+        Record one request
+
+        :param endpoint: Gets the endpoint name
+        :param latency: Gets the request latency in seconds
+        :param ok: Gets True if the response status was successful
+        """
+        with self.lock:
+            self.latencies[endpoint].append(latency)
+            if not ok:
+                self.errors[endpoint] += 1
+
+    def report(self, elapsed):
+        """
+        Make the report with throughput, p50/p95/p99 latencies and latency histogram of every endpoint
+
+        :param elapsed: Gets the load duration in seconds
+        :rtype: dict
+        """
+        report = {}
+        with self.lock:
+            for endpoint, latencies in sorted(self.latencies.items()):
+                latencies = sorted(latency * 1000 for latency in latencies)
+                histogram = defaultdict(int)
+                for latency in latencies:
+                    bucket = next((str(bound) for bound in LATENCY_BUCKETS if latency <= bound), '+Inf')
+                    histogram[bucket] += 1
+                report[endpoint] = {
+                    'requests': len(latencies),
+                    'errors': self.errors[endpoint],
+                    'throughput_rps': round(len(latencies) / elapsed, 2) if elapsed else 0,
+                    'p50_ms': round(percentile(latencies, 50), 2),
+                    'p95_ms': round(percentile(latencies, 95), 2),
+                    'p99_ms': round(percentile(latencies, 99), 2),
+                    'histogram_ms': dict(histogram),
+                }
+        return report
+
+
+def percentile(sorted_values, percent):
+    """
+    Return the nearest rank percentile of sorted values
+    """
+    if not sorted_values:
+        return 0
+    rank = max(ceil(percent / 100 * len(sorted_values)), 1)
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class LoadGenerator:
+    """
+    Represents the load generator running virtual users concurrently in a thread pool.
+    Every virtual user signs up, logs in and sends the mix of feed, rating and post requests
+    through its own keep-alive connection until the duration is over.
+    """
+
+    def __init__(self, api_url, users=10, duration=30, rate=None, mix=None, zipf_exponent=1.1, page_size=20,
+                 seed=None):
+        """
+        Initialize instance of class
+
+        :param api_url: Gets the blog API base URL
+        :param users: Gets the number of concurrent virtual users
+        :param duration: Gets the load duration in seconds
+        :param rate: Gets the target requests per second of all users or None for no limit
+        :param mix: Gets the dictionary of operation names ('feed', 'rate', 'post') and their weights
+        :param zipf_exponent: Gets the exponent of the posts popularity distribution
+        :param page_size: Gets the feed page size
+        :param seed: Gets the random seed
+        """
+        self.api_url = api_url.rstrip('/')
+        self.users = users
+        self.duration = duration
+        self.mix = mix or DEFAULT_MIX
+        self.page_size = page_size
+        self.seed = seed
+        self.rate_limiter = RateLimiter(rate)
+        self.posts = ZipfChooser(zipf_exponent)
+        self.recorder = LatencyRecorder()
+        self.stopped = Event()
+
+    def request(self, session, endpoint, method, path, **kwargs):
+        """
+        Send one paced and measured request
+
+        :return: response object or None if the request failed
+        """
+        self.rate_limiter.wait()
+        started = monotonic()
+        try:
+            response = session.request(method, f'{self.api_url}{path}', timeout=30, **kwargs)
+        except requests.RequestException:
+            self.recorder.record(endpoint, monotonic() - started, False)
+            return None
+        self.recorder.record(endpoint, monotonic() - started, response.status_code < 400)
+        return response
+
+    def virtual_user(self, number):
+        """
+        Run one virtual user until the load is stopped
+
+        :param number: Gets the virtual user number
+        """
+        rng = random.Random(None if self.seed is None else self.seed + number)
+        operations, weights = list(self.mix), list(self.mix.values())
+        session = requests.Session()
+        session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=1))
+        session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=1))
+        credentials = {'username': f'load-{uuid.uuid4().hex[:12]}@example.com', 'password': uuid.uuid4().hex}
+        try:
+            self.request(session, 'signup', 'POST', '/api/signup', json=credentials)
+            response = self.request(session, 'login', 'POST', '/api/login', json=credentials)
+            if response is None or response.status_code != 200:
+                return
+            session.headers['Authorization'] = f'Bearer {response.json()["token"]}'
+
+            while not self.stopped.is_set():
+                operation = rng.choices(operations, weights)[0]
+                post_id = self.posts.choice(rng)
+                if operation == 'post' or (operation == 'rate' and post_id is None):
+                    self.request(session, 'post', 'POST', '/api/posts',
+                                 json={'post_text': f'Load test post {uuid.uuid4().hex}'})
+                elif operation == 'rate':
+                    self.request(session, 'rate', 'POST', '/api/rating',
+                                 json={'post_id': post_id, 'like': rng.choice((0, 1))})
+                else:
+                    response = self.request(session, 'feed', 'GET', f'/api/posts?limit={self.page_size}')
+                    if response is not None and response.status_code == 200:
+                        self.posts.update(post['post_id'] for post in response.json()['posts'])
+
+            self.request(session, 'logout', 'POST', '/api/logout')
+        finally:
+            session.close()
+
+    def run(self):
+        """
+        Run the virtual users for the duration and return the report
+
+        :return: dictionary with the load parameters and the per endpoint report
+        :rtype: dict
+        """
+        self.stopped.clear()
+        started = monotonic()
+        with ThreadPoolExecutor(max_workers=self.users) as executor:
+            futures = [executor.submit(self.virtual_user, number) for number in range(self.users)]
+            self.stopped.wait(self.duration)
+            self.stopped.set()
+            for future in futures:
+                future.result()
+        elapsed = monotonic() - started
+
+        return {'users': self.users, 'duration_s': round(elapsed, 2), 'mix': self.mix,
+                'endpoints': self.recorder.report(elapsed)}
+
+
+def main(argv=None):
+    """
+    Command line entry point: python -m jwtblogapp.loadgen --url http://127.0.0.1:8080
+    """
+    parser = argparse.ArgumentParser(description='Blog API load generator')
+    parser.add_argument('--url', default='http://127.0.0.1:8080', help='Blog API base URL')
+    parser.add_argument('--users', type=int, default=10, help='Number of concurrent virtual users')
+    parser.add_argument('--duration', type=float, default=30, help='Load duration in seconds')
+    parser.add_argument('--rate', type=float, default=None, help='Target requests per second of all users')
+    parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX, help='Request mix like feed=70,rate=25,post=5')
+    parser.add_argument('--zipf', type=float, default=1.1, help='Exponent of the posts popularity distribution')
+    parser.add_argument('--page-size', type=int, default=20, help='Feed page size')
+    parser.add_argument('--seed', type=int, default=None, help='Random seed')
+    arguments = parser.parse_args(argv)
+
+    load_generator = LoadGenerator(arguments.url, users=arguments.users, duration=arguments.duration,
+                                   rate=arguments.rate, mix=arguments.mix, zipf_exponent=arguments.zipf,
+                                   page_size=arguments.page_size, seed=arguments.seed)
+    print(json.dumps(load_generator.run(), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,236 @@
+import atexit
+import json
+import os
+from collections import defaultdict
+from threading import Lock
+from time import monotonic, perf_counter
+
+from flask import Response, g, has_request_context, request
+from jwtblogapp import database
+from jwtblogapp.querylog import listen_statements
+
+# upper bounds (seconds) of the request wall time and database time histogram buckets
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# upper bounds of the SQL statements per request histogram buckets
+QUERIES_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# histogram names, descriptions and buckets
+HISTOGRAMS = {
+    'jwtblogapp_http_request_duration_seconds': ('Request wall time by endpoint', DURATION_BUCKETS),
+    'jwtblogapp_http_request_db_seconds': ('Time spent executing SQL statements per request by endpoint',
+                                           DURATION_BUCKETS),
+    'jwtblogapp_http_request_queries': ('Number of SQL statements per request by endpoint', QUERIES_BUCKETS),
+}
+REQUESTS_COUNTER = 'jwtblogapp_http_requests_total'
+
+
+def new_histogram(buckets):
+    return {'buckets': [0] * len(buckets), 'sum': 0.0, 'count': 0}
+
+
+def observe(histogram, buckets, value):
+    for index, bound in enumerate(buckets):
+        if value <= bound:
+            histogram['buckets'][index] += 1
+    histogram['sum'] += value
+    histogram['count'] += 1
+
+
+def merge(total, snapshot):
+    """
+    Add the metrics snapshot of one process to the total
+    """
+    for key, value in snapshot['requests'].items():
+        total['requests'][key] = total['requests'].get(key, 0) + value
+    for name, histograms in snapshot['histograms'].items():
+        for endpoint, histogram in histograms.items():
+            merged = total['histograms'].setdefault(name, {}).setdefault(
+                endpoint, new_histogram(HISTOGRAMS[name][1]))
+            merged['buckets'] = [left + right for left, right in zip(merged['buckets'], histogram['buckets'])]
+            merged['sum'] += histogram['sum']
+            merged['count'] += histogram['count']
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render(metrics):
+    """
+    Render the metrics in the Prometheus text exposition format
+    :rtype: str
+    """
+    lines = [f'# HELP {REQUESTS_COUNTER} Number of requests by endpoint, method and status',
+             f'# TYPE {REQUESTS_COUNTER} counter']
+    for key, value in sorted(metrics['requests'].items()):
+        endpoint, method, status = key.split('|')
+        lines.append(f'{REQUESTS_COUNTER}{{endpoint="{escape(endpoint)}",method="{method}",status="{status}"}} '
+                     f'{value}')
+    for name, (description, buckets) in HISTOGRAMS.items():
+        lines += [f'# HELP {name} {description}', f'# TYPE {name} histogram']
+        for endpoint, histogram in sorted(metrics['histograms'].get(name, {}).items()):
+            label = f'endpoint="{escape(endpoint)}"'
+            for bound, count in zip(buckets, histogram['buckets']):
+                lines.append(f'{name}_bucket{{{label},le="{bound}"}} {count}')
+            lines.append(f'{name}_bucket{{{label},le="+Inf"}} {histogram["count"]}')
+            lines.append(f'{name}_sum{{{label}}} {round(histogram["sum"], 6)}')
+            lines.append(f'{name}_count{{{label}}} {histogram["count"]}')
+
+    return '\n'.join(lines) + '\n'
+
+
+class RequestMetrics:
+    """
+    Represents the per request instrumentation: wall time from the Flask request hooks, database time and
+    number of SQL statements from the SQLAlchemy engine events, aggregated by endpoint into histograms.
+    Each gunicorn worker keeps its own metrics and, if the metrics directory is configured, periodically
+    writes them to its own file there, so the '/metrics' endpoint served by any worker sums all of them.
+    """
+
+    def __init__(self, app=None):
+        """
+        Initialize instance of class
+
+        :param app: Gets the Flask application object to take the configuration from
+        """
+        self.enabled = True
+        self.directory = ''
+        self.flush_interval = 1
+        self.last_flush = 0
+        self.lock = Lock()
+        self.reset()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Take the parameters from the app config, register the request hooks and the engine events
+
+        :param app: Gets the Flask application object
+        """
+        self.enabled = app.config.get('METRICS_ENABLED', self.enabled)
+        self.directory = app.config.get('METRICS_DIR', self.directory)
+        self.flush_interval = app.config.get('METRICS_FLUSH_INTERVAL', self.flush_interval)
+        if not self.enabled:
+            return
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            atexit.register(self.flush)
+
+        app.before_request(self.start_request)
+        app.after_request(self.finish_request)
+        app.teardown_request(self.teardown_request)
+        with app.app_context():
+            listen_statements(database.engine, self.record_statement)
+
+    def reset(self):
+        """
+        Forget the metrics of the process
+        """
+        with self.lock:
+            self.requests = defaultdict(int)
+            self.histograms = {name: {} for name in HISTOGRAMS}
+
+    @staticmethod
+    def start_request():
+        g.metrics_started = perf_counter()
+        g.metrics_db_time = 0.0
+        g.metrics_queries = 0
+
+    def finish_request(self, response):
+        self.record(response.status_code)
+        return response
+
+    def teardown_request(self, error=None):
+        # the response of an unhandled exception does not pass the after request hooks
+        if error is not None and not g.get('metrics_recorded'):
+            self.record(500)
+
+    @staticmethod
+    def record_statement(statement, duration):  # noqa
+        if has_request_context() and 'metrics_started' in g:
+            g.metrics_db_time += duration
+            g.metrics_queries += 1
+
+    def record(self, status):
+        """
+        Record the current request
+
+        :param status: Gets the response status code
+        """
+        if 'metrics_started' not in g:
+            return
+        g.metrics_recorded = True
+        endpoint = request.endpoint or 'unmatched'
+        values = {'jwtblogapp_http_request_duration_seconds': perf_counter() - g.metrics_started,
+                  'jwtblogapp_http_request_db_seconds': g.metrics_db_time,
+                  'jwtblogapp_http_request_queries': g.metrics_queries}
+        with self.lock:
+            self.requests[f'{endpoint}|{request.method}|{status}'] += 1
+            for name, value in values.items():
+                buckets = HISTOGRAMS[name][1]
+                observe(self.histograms[name].setdefault(endpoint, new_histogram(buckets)), buckets, value)
+        if self.directory and monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def snapshot(self):
+        """
+        Return the metrics of the process
+        :rtype: dict
+        """
+        with self.lock:
+            return json.loads(json.dumps({'requests': self.requests, 'histograms': self.histograms}))
+
+    def path(self, pid=None):
+        return os.path.join(self.directory, f'metrics_{pid or os.getpid()}.json')
+
+    def flush(self):
+        """
+        Write the metrics of the process to its file in the metrics directory
+        """
+        if not self.directory:
+            return
+        self.last_flush = monotonic()
+        path = self.path()
+        # the file is replaced atomically, so other workers never read a partly written one
+        with open(f'{path}.tmp', 'w') as metrics_file:
+            json.dump(self.snapshot(), metrics_file)
+        os.replace(f'{path}.tmp', path)
+
+    def collect(self):
+        """
+        Sum the metrics of all processes: the current process's ones from memory and the others from their files.
+        Files of exited workers are kept, so the counters never go down while the app is running.
+        :rtype: dict
+        """
+        total = {'requests': {}, 'histograms': {}}
+        merge(total, self.snapshot())
+        if self.directory:
+            own_file = os.path.basename(self.path())
+            for file_name in os.listdir(self.directory):
+                if not file_name.endswith('.json') or file_name == own_file:
+                    continue
+                try:
+                    with open(os.path.join(self.directory, file_name)) as metrics_file:
+                        merge(total, json.load(metrics_file))
+                except (OSError, ValueError):
+                    continue
+
+        return total
+
+    def export(self):
+        """
+        View function of the '/metrics' endpoint
+        :returns: response with the metrics of all workers in the Prometheus text format
+        """
+        return Response(render(self.collect()), mimetype='text/plain; version=0.0.4')
+
+
+def clear_directory(directory):
+    """
+    Delete the metrics files of the previous run, call it once in the gunicorn master before workers start
+    """
+    if directory and os.path.isdir(directory):
+        for file_name in os.listdir(directory):
+            if file_name.startswith('metrics_'):
+                os.remove(os.path.join(directory, file_name))
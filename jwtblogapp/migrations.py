@@ -0,0 +1,286 @@
+from collections import namedtuple
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, Table, inspect, select, text, update
+
+from jwtblogapp import database
+from jwtblogapp.models import User, RevokedToken, Post, Rating, FeedVersion, FeedEvent, PostCounterDelta
+
+# The versioned schema migrations of the live databases. 'database.create_all()' creates missing tables only,
+# the migrations change the existing ones. Every step checks the current schema first, so it may be applied
+# to a database created by 'create_all()' with the up to date models as well.
+Migration = namedtuple('Migration', ['version', 'description', 'upgrade', 'downgrade'])
+
+# The table keeps the applied schema version, it is not a part of the models metadata
+schema_version = Table('schema_version', MetaData(), Column('version', Integer, nullable=False))
+
+# The legacy ratings table, one record per like or dislike
+legacy_ratings = Table('ratings', MetaData(),
+                       Column('id', Integer, primary_key=True),
+                       Column('user_id', Integer),
+                       Column('post_like_id', Integer),
+                       Column('post_dislike_id', Integer),
+                       Column('created_time', DateTime))
+
+# Statements moving the ratings from the legacy 'ratings' table (one record per like or dislike with
+# post_like_id/post_dislike_id columns) to the 'post_ratings' table and recounting the posts likes and dislikes.
+# Every statement skips already moved ratings.
+LEGACY_RATINGS_UPGRADE = (
+    '''
+    INSERT INTO post_ratings (user_id, post_id, value, created_time)
+    SELECT ratings.user_id, ratings.post_like_id, 1, MIN(ratings.created_time) FROM ratings
+    WHERE ratings.post_like_id IS NOT NULL AND NOT EXISTS (
+        SELECT 1 FROM post_ratings
+        WHERE post_ratings.user_id = ratings.user_id AND post_ratings.post_id = ratings.post_like_id)
+    GROUP BY ratings.user_id, ratings.post_like_id
+    ''',
+    '''
+    INSERT INTO post_ratings (user_id, post_id, value, created_time)
+    SELECT ratings.user_id, ratings.post_dislike_id, -1, MIN(ratings.created_time) FROM ratings
+    WHERE ratings.post_dislike_id IS NOT NULL AND NOT EXISTS (
+        SELECT 1 FROM post_ratings
+        WHERE post_ratings.user_id = ratings.user_id AND post_ratings.post_id = ratings.post_dislike_id)
+    GROUP BY ratings.user_id, ratings.post_dislike_id
+    ''',
+    '''
+    UPDATE posts SET
+    likes = (SELECT COUNT(*) FROM post_ratings WHERE post_ratings.post_id = posts.id AND post_ratings.value = 1),
+    dislikes = (SELECT COUNT(*) FROM post_ratings WHERE post_ratings.post_id = posts.id AND post_ratings.value = -1)
+    ''',
+)
+
+# Statement moving the ratings back to the legacy 'ratings' table
+LEGACY_RATINGS_DOWNGRADE = '''
+    INSERT INTO ratings (user_id, post_like_id, post_dislike_id, created_time)
+    SELECT user_id, CASE WHEN value = 1 THEN post_id END, CASE WHEN value = -1 THEN post_id END, created_time
+    FROM post_ratings WHERE value != 0
+    '''
+
+
+def has_column(connection, table_name, column_name):
+    return column_name in [column['name'] for column in inspect(connection).get_columns(table_name)]
+
+
+def has_index(connection, table_name, index_name):
+    return index_name in [index['name'] for index in inspect(connection).get_indexes(table_name)]
+
+
+def model_index(model, index_name):
+    return next(index for index in model.__table__.indexes if index.name == index_name)
+
+
+def create_indexes(connection, indexes):
+    for model, index_name in indexes:
+        model_index(model, index_name).create(connection, checkfirst=True)
+
+
+def drop_indexes(connection, indexes):
+    for model, index_name in indexes:
+        if has_index(connection, model.__tablename__, index_name):
+            model_index(model, index_name).drop(connection)
+
+
+def upgrade_ratings(connection):
+    Rating.__table__.create(connection, checkfirst=True)
+    if inspect(connection).has_table('ratings'):
+        for statement in LEGACY_RATINGS_UPGRADE:
+            connection.execute(text(statement))
+        connection.execute(text('DROP TABLE ratings'))
+
+
+def downgrade_ratings(connection):
+    if not inspect(connection).has_table('ratings'):
+        legacy_ratings.create(connection)
+        connection.execute(text(LEGACY_RATINGS_DOWNGRADE))
+    Rating.__table__.drop(connection, checkfirst=True)
+
+
+def upgrade_token_expiry(connection):
+    if not has_column(connection, 'revoked_tokens', 'expires_time'):
+        connection.execute(text('ALTER TABLE revoked_tokens ADD COLUMN expires_time DATETIME'))
+    create_indexes(connection, [(RevokedToken, 'ix_revoked_tokens_expires_time')])
+
+
+def downgrade_token_expiry(connection):
+    drop_indexes(connection, [(RevokedToken, 'ix_revoked_tokens_expires_time')])
+    if has_column(connection, 'revoked_tokens', 'expires_time'):
+        connection.execute(text('ALTER TABLE revoked_tokens DROP COLUMN expires_time'))
+
+
+CHANGE_VERSION_INDEXES = [
+    (Post, 'ix_posts_change_version'),
+    (Rating, 'ix_post_ratings_user_change_version'),
+]
+
+
+def upgrade_change_versions(connection):
+    for table_name in ('posts', 'post_ratings'):
+        if not has_column(connection, table_name, 'change_version'):
+            connection.execute(text(f'ALTER TABLE {table_name} ADD COLUMN change_version INTEGER'))
+    create_indexes(connection, CHANGE_VERSION_INDEXES)
+    backfill_change_versions(connection)
+
+
+def backfill_change_versions(connection):
+    # the records written before the change versions are stamped with one new version, so 'since=0' returns them
+    stale = [model for model in (Post, Rating) if connection.execute(
+        select(model.id).where(model.change_version.is_(None)).limit(1)).first() is not None]
+    if not stale:
+        return
+    upgrade_feed_version_record(connection)
+    connection.execute(update(FeedVersion).where(FeedVersion.id == 1).values(version=FeedVersion.version + 1))
+    for model in stale:
+        connection.execute(update(model).where(model.change_version.is_(None)).values(
+            change_version=FeedVersion.version_subquery()))
+
+
+def downgrade_change_versions(connection):
+    drop_indexes(connection, CHANGE_VERSION_INDEXES)
+    for table_name in ('posts', 'post_ratings'):
+        if has_column(connection, table_name, 'change_version'):
+            connection.execute(text(f'ALTER TABLE {table_name} DROP COLUMN change_version'))
+
+
+def upgrade_feed_version_record(connection):
+    # the databases migrated before the record was inserted with the table get it now
+    if connection.execute(select(FeedVersion.id).where(FeedVersion.id == 1)).first() is None:
+        connection.execute(FeedVersion.__table__.insert().values(id=1, version=0))
+
+
+HOT_INDEXES = [
+    (RevokedToken, 'ix_revoked_tokens_jti'),
+    (Post, 'ix_posts_created_time'),
+    (Rating, 'ix_post_ratings_post_id'),
+]
+
+MIGRATIONS = [
+    Migration(1, 'Move ratings to the post_ratings table', upgrade_ratings, downgrade_ratings),
+    Migration(2, 'Add revoked tokens expiry time', upgrade_token_expiry, downgrade_token_expiry),
+    Migration(3, 'Add indexes of the hot queries',
+              lambda connection: create_indexes(connection, HOT_INDEXES),
+              lambda connection: drop_indexes(connection, HOT_INDEXES)),
+    Migration(4, 'Add the feed version table',
+              lambda connection: FeedVersion.__table__.create(connection, checkfirst=True),
+              lambda connection: FeedVersion.__table__.drop(connection, checkfirst=True)),
+    Migration(5, 'Add the feed events table',
+              lambda connection: FeedEvent.__table__.create(connection, checkfirst=True),
+              lambda connection: FeedEvent.__table__.drop(connection, checkfirst=True)),
+    Migration(6, 'Add the change versions of posts and ratings', upgrade_change_versions, downgrade_change_versions),
+    Migration(7, 'Add the pending posts counts changes table',
+              lambda connection: PostCounterDelta.__table__.create(connection, checkfirst=True),
+              lambda connection: PostCounterDelta.__table__.drop(connection, checkfirst=True)),
+    # the record is kept by the downgrade, the writes of the older versions update it as well
+    Migration(8, 'Insert the feed version record', upgrade_feed_version_record, lambda connection: None),
+    # the databases migrated to the change versions before the backfill was a part of it
+    Migration(9, 'Backfill the change versions of posts and ratings', backfill_change_versions,
+              lambda connection: None),
+]
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+
+def current_version(connection):
+    """
+    Return the applied schema version, 0 if the database has never been migrated
+
+    :param connection: Gets the database connection
+    :rtype: int
+    """
+    if not inspect(connection).has_table(schema_version.name):
+        return 0
+    return connection.execute(select(schema_version.c.version)).scalar() or 0
+
+
+def set_version(connection, version):
+    schema_version.create(connection, checkfirst=True)
+    connection.execute(schema_version.delete())
+    connection.execute(schema_version.insert().values(version=version))
+
+
+def upgrade(target=None, echo=print):
+    """
+    Apply the migrations newer than the current schema version up to the target version,
+    each one in its own transaction
+
+    :param target: Gets the target version, the latest one by default
+    :param echo: Gets the function printing the progress
+    :return: the schema version after upgrade
+    :rtype: int
+    """
+    target = LATEST_VERSION if target is None else target
+    with database.engine.connect() as connection:
+        version = current_version(connection)
+    for migration in MIGRATIONS:
+        if version < migration.version <= target:
+            with database.engine.begin() as connection:
+                migration.upgrade(connection)
+                set_version(connection, migration.version)
+            version = migration.version
+            echo(f'Upgraded to {migration.version}: {migration.description}')
+
+    return version
+
+
+def downgrade(target, echo=print):
+    """
+    Revert the applied migrations newer than the target version, the newest first
+
+    :param target: Gets the target version
+    :param echo: Gets the function printing the progress
+    :return: the schema version after downgrade
+    :rtype: int
+    """
+    with database.engine.connect() as connection:
+        version = current_version(connection)
+    for migration in reversed(MIGRATIONS):
+        if target < migration.version <= version:
+            with database.engine.begin() as connection:
+                migration.downgrade(connection)
+                set_version(connection, migration.version - 1)
+            version = migration.version - 1
+            echo(f'Downgraded from {migration.version}: {migration.description}')
+
+    return version
+
+
+def hot_queries():
+    """
+    Return the statements of the app's hot queries with sample parameters
+    :return: list of tuples with the query name and statement
+    :rtype: list
+    """
+    return [
+        ('feed page', select(Post).where(Post.id < 1000).order_by(Post.id.desc()).limit(21)),
+        ('feed page likes', select(Rating.post_id, Rating.value).where(
+            Rating.user_id == 1, Rating.value != 0, Rating.post_id.in_([1, 2, 3]))),
+        ('rating lock', select(Rating.value).where(Rating.user_id == 1, Rating.post_id == 1)),
+        ('posts by created time', select(Post.id).order_by(Post.created_time.desc()).limit(20)),
+        ('ratings of post', select(Rating.value).where(Rating.post_id == 1)),
+        ('revoked token by jti', select(RevokedToken.id).where(RevokedToken.jti == 'jti')),
+        ('revoked tokens refresh', select(RevokedToken.id, RevokedToken.jti).where(
+            RevokedToken.id > 1000).order_by(RevokedToken.id)),
+        ('expired revoked tokens', select(RevokedToken.id).where(
+            RevokedToken.expires_time < '2000-01-01').order_by(RevokedToken.expires_time).limit(1000)),
+        ('user by username', select(User.id).where(User.username == 'username')),
+        ('posts changes', select(Post).where(Post.change_version > 1000, Post.change_version <= 2000).order_by(
+            Post.change_version).limit(501)),
+        ('user ratings changes', select(Rating.post_id, Rating.value).where(
+            Rating.user_id == 1, Rating.change_version > 1000, Rating.change_version <= 2000)),
+    ]
+
+
+def explain_hot_queries():
+    """
+    Return the query plans of the app's hot queries
+    :return: list of tuples with the query name, SQL and the plan rows
+    :rtype: list
+    """
+    dialect = database.engine.dialect
+    prefix = 'EXPLAIN QUERY PLAN ' if dialect.name == 'sqlite' else 'EXPLAIN '
+    plans = []
+    with database.engine.connect() as connection:
+        for name, statement in hot_queries():
+            sql = str(statement.compile(dialect=dialect, compile_kwargs={'literal_binds': True}))
+            rows = connection.execute(text(prefix + sql)).all()
+            plans.append((name, sql, [tuple(row) for row in rows]))
+
+    return plans
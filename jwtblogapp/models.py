@@ -1,5 +1,8 @@
-from jwtblogapp import database
-from passlib.hash import pbkdf2_sha512
+import json
+from datetime import datetime
+from sqlalchemy import bindparam, event, insert as sql_insert, select as sql_select, update as sql_update
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from jwtblogapp import database, password_hasher
 
 
 class User(database.Model):
@@ -21,16 +24,16 @@ class User(database.Model):
 
     def make_hash(self):
         """
-        Make a hash of native password by sha512 algorithm
+        Make a hash of native password by sha512 algorithm in the hashing executor
         """
-        self.password = pbkdf2_sha512.hash(self.password)
+        self.password = password_hasher.hash(self.password)
 
     def ensure_password(self, password):
         """
-        Takes password and checks if it matches the hash
+        Takes password and checks if it matches the hash in the hashing executor
         :rtype: bool
         """
-        return pbkdf2_sha512.verify(password, self.password)
+        return password_hasher.verify(password, self.password)
 
     def __repr__(self):
         return f'{self.username}'
@@ -42,7 +45,8 @@ class RevokedToken(database.Model):
 
     # Description of a record in database
     id = database.Column(database.Integer, primary_key=True)
-    jti = database.Column(database.String(128))  # column for JW token identifier
+    jti = database.Column(database.String(128), index=True)  # column for JW token identifier
+    expires_time = database.Column(database.DateTime, index=True)  # column for token expiry time (UTC)
 
     def store(self):
         """
@@ -51,6 +55,32 @@ class RevokedToken(database.Model):
         database.session.add(self)
         database.session.commit()
 
+    @staticmethod
+    def prune_expired(before, batch_size=1000):
+        """
+        Delete records of tokens expired before the given time in batches, committing each batch
+        so a long pruning never holds locks on the whole table.
+        Records without expiry time (stored before it was saved) are kept.
+
+        :param before: Gets the UTC datetime, tokens expired before it are deleted
+        :param batch_size: Gets the maximal number of records deleted in one transaction
+        :return: number of deleted records
+        :rtype: int
+        """
+        deleted = 0
+        while True:
+            ids = [token_id for token_id, in database.session.query(RevokedToken.id).filter(
+                RevokedToken.expires_time < before).order_by(RevokedToken.expires_time).limit(batch_size)]
+            if not ids:
+                break
+            database.session.query(RevokedToken).filter(RevokedToken.id.in_(ids)).delete(synchronize_session=False)
+            database.session.commit()
+            deleted += len(ids)
+            if len(ids) < batch_size:
+                break
+
+        return deleted
+
 
 class Post(database.Model):
     # The table with posts in database
@@ -62,7 +92,9 @@ class Post(database.Model):
     text = database.Column(database.UnicodeText)  # column for post text
     likes = database.Column(database.Integer)  # column for post likes count
     dislikes = database.Column(database.Integer)  # column for post dislikes count
-    created_time = database.Column(database.DateTime)
+    created_time = database.Column(database.DateTime, index=True)
+    # the feed version of the post's creation or of the last change of its counts
+    change_version = database.Column(database.Integer, index=True)
 
     def store(self):
         """
@@ -78,16 +110,179 @@ class Post(database.Model):
         """
         database.session.commit()
 
+    @staticmethod
+    def add_counts(post_id, likes_delta, dislikes_delta, session=None):
+        """
+        Change the post's likes and dislikes counts by delta with one statement and stamp it
+        with the feed version, so the caller bumps the version first. The statement returns the changed counts
+        where the database supports UPDATE ... RETURNING, otherwise they are read by one more query.
+        Does not commit, so it is a part of the caller's transaction.
+
+        :param post_id: Gets the post id
+        :param likes_delta: Gets the change of likes count
+        :param dislikes_delta: Gets the change of dislikes count
+        :param session: Gets the session of the transaction, the Flask-SQLAlchemy session by default
+        :return: tuple of the post's likes and dislikes counts or None if there is no such post
+        :rtype: tuple
+        """
+        session = database.session if session is None else session
+        statement = sql_update(Post).where(Post.id == post_id).values(
+            likes=Post.likes + likes_delta, dislikes=Post.dislikes + dislikes_delta,
+            change_version=FeedVersion.version_subquery())
+        if session.get_bind().dialect.update_returning:
+            counts = session.execute(statement.returning(Post.likes, Post.dislikes)).one_or_none()
+            return tuple(counts) if counts is not None else None
+        if not session.execute(statement).rowcount:
+            return None
+        return tuple(session.query(Post.likes, Post.dislikes).filter(Post.id == post_id).one())
+
+    @staticmethod
+    def add_counts_batch(deltas):
+        """
+        Change the likes and dislikes counts of many posts by their deltas with one executemany statement and stamp
+        them with the feed version, so the caller bumps the version first.
+        Does not commit, so it is a part of the caller's transaction.
+
+        :param deltas: Gets the dictionary where key is post id and value is tuple of likes and dislikes deltas
+        """
+        if not deltas:
+            return
+        posts = Post.__table__
+        database.session.execute(
+            sql_update(posts).where(posts.c.id == bindparam('delta_post_id')).values(
+                likes=posts.c.likes + bindparam('delta_likes'), dislikes=posts.c.dislikes + bindparam('delta_dislikes'),
+                change_version=FeedVersion.version_subquery()),
+            [{'delta_post_id': post_id, 'delta_likes': likes, 'delta_dislikes': dislikes}
+             for post_id, (likes, dislikes) in deltas.items()])
+
+    def as_dict(self):
+        """
+        Make a dictionary of the post's public fields, i.e. without the current user's rating
+        :rtype: dict
+        """
+        return {'post_id': self.id, 'user_id': self.user_id, 'username': self.username, 'post_text': self.text,
+                'likes': self.likes, 'dislikes': self.dislikes,
+                'created_time': self.created_time.strftime("%d-%m-%Y %H:%M:%S")}
+
+
+class FeedVersion(database.Model):
+    # The table with the only record keeping the posts feed version, bumped by every post or rating write.
+    # The record is inserted with the table (or by the schema migration), the writes only update it.
+    # Every write transaction holds its lock until the commit, so the post and rating writes of all workers
+    # are serialized on it. It is the cost of the gap-free version order the ETags and the changes endpoint
+    # rely on: a reader of version n sees every write up to n. The group commit shares the lock between
+    # the writes of a batch and the write-behind counters mode takes it once per flush instead of per rating.
+    __tablename__ = 'feed_version'
+
+    id = database.Column(database.Integer, primary_key=True)
+    version = database.Column(database.Integer, nullable=False, default=0)
+
+    @staticmethod
+    def bump(session=None):
+        """
+        Increment the feed version. Does not commit, so it is a part of the caller's write transaction.
+        The version record stays locked until the commit, so the versions of the writes are committed in order.
+
+        :param session: Gets the session of the transaction, the Flask-SQLAlchemy session by default
+        :raises RuntimeError: if the version record is missing, i.e. the schema is not migrated
+        """
+        session = database.session if session is None else session
+        result = session.execute(sql_update(FeedVersion).where(FeedVersion.id == 1).values(
+            version=FeedVersion.version + 1))
+        if not result.rowcount:
+            raise RuntimeError('The feed version record is missing, run "flask init-db"')
+
+    @staticmethod
+    def version_subquery():
+        """
+        Make the scalar subquery of the feed version to stamp the changed records with it in their statements
+        """
+        return sql_select(FeedVersion.version).where(FeedVersion.id == 1).scalar_subquery()
+
+    @staticmethod
+    def current():
+        """
+        Return the current feed version
+        :rtype: int
+        """
+        return database.session.query(FeedVersion.version).filter(FeedVersion.id == 1).scalar() or 0
+
+
+@event.listens_for(FeedVersion.__table__, 'after_create')
+def insert_feed_version(table, connection, **kwargs):
+    """
+    Insert the only feed version record into the created table, so the writes never race to insert it
+    """
+    connection.execute(table.insert().values(id=1, version=0))
+
+
+class FeedEvent(database.Model):
+    # The bounded log of posts feed events, the id is the event id the streaming clients resume from
+    __tablename__ = 'feed_events'
+
+    id = database.Column(database.Integer, primary_key=True)
+    event_type = database.Column(database.String(32), nullable=False)  # 'post_created' or 'rating_changed'
+    data = database.Column(database.UnicodeText, nullable=False)  # column for the JSON event payload
+    created_time = database.Column(database.DateTime)
+
+    @staticmethod
+    def record(event_type, data):
+        """
+        Add the event to the log. Does not commit, so it is a part of the caller's write transaction
+        and the event is visible to the other workers only with the write.
+
+        :param event_type: Gets the event type
+        :param data: Gets the JSON serializable event payload
+        :return: the event record
+        :rtype: FeedEvent
+        """
+        event = FeedEvent(event_type=event_type, data=json.dumps(data), created_time=datetime.utcnow())
+        database.session.add(event)
+        return event
+
+    @staticmethod
+    def after(event_id, limit):
+        """
+        Return the events with id above the given one, oldest first
+
+        :param event_id: Gets the id of the last event the caller has
+        :param limit: Gets the maximal number of events
+        :return: list of dictionaries with 'id', 'event' and 'data' keys
+        :rtype: list
+        """
+        rows = database.session.query(FeedEvent.id, FeedEvent.event_type, FeedEvent.data).filter(
+            FeedEvent.id > event_id).order_by(FeedEvent.id).limit(limit)
+        return [{'id': row.id, 'event': row.event_type, 'data': row.data} for row in rows]
+
+    @staticmethod
+    def prune(keep):
+        """
+        Delete all events but the newest ones and commit
+
+        :param keep: Gets the number of the newest events to keep
+        :return: number of deleted records
+        :rtype: int
+        """
+        last_id = database.session.query(database.func.max(FeedEvent.id)).scalar() or 0
+        deleted = database.session.query(FeedEvent).filter(FeedEvent.id <= last_id - keep).delete(
+            synchronize_session=False)
+        database.session.commit()
+        return deleted
+
 
 class Rating(database.Model):
-    # The table with ratings in database
-    __tablename__ = 'ratings'
+    # The table with ratings in database, one record per user and post
+    __tablename__ = 'post_ratings'
+    __table_args__ = (database.UniqueConstraint('user_id', 'post_id', name='uq_post_ratings_user_post'),
+                      database.Index('ix_post_ratings_user_change_version', 'user_id', 'change_version'))
 
     id = database.Column(database.Integer, primary_key=True)
-    user_id = database.Column(database.Integer)  # column for user id
-    post_like_id = database.Column(database.Integer)  # column for post id liked by user
-    post_dislike_id = database.Column(database.Integer)  # column for post id disliked by user
+    user_id = database.Column(database.Integer, nullable=False)  # column for user id
+    post_id = database.Column(database.Integer, nullable=False, index=True)  # column for rated post id
+    value = database.Column(database.SmallInteger, nullable=False, default=0)  # 1 like, -1 dislike, 0 indifferent
     created_time = database.Column(database.DateTime)
+    # the feed version of the last change of the rating value
+    change_version = database.Column(database.Integer)
 
     def store(self):
         """
@@ -104,9 +299,145 @@ class Rating(database.Model):
         database.session.commit()
 
     @staticmethod
-    def del_indifferent():
+    def upsert_statement(dialect, user_id, post_id, value):
         """
-        Delete unused (indifferent liked) records in the database
+        Make the statement inserting the user's rating of the post or updating its value,
+        the record is stamped with the feed version
+
+        :param dialect: Gets the database dialect name
+        :param user_id: Gets the user id
+        :param post_id: Gets the post id
+        :param value: Gets the rating value 1, -1 or 0
+        :return: the statement or None if the dialect has no upsert statement
         """
-        database.session.query(Rating).filter_by(post_like_id=None, post_dislike_id=None).delete()
-        database.session.commit()
+        change_version = FeedVersion.version_subquery()
+        values = {'user_id': user_id, 'post_id': post_id, 'value': value, 'created_time': datetime.now(),
+                  'change_version': change_version}
+        if dialect == 'sqlite':
+            return sqlite.insert(Rating).values(**values).on_conflict_do_update(
+                index_elements=['user_id', 'post_id'], set_={'value': value, 'change_version': change_version})
+        elif dialect == 'mysql':
+            return mysql.insert(Rating).values(**values).on_duplicate_key_update(value=value,
+                                                                                 change_version=change_version)
+        elif dialect == 'postgresql':
+            return postgresql.insert(Rating).values(**values).on_conflict_do_update(
+                index_elements=['user_id', 'post_id'], set_={'value': value, 'change_version': change_version})
+        return None
+
+    @staticmethod
+    def upsert(user_id, post_id, value, session=None):
+        """
+        Insert the user's rating of the post or update its value with one statement.
+        Does not commit, so it is a part of the caller's transaction.
+
+        :param user_id: Gets the user id
+        :param post_id: Gets the post id
+        :param value: Gets the rating value 1, -1 or 0
+        :param session: Gets the session of the transaction, the Flask-SQLAlchemy session by default
+        """
+        session = database.session if session is None else session
+        statement = Rating.upsert_statement(session.get_bind().dialect.name, user_id, post_id, value)
+        if statement is None:
+            # the generic fallback, the row is locked by the caller's SELECT ... FOR UPDATE
+            updated = session.execute(
+                sql_update(Rating).where(Rating.user_id == user_id, Rating.post_id == post_id).values(
+                    value=value, change_version=FeedVersion.version_subquery()))
+            if updated.rowcount:
+                return
+            statement = sql_insert(Rating).values(user_id=user_id, post_id=post_id, value=value,
+                                                  created_time=datetime.now(),
+                                                  change_version=FeedVersion.version_subquery())
+        session.execute(statement)
+
+    @staticmethod
+    def likes_index(user_id, post_ids=None):
+        """
+        Make a hash index of the user's ratings by post id with one query.
+        If post ids are given only ratings of these posts are fetched.
+
+        :param user_id: Gets the user id
+        :param post_ids: Gets the iterable of post ids or None for all the user's ratings
+        :return: dictionary where key is post id and value is 1 or -1 if liked or disliked respectively
+        :rtype: dict
+        """
+        query = Rating.query.with_entities(Rating.post_id, Rating.value).filter(Rating.user_id == user_id,
+                                                                                 Rating.value != 0)
+        if post_ids is not None:
+            post_ids = list(post_ids)
+            if not post_ids:
+                return {}
+            query = query.filter(Rating.post_id.in_(post_ids))
+
+        return dict(query.all())
+
+
+class PostCounterDelta(database.Model):
+    # The table with the pending changes of the posts counts by ratings in the write-behind counters mode
+    __tablename__ = 'post_counter_deltas'
+
+    id = database.Column(database.Integer, primary_key=True)
+    post_id = database.Column(database.Integer, nullable=False, index=True)  # column for rated post id
+    user_id = database.Column(database.Integer, nullable=False)  # column for the rating user id
+    likes_delta = database.Column(database.SmallInteger, nullable=False)  # column for the change of likes count
+    dislikes_delta = database.Column(database.SmallInteger, nullable=False)  # column for the change of dislikes count
+
+    @staticmethod
+    def record(user_id, post_id, likes_delta, dislikes_delta):
+        """
+        Add the change of the post's counts. Does not commit, so it is a part of the caller's transaction.
+
+        :param user_id: Gets the rating user id
+        :param post_id: Gets the post id
+        :param likes_delta: Gets the change of likes count
+        :param dislikes_delta: Gets the change of dislikes count
+        """
+        database.session.add(PostCounterDelta(user_id=user_id, post_id=post_id, likes_delta=likes_delta,
+                                              dislikes_delta=dislikes_delta))
+
+    @staticmethod
+    def pending_sum(column):
+        """
+        Make the scalar subquery of the sum of the pending changes of the post's counts correlated to the posts
+
+        :param column: Gets the delta column
+        """
+        return sql_select(database.func.coalesce(database.func.sum(column), 0)).where(
+            PostCounterDelta.post_id == Post.id).scalar_subquery()
+
+    @staticmethod
+    def last_pending_id_query(user_id):
+        """
+        Make the query of the id of the user's last pending change, it is None if the user has no pending changes
+
+        :param user_id: Gets the rating user id
+        """
+        return sql_select(database.func.max(PostCounterDelta.id)).where(PostCounterDelta.user_id == user_id)
+
+    @staticmethod
+    def counts(post_id):
+        """
+        Return the post's counts including the pending changes
+
+        :param post_id: Gets the post id
+        :return: tuple of likes and dislikes counts or None if there is no such post
+        :rtype: tuple or None
+        """
+        return database.session.query(
+            Post.likes + PostCounterDelta.pending_sum(PostCounterDelta.likes_delta),
+            Post.dislikes + PostCounterDelta.pending_sum(PostCounterDelta.dislikes_delta)).filter(
+            Post.id == post_id).first()
+
+    @staticmethod
+    def counts_index(post_ids):
+        """
+        Make a hash index of the posts counts including the pending changes with one query
+
+        :param post_ids: Gets the iterable of post ids
+        :return: dictionary where key is post id and value is tuple of likes and dislikes counts
+        :rtype: dict
+        """
+        rows = database.session.query(
+            Post.id, Post.likes + PostCounterDelta.pending_sum(PostCounterDelta.likes_delta),
+            Post.dislikes + PostCounterDelta.pending_sum(PostCounterDelta.dislikes_delta)).filter(
+            Post.id.in_(list(post_ids)))
+        return {post_id: (likes, dislikes) for post_id, likes, dislikes in rows}
@@ -0,0 +1,178 @@
+import cProfile
+import hmac
+import os
+import random
+import re
+from datetime import datetime
+
+from werkzeug.exceptions import HTTPException
+
+
+class RequestProfiler:
+    """
+    Represents the on-demand profiler of single requests. Wraps the WSGI app, and profiles a request with cProfile
+    if it has the profiling header with the configured token or if it is sampled by the sampling rate.
+    The pstats file named by the endpoint and time is written to the output directory, whose total size is
+    bounded by deleting the oldest files. When disabled the WSGI app is not wrapped at all.
+    """
+
+    def __init__(self, app=None):
+        """
+        Initialize instance of class
+
+        :param app: Gets the Flask application object to take the configuration from
+        """
+        self.enabled = False
+        self.header = 'X-Profile'
+        self.token = ''
+        self.sample_rate = 0.0
+        self.directory = '/tmp/jwtblogapp_profiles'
+        self.max_bytes = 50 * 1024 * 1024
+        self.url_map = None
+        self.wsgi_app = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Take the parameters from the app config and, if enabled, wrap the app's WSGI callable
+
+        :param app: Gets the Flask application object
+        """
+        self.enabled = app.config.get('PROFILING_ENABLED', self.enabled)
+        self.header = app.config.get('PROFILING_HEADER', self.header)
+        self.token = app.config.get('PROFILING_TOKEN', self.token)
+        self.sample_rate = app.config.get('PROFILING_SAMPLE_RATE', self.sample_rate)
+        self.directory = app.config.get('PROFILING_DIR', self.directory)
+        self.max_bytes = app.config.get('PROFILING_MAX_BYTES', self.max_bytes)
+        if not self.enabled:
+            return
+
+        os.makedirs(self.directory, exist_ok=True)
+        self.url_map = app.url_map
+        self.wsgi_app = app.wsgi_app
+        app.wsgi_app = self.middleware
+
+    def requested(self, environ):
+        """
+        Check if the request should be profiled
+        :rtype: bool
+        """
+        header = environ.get('HTTP_' + self.header.upper().replace('-', '_'))
+        # the header is honoured only with the configured token, so clients can not load the server with profiling
+        if header is not None and self.token and hmac.compare_digest(header, self.token):
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def middleware(self, environ, start_response):
+        """
+        WSGI callable profiling the requested requests
+        """
+        if not self.requested(environ):
+            return self.wsgi_app(environ, start_response)
+
+        profiler = cProfile.Profile()
+        endpoint = self.endpoint(environ)
+        profiler.enable()
+        try:
+            body = self.wsgi_app(environ, start_response)
+        except BaseException:
+            profiler.disable()
+            self.save(profiler, endpoint)
+            raise
+        profiler.disable()
+        # the streamed responses do their work while the body is iterated, the profile is saved when it is closed
+        return ProfiledBody(body, profiler, lambda: self.save(profiler, endpoint))
+
+    def endpoint(self, environ):
+        """
+        Return the endpoint name of the request, the app does not keep it after the request is done
+        :rtype: str
+        """
+        try:
+            endpoint, _ = self.url_map.bind_to_environ(environ).match()
+        except HTTPException:
+            endpoint = 'unmatched'
+        return re.sub(r'[^\w.-]', '_', f'{environ.get("REQUEST_METHOD", "GET").lower()}-{endpoint}')
+
+    def save(self, profiler, endpoint):
+        """
+        Write the profile to the pstats file and delete the oldest files above the size limit
+
+        :param profiler: Gets the profiler with the collected statistics
+        :param endpoint: Gets the endpoint name
+        :return: path of the written file
+        :rtype: str
+        """
+        timestamp = datetime.utcnow().strftime('%Y%m%dT%H%M%S.%f')
+        path = os.path.join(self.directory, f'{endpoint}-{timestamp}-{os.getpid()}.prof')
+        profiler.dump_stats(path)
+        self.rotate()
+        return path
+
+    def rotate(self):
+        """
+        Delete the oldest profiles while the total size of the directory is above the limit
+        """
+        profiles = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.prof'):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                profiles.append((stat.st_mtime, entry.path, stat.st_size))
+
+        total = sum(size for _, _, size in profiles)
+        for _, path, size in sorted(profiles):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+class ProfiledBody:
+    """
+    Represents the WSGI response body profiled while the server iterates and closes it,
+    the profile is saved when the server closes the body after the last chunk or after the client is gone
+    """
+
+    def __init__(self, body, profiler, save):
+        """
+        Initialize instance of class
+
+        :param body: Gets the response body iterable of the WSGI app
+        :param profiler: Gets the profiler of the request
+        :param save: Gets the function without arguments saving the profile
+        """
+        self.body = body
+        self.profiler = profiler
+        self.save = save
+
+    def __iter__(self):
+        iterator = iter(self.body)
+        while True:
+            # the time the server spends sending the chunks is not profiled
+            self.profiler.enable()
+            try:
+                chunk = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self.profiler.disable()
+            yield chunk
+
+    def close(self):
+        """
+        Close the body, e.g. end the request's app context, and save the profile
+        """
+        self.profiler.enable()
+        try:
+            if hasattr(self.body, 'close'):
+                self.body.close()
+        finally:
+            self.profiler.disable()
+            self.save()
@@ -0,0 +1,198 @@
+import json
+import re
+from collections import Counter
+from time import perf_counter
+
+from flask import g, has_request_context
+from sqlalchemy import event
+
+from jwtblogapp import database
+
+# patterns replaced in a statement to make its shape, i.e. the statement without its parameters
+SHAPE_PATTERNS = (
+    (re.compile(r"'(?:[^']|'')*'"), '?'),  # string literals
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),  # number literals
+    (re.compile(r'(?:%\(\w+\)s|%s|:\w+|\?)'), '?'),  # bound parameters of any paramstyle
+    (re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)'), '(?...)'),  # expanded IN lists
+    (re.compile(r'\s+'), ' '),
+)
+
+
+def statement_shape(statement):
+    """
+    Return the statement with its parameters and literals replaced by placeholders,
+    so the same query with different parameters has the same shape
+
+    :param statement: Gets the SQL statement
+    :rtype: str
+    """
+    for pattern, replacement in SHAPE_PATTERNS:
+        statement = pattern.sub(replacement, statement)
+    return statement.strip()
+
+
+def summarize(queries, slow_threshold, repeat_threshold):
+    """
+    Make the summary of the statements executed by one request
+
+    :param queries: Gets the list of tuples with the statement and its duration in seconds
+    :param slow_threshold: Gets the duration in seconds, slower statements are reported
+    :param repeat_threshold: Gets the number of executions, shapes executed as many times or more are reported
+    :return: dictionary with the statements count, total time in milliseconds, the repeated shapes (N+1)
+        and the slow statements
+    :rtype: dict
+    """
+    shapes = Counter(statement_shape(statement) for statement, _ in queries)
+    return {
+        'queries': len(queries),
+        'db_ms': round(sum(duration for _, duration in queries) * 1000, 3),
+        'repeated': [{'shape': shape, 'count': count} for shape, count in shapes.most_common()
+                     if count >= repeat_threshold],
+        'slow': [{'statement': statement, 'ms': round(duration * 1000, 3)} for statement, duration in queries
+                 if duration >= slow_threshold],
+    }
+
+
+def listen_statements(engine, callback):
+    """
+    Call the callback with every statement executed by the engine and its duration. The start time is kept
+    by the statement's execution context, so a failed statement (it has no after cursor execute event)
+    leaves nothing behind on the pooled connection. Used by the query log and the request metrics.
+
+    :param engine: Gets the SQLAlchemy engine
+    :param callback: Gets the function called with the statement and its duration in seconds
+    :return: function removing the engine listeners
+    """
+    def before_cursor_execute(connection, cursor, statement, parameters, context, executemany):  # noqa
+        if context is not None:
+            context.statement_started = perf_counter()
+
+    def after_cursor_execute(connection, cursor, statement, parameters, context, executemany):  # noqa
+        started = getattr(context, 'statement_started', None)
+        if started is not None:
+            callback(statement, perf_counter() - started)
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', after_cursor_execute)
+
+    def remove():
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+        event.remove(engine, 'after_cursor_execute', after_cursor_execute)
+
+    return remove
+
+
+class QueryRecorder:
+    """
+    Represents the recorder of the SQL statements executed by the app engine in a block of code.
+    Used by the tests to limit the number of queries of an endpoint:
+
+        with QueryRecorder() as recorder:
+            client.get('/api/posts?limit=20', headers=headers)
+        recorder.assert_max_queries(3)
+    """
+
+    def __init__(self, engine=None):
+        """
+        Initialize instance of class
+
+        :param engine: Gets the SQLAlchemy engine, the app database engine by default
+        """
+        self.engine = engine
+        self.queries = []
+        self.remove_listeners = None
+
+    def __enter__(self):
+        if self.engine is None:
+            from jwtblogapp import app
+            with app.app_context():
+                self.engine = database.engine
+        self.queries = []
+        self.remove_listeners = listen_statements(self.engine, lambda *query: self.queries.append(query))
+        return self
+
+    def __exit__(self, *exc_info):
+        self.remove_listeners()
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    def assert_max_queries(self, maximum):
+        """
+        Fail if more than the maximum number of statements were executed
+
+        :param maximum: Gets the maximal number of statements
+        :raises AssertionError: with the list of the executed statements
+        """
+        assert self.count <= maximum, f'{self.count} queries executed, expected at most {maximum}:\n' + \
+            '\n'.join(statement for statement, _ in self.queries)
+
+
+class QueryLog:
+    """
+    Represents the opt-in diagnostic log of the SQL statements of every request. Records each statement
+    with its duration and reports repeated statement shapes (N+1 queries) and slow statements
+    in the response headers and/or the app log. When disabled no hooks are registered at all.
+    """
+
+    def __init__(self, app=None):
+        """
+        Initialize instance of class
+
+        :param app: Gets the Flask application object to take the configuration from
+        """
+        self.enabled = False
+        self.slow_threshold = 0.1
+        self.repeat_threshold = 3
+        self.output = 'headers'
+        self.logger = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Take the parameters from the app config and, if enabled, register the request hooks and the engine events
+
+        :param app: Gets the Flask application object
+        """
+        self.enabled = app.config.get('QUERY_LOG_ENABLED', self.enabled)
+        self.slow_threshold = app.config.get('QUERY_LOG_SLOW_MS', self.slow_threshold * 1000) / 1000
+        self.repeat_threshold = app.config.get('QUERY_LOG_REPEAT_THRESHOLD', self.repeat_threshold)
+        self.output = app.config.get('QUERY_LOG_OUTPUT', self.output)
+        self.logger = app.logger
+        if not self.enabled:
+            return
+
+        app.before_request(self.start_request)
+        app.after_request(self.finish_request)
+        with app.app_context():
+            listen_statements(database.engine, self.record_statement)
+
+    @staticmethod
+    def start_request():
+        g.query_log = []
+
+    @staticmethod
+    def record_statement(statement, duration):
+        if has_request_context() and 'query_log' in g:
+            g.query_log.append((statement, duration))
+
+    def finish_request(self, response):
+        """
+        Add the summary of the request's statements to the response headers and/or the log
+        """
+        if 'query_log' not in g:
+            return response
+        summary = summarize(g.query_log, self.slow_threshold, self.repeat_threshold)
+        if self.output in ('headers', 'both'):
+            response.headers['X-Query-Count'] = str(summary['queries'])
+            response.headers['X-Query-Time-Ms'] = str(summary['db_ms'])
+            response.headers['X-Query-Repeated'] = str(len(summary['repeated']))
+            response.headers['X-Query-Slow'] = str(len(summary['slow']))
+        if self.output in ('log', 'both'):
+            # the requests with N+1 or slow statements are logged as warnings
+            level = 'warning' if summary['repeated'] or summary['slow'] else 'info'
+            getattr(self.logger, level)('Query log %s', json.dumps(summary))
+
+        return response
@@ -1,9 +1,10 @@
-from datetime import datetime
+import json
+
+from flask import Response, current_app, request, stream_with_context
 from flask_restful import Resource, reqparse
-from .models import User, RevokedToken, Post, Rating
-from sqlalchemy.exc import IntegrityError, OperationalError
-from jwtblogapp import jwt
-from flask_jwt_extended import jwt_required, create_access_token, get_jwt, get_jwt_identity
+from jwtblogapp import (jwt, event_broker, exporting, feed_cache, group_commit, password_hasher, post_counters,
+                        revoked_tokens_cache, services)
+from flask_jwt_extended import jwt_required, get_jwt
 
 HELP_MSG = 'Can not be blank'
 
@@ -15,6 +16,16 @@ auth_arguments_parser = reqparse.RequestParser()
 post_arguments_parser = reqparse.RequestParser()
 # parser for parse post id and like value (0 or 1)
 rating_arguments_parser = reqparse.RequestParser()
+# parser for parse posts page query string (limit, before_id, cursor)
+posts_page_arguments_parser = reqparse.RequestParser()
+# parser for parse the list of ratings of the batch rating endpoint
+rating_batch_arguments_parser = reqparse.RequestParser()
+# parser for parse the feed version and limit of the posts changes query string
+changes_arguments_parser = reqparse.RequestParser()
+# parser for parse the id of the last received event from the header or the query string
+events_arguments_parser = reqparse.RequestParser()
+# parser for parse the exported table and format of the export query string
+export_arguments_parser = reqparse.RequestParser()
 
 # ---Add arguments for parsing in API endpoints---
 
@@ -29,11 +40,47 @@ post_arguments_parser.add_argument('post_text', required=True, help=HELP_MSG)
 rating_arguments_parser.add_argument('post_id', type=int, required=True, help=HELP_MSG)
 rating_arguments_parser.add_argument('like', type=int, required=True, help=HELP_MSG)
 
+# add page arguments for parsing from query string
+posts_page_arguments_parser.add_argument('limit', type=int, location='args')
+posts_page_arguments_parser.add_argument('before_id', type=int, location='args')
+posts_page_arguments_parser.add_argument('cursor', location='args')
+
+# add the list of ratings argument for parsing
+rating_batch_arguments_parser.add_argument('ratings', type=list, location='json', required=True, help=HELP_MSG)
+
+# add feed version and limit arguments for parsing from query string
+changes_arguments_parser.add_argument('since', type=int, location='args', required=True, help=HELP_MSG)
+changes_arguments_parser.add_argument('limit', type=int, location='args')
+changes_arguments_parser.add_argument('after_id', type=int, location='args')
+
+# add the last event id argument for parsing, the header is sent by the reconnecting EventSource
+events_arguments_parser.add_argument('Last-Event-ID', type=int, location='headers', dest='last_event_id')
+events_arguments_parser.add_argument('last_event_id', type=int, location='args', dest='query_last_event_id')
+
+# add the exported table and format arguments for parsing from query string
+export_arguments_parser.add_argument('table', location='args', default='posts', choices=tuple(exporting.TABLES),
+                                     help='table must be one of: posts, ratings')
+export_arguments_parser.add_argument('format', location='args', default='ndjson', dest='export_format',
+                                     choices=tuple(exporting.FORMATS), help='format must be one of: ndjson, csv')
+
+
+@jwt.user_lookup_loader
+def load_identity(jwt_header, jwt_payload: dict):  # noqa
+    """
+    Callback resolves the user identity of the verified token, see 'services.current_identity'.
+    None for a token of an unknown (e.g. deleted) user makes the '401' response before the view.
+
+    :param jwt_payload:
+    :type jwt_payload: dict
+    :return: identity with user id and username or None if there is no such user
+    """
+    return services.resolve_identity(jwt_payload)
+
 
 @jwt.token_in_blocklist_loader
 def check_if_token_revoked(jwt_header, jwt_payload: dict) -> bool:  # noqa
     """
-    Callback checks if the token is stored in revoked tokens.
+    Callback checks if the token is stored in revoked tokens by the per worker cache.
     Returns a boolean value, respectively.
 
     :param jwt_payload:
@@ -41,9 +88,7 @@ def check_if_token_revoked(jwt_header, jwt_payload: dict) -> bool:  # noqa
     :return: True if token persists in revoked tokens, False otherwise
     :rtype: bool
     """
-    jti = jwt_payload["jti"]
-    token = RevokedToken.query.filter_by(jti=jti).first()
-    return token is not None
+    return revoked_tokens_cache.is_revoked(jwt_payload["jti"], services.token_expires_time(jwt_payload))
 
 
 # define a class for user signup endpoint
@@ -63,21 +108,8 @@ class SignupUser(Resource):
         """
         # parse arguments to the arguments dictionary
         arguments = auth_arguments_parser.parse_args()
-        # instantiate User model
-        new_user = User(username=arguments['username'],
-                        password=arguments['password'])
-        # hash the new user password
-        new_user.make_hash()
-
-        try:
-            # store the new user record to database and return response
-            new_user.store()
-            return {'msg': f'User {new_user.username} successfully signed up'}
-        except IntegrityError:
-            # if the new user already exists response with code 202
-            return {'msg': f'User {new_user.username} already exist'}, 202
-        except OperationalError:
-            return {'msg': 'Internal server error'}, 502
+
+        return services.signup_user(arguments['username'], arguments['password'])
 
 
 # define a class for user login
@@ -98,23 +130,8 @@ class LoginUser(Resource):
         """
         # parse arguments to the arguments dictionary
         arguments = auth_arguments_parser.parse_args()
-        # check if user already exists in database
-        if not User.query.filter_by(username=arguments['username']).first():
-
-            return {'msg': 'Bad credentials! Login again or signup'}, 401
 
-        else:
-            # instantiate User model class
-            user = User.query.filter_by(username=arguments['username']).first()
-            # check if user password already exists in database
-            if user.ensure_password(arguments['password']):
-                # create a token
-                token = create_access_token(identity=user.username)
-                # return response with token
-                return {'msg': f'User {arguments["username"]} successfully logged in', 'token': token}
-            else:
-                # otherwise return a warning
-                return {'msg': 'Bad credentials! Login again or signup'}, 401
+        return services.login_user(arguments['username'], arguments['password'])
 
 
 # define a class for user logout
@@ -133,11 +150,7 @@ class LogoutUser(Resource):
         status code.
         :rtype: object
         """
-        # instantiate RevokedToken model class
-        revoked_token = RevokedToken(jti=get_jwt()['jti'])
-        # save token to the database
-        revoked_token.store()
-        return {'msg': 'You are successfully logged out'}
+        return services.logout_user(get_jwt())
 
 
 class Posts(Resource):
@@ -150,44 +163,25 @@ class Posts(Resource):
     @jwt_required()
     def get(self):
         """
-        Method for GET request. Return all posts.
+        Method for GET request. Return all posts or, if any of 'limit', 'before_id' or 'cursor' query arguments
+        is given, one page of posts newest first. The response has the ETag header made of the feed version,
+        if the 'If-None-Match' request header matches it the response is '304 Not Modified' without body.
         :returns: JSON response object, where are headers, JSON object with the 'posts' key with it members with keys
         ['post_id', 'user_id', 'username', 'post_text', 'likes', 'dislikes', 'like_it', 'created_time'],
-        status code.
+        and the 'next_cursor' key for a page request, status code.
         :rtype: object
         """
-        user = User.query.filter_by(username=get_jwt_identity()).first()
-        user_ratings = Rating.query.filter_by(user_id=user.id).all()
-
-        def likes_status(post_id):
-            """
-            Return status of post like for current user
-
-            :param post_id: Get post id
-            :return: 0 if post never been liked by user, 1, -1 if liked or disliked respectively
-            :rtype: int
-            """
-            # assign original value
-            like_it = 0
-            # check if the user has any rating for the post
-            if user_ratings:
-                # check if the user has 'like' rating for the post
-                if post_id in [result.post_like_id for result in user_ratings]:
-                    like_it = 1
-                # check if the user has 'dislike' rating for the post
-                elif post_id in [result.post_dislike_id for result in user_ratings]:
-                    like_it = -1
-
-            return like_it
-
-        # make a list of dictionaries by querying all post records from the database
-        posts_json = [{'post_id': post.id, 'user_id': post.user_id, 'username': post.username, 'post_text': post.text,
-                       'likes': post.likes,
-                       'dislikes': post.dislikes, 'like_it': likes_status(post.id),
-                       'created_time': post.created_time.strftime("%d-%m-%Y %H:%M:%S")
-                       } for post in Post.query.all()]
-
-        return {'posts': posts_json}
+        identity = services.current_identity()
+        # check if the client already has the current version of the feed, the body is of the same version
+        version = services.feed_version()
+        etag = services.feed_etag(identity, version)
+        if etag in request.if_none_match:
+            return Response(status=304, headers={'ETag': f'"{etag}"'})
+        # parse page arguments from the query string
+        arguments = posts_page_arguments_parser.parse_args()
+        body, status_code = services.get_posts(identity, version=version, **arguments)
+
+        return body, status_code, {'ETag': f'"{etag}"'} if status_code == 200 else {}
 
     # protect the endpoint
     @jwt_required()
@@ -198,17 +192,121 @@ class Posts(Resource):
         status code.
         :rtype: object
         """
-        # assign the current username to variable
-        user = User.query.filter_by(username=get_jwt_identity()).first()
         # parse arguments to the arguments dictionary
         arguments = post_arguments_parser.parse_args()
-        # instantiate Posts model class
-        new_post = Post(user_id=user.id, username=user.username, text=arguments['post_text'], likes=0, dislikes=0,
-                        created_time=datetime.now())
-        # save new post to database
-        new_post.store()
 
-        return {'msg': 'Post successfully created'}
+        return services.create_post(services.current_identity(), arguments['post_text'])
+
+
+class PostsImport(Resource):
+    """
+    Represents RESTful resource for the bulk import of the user's posts.
+    Accepts token stored in 'Authorisation' header with Bearer prefix (Bearer <JWT>) or in cookies.
+    """
+
+    # protect the endpoint
+    @jwt_required()
+    def post(self):
+        """
+        Method for POST request. Reads the NDJSON request body line by line, every line is a JSON object with
+        the 'post_text' key and the optional 'created_time' key in ISO 8601 format, and inserts the posts by batches.
+        :returns: streaming response object with 'application/x-ndjson' content type, where every line is
+        the JSON object of the line error with 'line' and 'error' keys, of the batch failed by the database with
+        'error' and 'not_imported' keys, of the progress after every batch with 'imported' and 'line' keys,
+        and the last one with 'done', 'imported', 'errors', 'failed' and 'lines' keys
+        :rtype: object
+        """
+        reports = services.import_posts(services.current_identity(), request.stream)
+
+        return Response(stream_with_context(json.dumps(report) + '\n' for report in reports),
+                        mimetype='application/x-ndjson')
+
+
+class PostsExport(Resource):
+    """
+    Represents RESTful resource for the export of all posts or of the user's ratings.
+    Accepts token stored in 'Authorisation' header with Bearer prefix (Bearer <JWT>) or in cookies.
+    """
+
+    # protect the endpoint
+    @jwt_required()
+    def get(self):
+        """
+        Method for GET request. Streams the records read from the database in batches, the 'table' query argument
+        is 'posts' (default) or 'ratings', the 'format' query argument is 'ndjson' (default) or 'csv'.
+        The response is compressed by gzip while streaming if the client accepts it.
+        :returns: streaming response object with 'application/x-ndjson' or 'text/csv' content type
+        :rtype: object
+        """
+        arguments = export_arguments_parser.parse_args()
+        # the ratings export has the current user's ratings only
+        user_id = services.current_identity().id if arguments['table'] == 'ratings' else None
+        compress = bool(request.accept_encodings['gzip'])
+        chunks = exporting.export(arguments['table'], arguments['export_format'], user_id,
+                                  current_app.config['EXPORT_BATCH_SIZE'], compress,
+                                  current_app.config['EXPORT_GZIP_LEVEL'])
+
+        response = Response(stream_with_context(chunks), mimetype=exporting.FORMATS[arguments['export_format']])
+        response.headers['Content-Disposition'] = \
+            f'attachment; filename={arguments["table"]}.{arguments["export_format"]}'
+        response.vary.add('Accept-Encoding')
+        if compress:
+            response.content_encoding = 'gzip'
+        return response
+
+
+class PostChanges(Resource):
+    """
+    Represents RESTful resource for the posts feed changes since a feed version.
+    Accepts token stored in 'Authorisation' header with Bearer prefix (Bearer <JWT>) or in JSON body.
+    """
+
+    # protect the endpoint
+    @jwt_required()
+    def get(self):
+        """
+        Method for GET request. Parses the 'since' feed version and the 'limit' from the query string. Returns
+        the posts created or whose counts changed after the version and the changes of the current user's ratings.
+        The client keeps the returned version and passes it as 'since' in the next request, with the returned
+        'after_id' as 'after_id' if it is not null, 'since=0' returns the whole feed.
+        :returns: JSON response object, where are headers, JSON object with the 'posts' key with the keys of
+        the posts feed members, the 'like_it_changes' key with 'post_id' and 'like_it' keys members, the 'version',
+        'after_id' and 'has_more' keys, status code.
+        :rtype: object
+        """
+        # parse arguments from the query string
+        arguments = changes_arguments_parser.parse_args()
+
+        return services.get_changes(services.current_identity(), arguments['since'], arguments['limit'],
+                                    arguments['after_id'])
+
+
+class PostEvents(Resource):
+    """
+    Represents RESTful resource for the stream of the posts feed events.
+    Accepts token stored in 'Authorisation' header with Bearer prefix (Bearer <JWT>) or in cookies,
+    browsers' EventSource can not send headers.
+    """
+
+    # protect the endpoint
+    @jwt_required()
+    def get(self):
+        """
+        Method for GET request. Streams the 'post_created' and 'rating_changed' events as Server-Sent Events.
+        Resumes after the event given by the 'Last-Event-ID' header or the 'last_event_id' query argument,
+        otherwise streams the events happening from now on.
+        :returns: streaming response object with 'text/event-stream' content type, where every event data is
+        the JSON object of the post with the keys of the posts feed or of the rating with 'post_id', 'likes'
+        and 'dislikes' keys
+        :rtype: object
+        """
+        if not event_broker.enabled:
+            return {'msg': 'Events stream is disabled'}, 404
+        # parse the last event id from the header or the query string
+        arguments = events_arguments_parser.parse_args()
+        last_event_id = arguments['last_event_id']
+
+        return event_broker.response(arguments['query_last_event_id'] if last_event_id is None else last_event_id)
 
 
 class PostRating(Resource):
@@ -224,123 +322,53 @@ class PostRating(Resource):
         Method for POST request. Parses the values of 'post_id' and 'like'. Creates a new post's rating or
         modify an existing one if a user already likes or dislikes post.
         :returns: JSON response object, where are headers, informational message with 'msg' key,
-        status code.
+        the new rating state with 'post_id', 'like_it', 'likes' and 'dislikes' keys, status code.
         :rtype: object
         """
-
-        # assign original values to None
-        post_like_id = None
-        post_dislike_id = None
-        # assign the current username to variable
-        user = User.query.filter_by(username=get_jwt_identity()).first()
         # parse arguments to the arguments dictionary
         arguments = rating_arguments_parser.parse_args()
-        post_id = arguments['post_id']
-
-        # delete unused (indifferent liked) records
-        rating = Rating()
-        rating.del_indifferent()
-
-        # get all post ids rated by current user
-        user_ratings = Rating.query.filter_by(user_id=user.id).all()
-        # check if the parsed post id exist in the database, if not response warning
-        if not Post.query.get(post_id):
-            return {'msg': 'Not such post_id in database'}, 404
-        # query post record bu post id
-
-        post = Post.query.filter_by(id=post_id).first()
-
-        # check if the user wants like or dislike the post
-
-        # if like
-        if arguments['like'] == 1:
-
-            # if the user already 'like' the post trigger indifferent
-
-            if post_id in [result.post_like_id for result in user_ratings]:
-                # find 'liked' post's rating
-                rating = Rating.query.filter_by(user_id=user.id, post_like_id=post_id).one()
-
-                rating.post_like_id = None
-
-                # update rating
-                rating.update()
-                # change counts of likes and dislikes in post's record
-
-                post.likes = Post.likes - 1
-                # update post
-                post.update()
-
-                return {'msg': 'Rating updated to indifferent'}
-
-            if post_id in [result.post_dislike_id for result in user_ratings]:
-                # find 'disliked' post's rating
-                rating = Rating.query.filter_by(user_id=user.id, post_dislike_id=post_id).one()
-
-                rating.post_like_id = post_id
-                rating.post_dislike_id = None
-
-                # update rating
-                rating.update()
-                # change counts of likes and dislikes in post's record
-
-                post.likes = Post.likes + 1
-                post.dislikes = Post.dislikes - 1
-                # update post
-                post.update()
-
-                return {'msg': 'Rating updated to Like'}
-
-            # If the post has never been 'likes' rated by current user
-            post.likes = Post.likes + 1
-            post_like_id = post_id
-            post.update()
-            new_rating = Rating(user_id=user.id, post_like_id=post_like_id, post_dislike_id=post_dislike_id,
-                                created_time=datetime.now())
-            # save the new rating to  the database
-            new_rating.store()
-
-        # if dislike
-        else:
-            # if the user already 'dislike' the post response warning
-            if post_id in [result.post_dislike_id for result in user_ratings]:
-                rating = Rating.query.filter_by(user_id=user.id, post_dislike_id=post_id).one()
-                # reassign post's dislike and like ids
-                rating.post_dislike_id = None
-                # update rating
-                rating.update()
-                # change counts of dislikes in post's record
-                post.dislikes = Post.dislikes - 1
-                # update post
-                post.update()
-                return {'msg': 'Rating updated to indifferent'}
-
-            # If the post has never been 'dislikes' rated by current user
-            if post_id in [result.post_like_id for result in user_ratings]:
-                # find 'disliked' post's rating
-                rating = Rating.query.filter_by(user_id=user.id, post_like_id=post_id).one()
-
-                rating.post_dislike_id = post_id
-                rating.post_like_id = None
-
-                # update rating
-                rating.update()
-                # change counts of likes and dislikes in post's record
-
-                post.likes = Post.likes - 1
-                post.dislikes = Post.dislikes + 1
-                # update post
-                post.update()
-
-                return {'msg': 'Rating updated to Dislike'}
-
-            # If the post has never been 'likes' rated by current user
-            post.dislikes = Post.dislikes + 1
-            post_dislike_id = post_id
-            post.update()
-            new_rating = Rating(user_id=user.id, post_like_id=post_like_id, post_dislike_id=post_dislike_id,
-                                created_time=datetime.now())
-            # save the new rating to  the database
-            new_rating.store()
-
-        return {'msg': 'Rating successfully created'}
+
+        return services.rate_post(services.current_identity(), arguments['post_id'], arguments['like'])
+
+
+class PostRatingBatch(Resource):
+    """
+    Represents RESTful resource for rating many blog posts in one request.
+    Accepts token stored in 'Authorisation' header with Bearer prefix (Bearer <JWT>) or in JSON body.
+    """
+
+    # protect the endpoint
+    @jwt_required()
+    def post(self):
+        """
+        Method for POST request. Parses the 'ratings' list of objects with 'post_id' and 'like' keys and applies
+        them in one transaction, every one like the POST request of the rating endpoint.
+        :returns: JSON response object, where are headers, JSON object with the 'results' key with the result of
+        every rating in the request order, with the 'status' and 'msg' keys and for the applied ones the
+        'post_id', 'like_it', 'likes' and 'dislikes' keys, status code.
+        :rtype: object
+        """
+        # parse arguments to the arguments dictionary
+        arguments = rating_batch_arguments_parser.parse_args()
+
+        return services.rate_posts(services.current_identity(), arguments['ratings'])
+
+
+class Stats(Resource):
+    """
+    Represents RESTful resource for the worker's caches and executors statistics.
+    Accepts token stored in 'Authorisation' header with Bearer prefix (Bearer <JWT>) or in JSON body.
+    """
+
+    # protect the endpoint
+    @jwt_required()
+    def get(self):
+        """
+        Method for GET request. Return the counters of the worker which serves the request.
+        :returns: JSON response object, where are headers, JSON object with the 'feed_cache',
+        'revoked_tokens_cache', 'password_hasher', 'post_counters' and 'group_commit' keys, status code.
+        :rtype: object
+        """
+        return {'feed_cache': feed_cache.stats(), 'revoked_tokens_cache': revoked_tokens_cache.stats(),
+                'password_hasher': password_hasher.stats(), 'post_counters': post_counters.stats(),
+                'group_commit': group_commit.stats()}
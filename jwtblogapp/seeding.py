@@ -0,0 +1,229 @@
+import random
+import uuid
+from bisect import bisect_left
+from datetime import datetime, timedelta
+from itertools import accumulate
+
+from sqlalchemy import delete, func, insert
+
+from jwtblogapp import database, feed_cache, revoked_tokens_cache
+from jwtblogapp.hashing import hash_password
+from jwtblogapp.models import User, RevokedToken, Post, Rating, FeedVersion, FeedEvent, PostCounterDelta
+
+# number of pre-generated post texts, the posts take their texts from it
+CORPUS_SIZE = 1000
+# the newest generated post is created just before this time
+DEFAULT_START_TIME = datetime(2023, 1, 1)
+DEFAULT_PASSWORD = 'password'
+
+
+def seed_username(number):
+    """
+    Return the username of the seeded user by its number
+    :rtype: str
+    """
+    return f'seed{number}@example.com'
+
+
+def make_corpus(seed, size=CORPUS_SIZE):
+    """
+    Generate the post texts corpus
+
+    :param seed: Gets the random seed
+    :param size: Gets the number of texts
+    :rtype: list
+    """
+    # Faker is imported only when the corpus is made, it is slow to import
+    from faker import Faker
+    fake = Faker(['ru_RU'])
+    fake.seed_instance(seed)
+    return [fake.text(max_nb_chars=200) for _ in range(size)]
+
+
+class Seeder:
+    """
+    Represents the generator of the database content for benchmarks and load tests.
+    Writes rows directly to the tables with batched inserts, takes the post texts from a pre-generated
+    corpus and gives all users the same password hashed once. The content depends on the seed only,
+    so the same options always make the same database.
+    """
+
+    def __init__(self, users=100, posts=10000, ratings=50000, revoked_tokens=10000, like_share=0.8,
+                 zipf_exponent=1.1, expired_share=0.5, seed=1, batch_size=10000, password=DEFAULT_PASSWORD,
+                 start_time=DEFAULT_START_TIME):
+        """
+        Initialize instance of class
+
+        :param users: Gets the number of users
+        :param posts: Gets the number of posts
+        :param ratings: Gets the number of ratings, it is limited by users * posts
+        :param revoked_tokens: Gets the number of revoked tokens
+        :param like_share: Gets the share of likes among ratings, the others are dislikes
+        :param zipf_exponent: Gets the exponent of the posts popularity, the newest post is the most rated one,
+            0 rates all posts equally
+        :param expired_share: Gets the share of revoked tokens which are already expired
+        :param seed: Gets the random seed
+        :param batch_size: Gets the number of rows inserted with one statement
+        :param password: Gets the password of all users
+        :param start_time: Gets the creation time of the newest post
+        """
+        self.users = users
+        self.posts = posts
+        self.ratings = min(ratings, users * posts)
+        self.revoked_tokens = revoked_tokens
+        self.like_share = like_share
+        self.zipf_exponent = zipf_exponent
+        self.expired_share = expired_share
+        self.seed = seed
+        self.batch_size = batch_size
+        self.password = password
+        self.start_time = start_time
+
+    def ratings_per_post(self, rng):
+        """
+        Distribute the ratings among posts by their Zipf popularity, no post has more ratings than users
+
+        :param rng: Gets the random generator
+        :return: list of ratings counts, the first item is the count of the oldest post
+        :rtype: list
+        """
+        counts = [0] * self.posts
+        if not self.posts or not self.users:
+            return counts
+        # the post of rank k (the newest post has rank 1) is rated with probability proportional to 1 / k ** exponent
+        cum_weights = list(accumulate(1 / rank ** self.zipf_exponent for rank in range(1, self.posts + 1)))
+        remaining = self.ratings
+        while remaining:
+            full = 0
+            for _ in range(remaining):
+                rank = min(bisect_left(cum_weights, rng.random() * cum_weights[-1]), self.posts - 1)
+                if counts[self.posts - 1 - rank] < self.users:
+                    counts[self.posts - 1 - rank] += 1
+                else:
+                    full += 1
+            remaining = full
+        return counts
+
+    def generate_posts(self, first_user_id, first_post_id):
+        """
+        Generate posts and their ratings, the likes and dislikes counts of every post match its ratings
+
+        :param first_user_id: Gets the id of the first seeded user
+        :param first_post_id: Gets the id of the first seeded post
+        :return: generator of tuples with the post row and the list of its rating rows
+        """
+        rng = random.Random(self.seed)
+        corpus = make_corpus(self.seed)
+        counts = self.ratings_per_post(rng)
+        for number in range(self.posts):
+            post_id = first_post_id + number
+            user_number = rng.randrange(self.users)
+            created_time = self.start_time - timedelta(seconds=self.posts - number)
+            ratings = [{'user_id': first_user_id + rater, 'post_id': post_id,
+                        'value': 1 if rng.random() < self.like_share else -1, 'created_time': created_time}
+                       for rater in rng.sample(range(self.users), counts[number])]
+            likes = sum(1 for rating in ratings if rating['value'] == 1)
+            post = {'id': post_id, 'user_id': first_user_id + user_number,
+                    'username': seed_username(first_user_id + user_number), 'text': rng.choice(corpus),
+                    'likes': likes, 'dislikes': len(ratings) - likes, 'created_time': created_time}
+            yield post, ratings
+
+    def generate_revoked_tokens(self):
+        """
+        Generate revoked tokens, the expired share of them expired during the day before the start time,
+        the others expire ten years after it
+        :return: generator of the revoked token rows
+        """
+        rng = random.Random(self.seed)
+        for _ in range(self.revoked_tokens):
+            if rng.random() < self.expired_share:
+                expires_time = self.start_time - timedelta(seconds=rng.randrange(1, 86400))
+            else:
+                expires_time = self.start_time + timedelta(days=3650, seconds=rng.randrange(1, 86400))
+            yield {'jti': str(uuid.UUID(int=rng.getrandbits(128), version=4)), 'expires_time': expires_time}
+
+    def insert(self, model, rows):
+        """
+        Insert the rows in batches, committing each batch
+
+        :param model: Gets the model class
+        :param rows: Gets the iterable of row dictionaries
+        :return: number of inserted rows
+        :rtype: int
+        """
+        inserted, batch = 0, []
+        for row in rows:
+            batch.append(row)
+            if len(batch) == self.batch_size:
+                inserted += self.flush(model, batch)
+        return inserted + self.flush(model, batch)
+
+    @staticmethod
+    def flush(model, batch):
+        if not batch:
+            return 0
+        statement = insert(model)
+        if model in (Post, Rating):
+            # every batch of posts or ratings is a feed write, so the changes endpoint returns it
+            FeedVersion.bump()
+            statement = statement.values(change_version=FeedVersion.version_subquery())
+        database.session.execute(statement, batch)
+        database.session.commit()
+        inserted = len(batch)
+        batch.clear()
+        return inserted
+
+    def reset(self):
+        """
+        Delete the content of the seeded tables with the feed events and the pending counts changes of the posts
+        """
+        for model in (User, RevokedToken, Post, Rating, FeedEvent, PostCounterDelta):
+            database.session.execute(delete(model))
+        # the feed version keeps increasing, so the clients' ETags and 'since' versions are not reused
+        FeedVersion.bump()
+        database.session.commit()
+
+    def run(self, reset=False, echo=print):
+        """
+        Write the generated content to the database. The ids of the seeded users and posts
+        continue the existing ones, so the seeding may be repeated.
+
+        :param reset: Gets True to delete the existing content first
+        :param echo: Gets the function printing the progress
+        :return: dictionary with the numbers of inserted rows and the first seeded user and post ids
+        :rtype: dict
+        """
+        if reset:
+            self.reset()
+        first_user_id = (database.session.query(func.max(User.id)).scalar() or 0) + 1
+        first_post_id = (database.session.query(func.max(Post.id)).scalar() or 0) + 1
+
+        # the password is hashed once, all users share the hash
+        password_hash = hash_password(self.password)
+        report = {'first_user_id': first_user_id, 'first_post_id': first_post_id}
+        report['users'] = self.insert(User, ({'id': number, 'username': seed_username(number),
+                                              'password': password_hash, 'created_time': self.start_time}
+                                             for number in range(first_user_id, first_user_id + self.users)))
+        echo(f'Inserted {report["users"]} users')
+
+        # posts and ratings are generated together and inserted in batches of posts
+        report['posts'], report['ratings'] = 0, 0
+        posts, ratings = [], []
+        for post, post_ratings in self.generate_posts(first_user_id, first_post_id):
+            posts.append(post)
+            ratings.extend(post_ratings)
+            if len(posts) == self.batch_size:
+                report['posts'] += self.flush(Post, posts)
+            if len(ratings) >= self.batch_size:
+                report['ratings'] += self.flush(Rating, ratings)
+        report['posts'] += self.flush(Post, posts)
+        report['ratings'] += self.flush(Rating, ratings)
+        echo(f'Inserted {report["posts"]} posts and {report["ratings"]} ratings')
+
+        report['revoked_tokens'] = self.insert(RevokedToken, self.generate_revoked_tokens())
+        echo(f'Inserted {report["revoked_tokens"]} revoked tokens')
+
+        feed_cache.invalidate()
+        revoked_tokens_cache.reset()
+
+        return report
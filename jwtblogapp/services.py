@@ -0,0 +1,686 @@
+import base64
+import binascii
+import json
+from collections import OrderedDict, namedtuple
+from datetime import datetime
+from threading import Lock
+from flask import current_app
+from flask_jwt_extended import create_access_token, get_current_user
+from sqlalchemy import insert as sql_insert
+from sqlalchemy.exc import IntegrityError, OperationalError, SQLAlchemyError
+
+from jwtblogapp import database, event_broker, feed_cache, group_commit, post_counters, revoked_tokens_cache
+from jwtblogapp.groupcommit import WriteRollback
+from jwtblogapp.hashing import HashingBusy
+from jwtblogapp.models import User, RevokedToken, Post, Rating, FeedVersion, FeedEvent, PostCounterDelta
+
+# The service layer is called directly by both the RESTful resources and the web views.
+# Every service returns a tuple of the JSON serializable response body and the status code.
+
+BUSY_MSG = 'Server is busy, try again later'
+
+# The current user identity taken from the token claims
+Identity = namedtuple('Identity', ['id', 'username'])
+
+# The per worker LRU cache of user identities by username for tokens issued without the 'user_id' claim
+identity_cache = OrderedDict()
+identity_cache_lock = Lock()
+
+
+def resolve_identity(claims):
+    """
+    Return the user identity of the token. Takes it from the token claims, for older tokens without
+    the 'user_id' claim looks up the user by username through the per worker LRU cache.
+
+    :param claims: Gets the token claims
+    :return: identity with user id and username or None if there is no such user
+    :rtype: Identity or None
+    """
+    if 'user_id' in claims:
+        return Identity(claims['user_id'], claims['sub'])
+
+    username = claims['sub']
+    with identity_cache_lock:
+        if username in identity_cache:
+            identity_cache.move_to_end(username)
+            return identity_cache[username]
+
+    user = User.query.filter_by(username=username).first()
+    if user is None:
+        return None
+    identity = Identity(user.id, user.username)
+    with identity_cache_lock:
+        identity_cache[username] = identity
+        while len(identity_cache) > current_app.config['IDENTITY_CACHE_SIZE']:
+            identity_cache.popitem(last=False)
+
+    return identity
+
+
+def current_identity():
+    """
+    Return the current user identity resolved when the token was verified, a token of an unknown user
+    is rejected before the view with '401' response, see 'resources.load_identity'
+
+    :rtype: Identity
+    """
+    return get_current_user()
+
+
+def encode_cursor(before_id):
+    """
+    Make an opaque cursor for the next posts page
+
+    :param before_id: Gets the id of the last post on the current page
+    :rtype: str
+    """
+    return base64.urlsafe_b64encode(json.dumps({'before_id': before_id}).encode()).decode()
+
+
+def decode_cursor(cursor):
+    """
+    Take an opaque cursor and return the post id the page starts before.
+    Returns None if the cursor is malformed.
+
+    :param cursor: Gets the cursor made by encode_cursor
+    :rtype: int or None
+    """
+    try:
+        before_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))['before_id']
+    except (binascii.Error, ValueError, TypeError, KeyError):
+        return None
+    return before_id if isinstance(before_id, int) else None
+
+
+def token_expires_time(jwt_payload):
+    """
+    Return the token expiry time as UTC datetime or None if the token never expires
+
+    :param jwt_payload: Gets the decoded token payload
+    :rtype: datetime or None
+    """
+    return datetime.utcfromtimestamp(jwt_payload['exp']) if 'exp' in jwt_payload else None
+
+
+def signup_user(username, password):
+    """
+    Hash the new user password and add the user record to database
+
+    :param username: Gets the new user name
+    :param password: Gets the new user native password
+    :return: response body with 'msg' key and status code
+    :rtype: tuple
+    """
+    # instantiate User model
+    new_user = User(username=username, password=password)
+    try:
+        # hash the new user password
+        new_user.make_hash()
+    except HashingBusy:
+        return {'msg': BUSY_MSG}, 503
+
+    try:
+        # store the new user record to database and return response
+        new_user.store()
+        return {'msg': f'User {new_user.username} successfully signed up'}, 200
+    except IntegrityError:
+        # if the new user already exists response with code 202
+        return {'msg': f'User {new_user.username} already exist'}, 202
+    except OperationalError:
+        return {'msg': 'Internal server error'}, 502
+
+
+def login_user(username, password):
+    """
+    Look up if username and password exists in database, in case of success create token
+
+    :param username: Gets the user name
+    :param password: Gets the user native password
+    :return: response body with 'msg' key and 'token' key in case of success and status code
+    :rtype: tuple
+    """
+    # instantiate User model class
+    user = User.query.filter_by(username=username).first()
+    # check if user already exists in database
+    if not user:
+
+        return {'msg': 'Bad credentials! Login again or signup'}, 401
+
+    else:
+        # check if user password already exists in database
+        try:
+            password_matches = user.ensure_password(password)
+        except HashingBusy:
+            return {'msg': BUSY_MSG}, 503
+        if password_matches:
+            # create a token with the user id claim, the username is the token identity
+            token = create_access_token(identity=user.username, additional_claims={'user_id': user.id})
+            # return response with token
+            return {'msg': f'User {username} successfully logged in', 'token': token}, 200
+        else:
+            # otherwise return a warning
+            return {'msg': 'Bad credentials! Login again or signup'}, 401
+
+
+def logout_user(jwt_payload):
+    """
+    Save the token in revoked tokens in the database and in the worker cache
+
+    :param jwt_payload: Gets the decoded token payload
+    :return: response body with 'msg' key and status code
+    :rtype: tuple
+    """
+    # instantiate RevokedToken model class
+    revoked_token = RevokedToken(jti=jwt_payload['jti'], expires_time=token_expires_time(jwt_payload))
+    # save token to the database
+    revoked_token.store()
+    # remember the token in the worker cache immediately
+    revoked_tokens_cache.add(revoked_token.jti, revoked_token.expires_time)
+    return {'msg': 'You are successfully logged out'}, 200
+
+
+def feed_version():
+    """
+    Return the current feed version, every post or rating write bumps it in its transaction
+    :rtype: int
+    """
+    return FeedVersion.current()
+
+
+def feed_page(limit=None, before_id=None, version=None):
+    """
+    Return the public part of all posts or of one page of posts newest first through the feed cache.
+    The pages are cached under the feed version, so no worker serves a page older than the version
+    after a write, whichever worker did the write and invalidated its own cache. All posts are cached
+    only up to FEED_CACHE_MAX_POSTS posts, a larger feed is built for every request.
+
+    :param limit: Gets the page size or None for all posts
+    :param before_id: Gets the post id the page starts before
+    :param version: Gets the feed version read before, e.g. the one of the response ETag, the current one by default
+    :return: dictionary with 'posts' key and 'next_cursor' key for a page
+    :rtype: dict
+    """
+    # take the generation and the version before querying, so a page built before a write is cached under
+    # the old ones
+    generation = feed_cache.generation()
+    if generation is not None and version is None:
+        version = feed_version()
+    key = f'v{version}:' + ('all' if limit is None else f'{limit}:{before_id}')
+    page = feed_cache.get(generation, key)
+    if page is not None:
+        return page
+
+    if limit is None:
+        page = {'posts': [post.as_dict() for post in Post.query.all()]}
+    else:
+        # query one extra post (newest first) to know if there is the next page
+        query = Post.query.order_by(Post.id.desc())
+        if before_id is not None:
+            query = query.filter(Post.id < before_id)
+        posts = query.limit(limit + 1).all()
+        page = {'posts': [post.as_dict() for post in posts[:limit]],
+                'next_cursor': encode_cursor(posts[limit - 1].id) if len(posts) > limit else None}
+    if limit is not None or len(page['posts']) <= current_app.config['FEED_CACHE_MAX_POSTS']:
+        feed_cache.set(generation, key, page, version)
+
+    return page
+
+
+def get_posts(identity, limit=None, before_id=None, cursor=None, version=None):
+    """
+    Return all posts or, if any of limit, before_id or cursor is given, one page of posts newest first
+
+    :param identity: Gets the current user identity to resolve the user's ratings
+    :param limit: Gets the page size
+    :param before_id: Gets the post id the page starts before
+    :param cursor: Gets the opaque cursor of the page
+    :param version: Gets the feed version of the response ETag, the current one by default
+    :return: response body with 'posts' key and 'next_cursor' key for a page request and status code
+    :rtype: tuple
+    """
+    # if no page is requested return all posts in the original shape for old clients
+    if limit is None and before_id is None and cursor is None:
+        likes_index = Rating.likes_index(identity.id)
+        posts_json = [dict(post, like_it=likes_index.get(post['post_id'], 0))
+                      for post in feed_page(version=version)['posts']]
+
+        return {'posts': posts_json}, 200
+
+    # take the page size bounded by the configured maximum
+    limit = limit if limit is not None else current_app.config['POSTS_PAGE_LIMIT']
+    if limit < 1:
+        return {'msg': 'limit must be a positive integer'}, 400
+    limit = min(limit, current_app.config['POSTS_PAGE_MAX_LIMIT'])
+
+    if cursor is not None:
+        before_id = decode_cursor(cursor)
+        if before_id is None:
+            return {'msg': 'Bad cursor'}, 400
+
+    page = feed_page(limit, before_id, version)
+
+    # get the user's ratings of the page posts with one query
+    likes_index = Rating.likes_index(identity.id, [post['post_id'] for post in page['posts']])
+    posts_json = [dict(post, like_it=likes_index.get(post['post_id'], 0)) for post in page['posts']]
+
+    return {'posts': posts_json, 'next_cursor': page['next_cursor']}, 200
+
+
+def feed_etag(identity, version=None):
+    """
+    Make the strong ETag of the current user's posts feed from the feed version.
+    The user id is a part of it because the feed includes the user's ratings. The write-behind counters
+    change the ratings without bumping the version until the flush, so the id of the user's last pending change
+    is a part of it too.
+
+    :param identity: Gets the current user identity
+    :param version: Gets the feed version, the current one by default
+    :rtype: str
+    """
+    etag = f'v{feed_version() if version is None else version}-u{identity.id}'
+    if post_counters.write_behind:
+        etag += f'-d{database.session.scalar(PostCounterDelta.last_pending_id_query(identity.id)) or 0}'
+    return etag
+
+
+def get_changes(identity, since, limit=None, after_id=None):
+    """
+    Return the posts created or whose counts changed after the given feed version and the changes of the user's
+    ratings, oldest change first. The posts are limited, when there are more the response version is the one
+    of the last returned post, so the client gets the rest by the next request with it. If the rest has posts
+    of the same version (one write may change many posts), the response 'after_id' is the id of the last
+    returned post and the client passes it with the version.
+
+    :param identity: Gets the current user identity
+    :param since: Gets the feed version the client's copy of the feed is up to
+    :param limit: Gets the maximal number of posts
+    :param after_id: Gets the id of the last post of the 'since' version the client has got,
+        the client has all posts of the version by default
+    :return: response body with 'posts', 'like_it_changes', 'version', 'after_id' and 'has_more' keys and status code
+    :rtype: tuple
+    """
+    limit = min(limit if limit is not None else current_app.config['POSTS_CHANGES_LIMIT'],
+                current_app.config['POSTS_CHANGES_LIMIT'])
+    if limit < 1 or since < 0:
+        return {'msg': 'since and limit must be positive integers'}, 400
+    # take the version before querying, the changes committed after it are returned by the next request again
+    version = FeedVersion.current()
+    if since > version:
+        return {'msg': 'The version is ahead of the feed, reload the feed'}, 409
+
+    changed = Post.change_version > since
+    if after_id is not None:
+        # the rest of the posts of the 'since' version
+        changed = database.or_(changed, database.and_(Post.change_version == since, Post.id > after_id))
+    # query one extra post to know if there are more changes
+    posts = Post.query.filter(changed, Post.change_version <= version).order_by(
+        Post.change_version, Post.id).limit(limit + 1).all()
+    has_more = len(posts) > limit
+    next_after_id = None
+    if has_more:
+        version = posts[-2].change_version
+        if posts[-1].change_version == version:
+            next_after_id = posts[-2].id
+        posts = posts[:limit]
+
+    # the user's current ratings of the changed posts and the user's ratings changed in the same versions
+    likes_index = Rating.likes_index(identity.id, [post.id for post in posts])
+    posts_json = [dict(post.as_dict(), like_it=likes_index.get(post.id, 0)) for post in posts]
+    like_it_changes = [{'post_id': post_id, 'like_it': value} for post_id, value in Rating.query.with_entities(
+        Rating.post_id, Rating.value).filter(Rating.user_id == identity.id, Rating.change_version > since,
+                                             Rating.change_version <= version).order_by(Rating.change_version)]
+
+    return {'posts': posts_json, 'like_it_changes': like_it_changes, 'version': version, 'after_id': next_after_id,
+            'has_more': has_more}, 200
+
+
+def create_post(identity, post_text):
+    """
+    Save the new post of the user to the database
+
+    :param identity: Gets the current user identity
+    :param post_text: Gets the post text
+    :return: response body with 'msg' key and status code
+    :rtype: tuple
+    """
+    # instantiate Posts model class
+    new_post = Post(user_id=identity.id, username=identity.username, text=post_text, likes=0, dislikes=0,
+                    created_time=datetime.now(), change_version=FeedVersion.version_subquery())
+
+    def write():
+        # bump the feed version and add the event in the same transaction and save new post to database
+        FeedVersion.bump()
+        database.session.add(new_post)
+        if event_broker.enabled:
+            # the event needs the post id
+            database.session.flush()
+            FeedEvent.record('post_created', new_post.as_dict())
+
+    try:
+        group_commit.run_write(write)
+    except OperationalError:
+        return {'msg': 'Internal server error'}, 502
+    feed_cache.invalidate()
+    event_broker.publish()
+
+    return {'msg': 'Post successfully created'}, 200
+
+
+def rating_msg(previous, value):
+    """
+    Make the message of the rating change
+
+    :param previous: Gets the previous rating value
+    :param value: Gets the new rating value
+    :rtype: str
+    """
+    if value == 0:
+        return 'Rating updated to indifferent'
+    elif previous == 0:
+        return 'Rating successfully created'
+    return 'Rating updated to Like' if value == 1 else 'Rating updated to Dislike'
+
+
+def apply_rating(user_id, post_id, target, session=None):
+    """
+    Rate the post by the user and change the post's counts in the caller's transaction, it is shared by the Flask
+    and the async API. The feed version is bumped first, the post and the rating are stamped with it,
+    and every write transaction takes its lock first, so the concurrent writes never deadlock.
+
+    :param user_id: Gets the user id
+    :param post_id: Gets the post id
+    :param target: Gets 1 to like the post or -1 to dislike it, the same rating again resets it to indifferent
+    :param session: Gets the session of the transaction, the Flask-SQLAlchemy session by default
+    :return: tuple of the previous and the new rating values, likes and dislikes counts
+        or None if there is no such post
+    :rtype: tuple
+    """
+    session = database.session if session is None else session
+    FeedVersion.bump(session)
+    # lock the user's rating of the post (if any) until the end of transaction
+    previous = session.query(Rating.value).filter_by(user_id=user_id, post_id=post_id).with_for_update().scalar() or 0
+    value = 0 if previous == target else target
+    # change counts of likes and dislikes in post's record by delta, it fails if there is no such post
+    counts = Post.add_counts(post_id, int(value == 1) - int(previous == 1), int(value == -1) - int(previous == -1),
+                             session)
+    if counts is None:
+        return None
+    Rating.upsert(user_id, post_id, value, session)
+    return (previous, value) + counts
+
+
+def rate_post(identity, post_id, like):
+    """
+    Create a new post's rating or modify an existing one if the user already likes or dislikes post.
+    Rating the post the same way again resets the rating to indifferent. The rating record and the post's counts
+    are changed in one transaction, in the write-behind counters mode the change of the counts is recorded
+    in it instead and the returned counts include the pending changes.
+
+    :param identity: Gets the current user identity
+    :param post_id: Gets the post id
+    :param like: Gets 1 to like the post, otherwise dislike it
+    :return: response body with 'msg', 'post_id', 'like_it', 'likes' and 'dislikes' keys and status code
+    :rtype: tuple
+    """
+    target = 1 if like == 1 else -1
+
+    def write():
+        if not post_counters.write_behind:
+            result = apply_rating(identity.id, post_id, target)
+            if result is None:
+                raise WriteRollback()
+            if event_broker.enabled:
+                FeedEvent.record('rating_changed', {'post_id': post_id, 'likes': result[2], 'dislikes': result[3]})
+            return result
+
+        # lock the user's rating of the post (if any) until the end of transaction
+        previous = Rating.query.with_entities(Rating.value).filter_by(
+            user_id=identity.id, post_id=post_id).with_for_update().scalar() or 0
+        value = 0 if previous == target else target
+        # the post's record is not locked, the flush applies the change, the feed version and event
+        counts = PostCounterDelta.counts(post_id)
+        if counts is None:
+            raise WriteRollback()
+        Rating.upsert(identity.id, post_id, value)
+        likes_delta, dislikes_delta = int(value == 1) - int(previous == 1), int(value == -1) - int(previous == -1)
+        PostCounterDelta.record(identity.id, post_id, likes_delta, dislikes_delta)
+        return previous, value, counts[0] + likes_delta, counts[1] + dislikes_delta
+
+    try:
+        result = group_commit.run_write(write)
+    except OperationalError:
+        return {'msg': 'Internal server error'}, 502
+    if result is None:
+        return {'msg': 'Not such post_id in database'}, 404
+    previous, value, likes, dislikes = result
+    if post_counters.write_behind:
+        post_counters.recorded()
+    else:
+        feed_cache.invalidate()
+        event_broker.publish()
+
+    return {'msg': rating_msg(previous, value), 'post_id': post_id, 'like_it': value, 'likes': likes,
+            'dislikes': dislikes}, 200
+
+
+def rate_posts(identity, ratings):
+    """
+    Apply the list of rating operations of the user in one transaction. Every operation rates the post like
+    'rate_post' does, the operations of the same post are applied in order. The counts of every affected post
+    are changed by one update. An invalid operation or a not existing post is reported in its item result only.
+
+    :param identity: Gets the current user identity
+    :param ratings: Gets the list of dictionaries with 'post_id' and 'like' keys
+    :return: response body with 'results' key, the list of dictionaries with 'status' and 'msg' keys and for
+        the applied operation 'post_id', 'like_it', 'likes' and 'dislikes' keys, in the operations order,
+        and status code
+    :rtype: tuple
+    """
+    if len(ratings) > current_app.config['RATING_BATCH_MAX_SIZE']:
+        return {'msg': f'No more than {current_app.config["RATING_BATCH_MAX_SIZE"]} ratings in one request'}, 400
+
+    # validate the operations, the invalid ones are not applied
+    operations = []
+    for rating in ratings:
+        post_id, like = (rating.get('post_id'), rating.get('like')) if isinstance(rating, dict) else (None, None)
+        valid = all(isinstance(item, int) and not isinstance(item, bool) for item in (post_id, like))
+        operations.append((post_id, 1 if like == 1 else -1) if valid else None)
+    post_ids = {operation[0] for operation in operations if operation is not None}
+
+    def write():
+        if not post_counters.write_behind:
+            # bump the feed version first, the posts and the ratings are stamped with it
+            FeedVersion.bump()
+        # lock the user's ratings of the posts (if any) until the end of transaction
+        values = dict(Rating.query.with_entities(Rating.post_id, Rating.value).filter(
+            Rating.user_id == identity.id, Rating.post_id.in_(post_ids)).with_for_update().all()) if post_ids else {}
+        existing = {post_id for post_id, in Post.query.with_entities(Post.id).filter(
+            Post.id.in_(post_ids))} if post_ids else set()
+
+        # the change of every operation: None for invalid one, tuple of post id, previous and new values otherwise,
+        # the values are None for a not existing post
+        changes = []
+        deltas = {}
+        for operation in operations:
+            if operation is None:
+                changes.append(None)
+                continue
+            if operation[0] not in existing:
+                changes.append((operation[0], None, None))
+                continue
+            post_id, target = operation
+            previous = values.get(post_id, 0)
+            values[post_id] = value = 0 if previous == target else target
+            likes, dislikes = deltas.get(post_id, (0, 0))
+            deltas[post_id] = (likes + int(value == 1) - int(previous == 1),
+                               dislikes + int(value == -1) - int(previous == -1))
+            changes.append((post_id, previous, value))
+        if not deltas:
+            raise WriteRollback((changes, {}))
+
+        for post_id in deltas:
+            Rating.upsert(identity.id, post_id, values[post_id])
+        if post_counters.write_behind:
+            # the posts records are not locked, the flush applies the changes, the feed version and events
+            for post_id, (likes_delta, dislikes_delta) in deltas.items():
+                PostCounterDelta.record(identity.id, post_id, likes_delta, dislikes_delta)
+            return changes, PostCounterDelta.counts_index(deltas)
+
+        Post.add_counts_batch(deltas)
+        counts = {post_id: (likes, dislikes) for post_id, likes, dislikes in Post.query.with_entities(
+            Post.id, Post.likes, Post.dislikes).filter(Post.id.in_(list(deltas)))}
+        if event_broker.enabled:
+            for post_id, (likes, dislikes) in sorted(counts.items()):
+                FeedEvent.record('rating_changed', {'post_id': post_id, 'likes': likes, 'dislikes': dislikes})
+        return changes, counts
+
+    try:
+        changes, counts = group_commit.run_write(write)
+    except OperationalError:
+        return {'msg': 'Internal server error'}, 502
+    if counts:
+        if post_counters.write_behind:
+            post_counters.recorded()
+        else:
+            feed_cache.invalidate()
+            event_broker.publish()
+
+    results = []
+    for change in changes:
+        if change is None:
+            results.append({'status': 400, 'msg': 'post_id and like must be integers'})
+            continue
+        post_id, previous, value = change
+        if value is None:
+            results.append({'status': 404, 'msg': 'Not such post_id in database', 'post_id': post_id})
+        else:
+            likes, dislikes = counts[post_id]
+            results.append({'status': 200, 'msg': rating_msg(previous, value), 'post_id': post_id, 'like_it': value,
+                            'likes': likes, 'dislikes': dislikes})
+
+    return {'results': results}, 200
+
+
+def parse_import_line(line):
+    """
+    Parse one line of the posts import
+
+    :param line: Gets the line bytes, a JSON object with 'post_text' key and optional 'created_time' key
+        in ISO 8601 format
+    :return: tuple of the post text and created time
+    :rtype: tuple
+    :raises ValueError: if the line is not a valid post
+    """
+    try:
+        item = json.loads(line)
+    except UnicodeDecodeError:
+        raise ValueError('Line is not UTF-8 text') from None
+    except ValueError:
+        raise ValueError('Line is not a JSON object') from None
+    if not isinstance(item, dict):
+        raise ValueError('Line is not a JSON object')
+    post_text = item.get('post_text')
+    if not isinstance(post_text, str) or not post_text.strip():
+        raise ValueError('post_text can not be blank')
+    created_time = item.get('created_time')
+    if created_time is None:
+        return post_text, datetime.now()
+    try:
+        return post_text, datetime.fromisoformat(created_time)
+    except (TypeError, ValueError):
+        raise ValueError('created_time must be in ISO 8601 format') from None
+
+
+def import_posts(identity, stream):
+    """
+    Import the posts of the user from the NDJSON stream, one post per line, without reading the whole stream.
+    The posts are inserted by batches, every batch with one statement in its own transaction stamped with
+    the bumped feed version together with the 'post_created' events of its posts, so the memory does not depend
+    on the stream size. The invalid lines are skipped, the lines of a batch failed by the database are reported.
+
+    :param identity: Gets the current user identity
+    :param stream: Gets the binary file-like object of the request body
+    :return: generator of the report dictionaries: the per line errors with 'line' and 'error' keys,
+        the failed batches with 'error' and 'not_imported' (the line numbers) keys, the progress after every batch
+        with 'imported' and 'line' keys and the last one with 'done', 'imported', 'errors', 'failed'
+        and 'lines' keys
+    """
+    batch_size = current_app.config['POSTS_IMPORT_BATCH_SIZE']
+    max_line_bytes = current_app.config['POSTS_IMPORT_MAX_LINE_BYTES']
+    max_errors = current_app.config['POSTS_IMPORT_MAX_ERRORS']
+    insert_posts = sql_insert(Post.__table__).values(user_id=identity.id, username=identity.username, likes=0,
+                                                     dislikes=0, change_version=FeedVersion.version_subquery())
+
+    def insert_batch(rows, lines):
+        """
+        Insert the batch of posts, the failure is rolled back and reported
+        :return: the report of the failed batch or None
+        """
+        try:
+            FeedVersion.bump()
+            database.session.execute(insert_posts, rows)
+            events = 0
+            if event_broker.enabled:
+                # the batch is the only write of the locked feed version, so its posts are read back by it
+                for post in Post.query.filter(Post.user_id == identity.id,
+                                              Post.change_version == FeedVersion.version_subquery()):
+                    FeedEvent.record('post_created', post.as_dict())
+                    events += 1
+            database.session.commit()
+        except SQLAlchemyError as error:
+            database.session.rollback()
+            current_app.logger.warning('Posts import batch failed: %s', error)
+            return {'error': 'Database error, the lines are not imported', 'not_imported': lines}
+        feed_cache.invalidate()
+        if events:
+            event_broker.publish(events)
+        return None
+
+    rows = []
+    lines = []
+    imported = errors = failed = number = 0
+    while True:
+        # read by the bounded line size, so a huge line does not take the memory
+        line = stream.readline(max_line_bytes + 1)
+        if not line:
+            break
+        number += 1
+        if len(line) > max_line_bytes and not line.endswith(b'\n'):
+            # skip the rest of the long line
+            while line and not line.endswith(b'\n'):
+                line = stream.readline(max_line_bytes + 1)
+            error = f'Line is longer than {max_line_bytes} bytes'
+        elif not line.strip():
+            continue
+        else:
+            try:
+                post_text, created_time = parse_import_line(line)
+                rows.append({'text': post_text, 'created_time': created_time})
+                lines.append(number)
+                error = None
+            except ValueError as parse_error:
+                error = str(parse_error)
+        if error is not None:
+            errors += 1
+            if errors <= max_errors:
+                yield {'line': number, 'error': error}
+
+        if len(rows) == batch_size:
+            failure = insert_batch(rows, lines)
+            if failure is None:
+                imported += len(rows)
+            else:
+                failed += len(rows)
+                yield failure
+            rows = []
+            lines = []
+            yield {'imported': imported, 'line': number}
+
+    if rows:
+        failure = insert_batch(rows, lines)
+        if failure is None:
+            imported += len(rows)
+        else:
+            failed += len(rows)
+            yield failure
+    yield {'done': True, 'imported': imported, 'errors': errors, 'failed': failed, 'lines': number}
@@ -0,0 +1,94 @@
+import argparse
+import json
+import re
+import subprocess
+import sys
+
+# The code measured in a fresh interpreter: importing the package and creating the app
+STARTUP_CODE = '''
+import json, sys
+from time import perf_counter
+started = perf_counter()
+import jwtblogapp
+imported = perf_counter()
+jwtblogapp.create_app()
+created = perf_counter()
+print(json.dumps({'import_ms': (imported - started) * 1000, 'create_app_ms': (created - imported) * 1000,
+                  'loaded': [name for name in %r if name in sys.modules]}))
+'''
+# the slow to import dependencies which must not be imported at startup
+HEAVY_MODULES = ('faker', 'requests')
+
+IMPORT_TIME_LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$')
+
+
+def parse_import_times(output):
+    """
+    Parse the output of 'python -X importtime'
+
+    :param output: Gets the standard error of the interpreter
+    :return: list of dictionaries with the module name, its nesting level, self and cumulative import time
+    :rtype: list
+    """
+    modules = []
+    for line in output.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            modules.append({'module': module, 'level': (len(indent) - 1) // 2, 'self_ms': int(self_us) / 1000,
+                            'cumulative_ms': int(cumulative_us) / 1000})
+    return modules
+
+
+def startup_report(top=20):
+    """
+    Measure the cold start of the app in a fresh interpreter: the package import time, the create_app time
+    and the import time of every module
+
+    :param top: Gets the number of the slowest modules in the report
+    :return: dictionary with 'import_ms', 'create_app_ms', 'total_ms', 'heavy_modules' loaded at startup
+        and 'modules' with the slowest modules by cumulative import time
+    :rtype: dict
+    """
+    completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', STARTUP_CODE % (HEAVY_MODULES,)],
+                               capture_output=True, text=True, check=True)
+    timings = json.loads(completed.stdout.strip().splitlines()[-1])
+    modules = parse_import_times(completed.stderr)
+    return {
+        'import_ms': round(timings['import_ms'], 2),
+        'create_app_ms': round(timings['create_app_ms'], 2),
+        'total_ms': round(timings['import_ms'] + timings['create_app_ms'], 2),
+        'heavy_modules': timings['loaded'],
+        'modules': sorted(modules, key=lambda module: module['cumulative_ms'], reverse=True)[:top],
+    }
+
+
+def main(argv=None):
+    """
+    Command line entry point: python -m jwtblogapp.startup --top 20 --max-ms 1000
+    """
+    parser = argparse.ArgumentParser(description='Blog app cold start report')
+    parser.add_argument('--top', type=int, default=20, help='Number of the slowest modules to show')
+    parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+    parser.add_argument('--max-ms', type=float, default=None,
+                        help='Exit with code 1 if the import and create_app time is above it')
+    arguments = parser.parse_args(argv)
+
+    report = startup_report(arguments.top)
+    if arguments.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f'import {report["import_ms"]} ms, create_app {report["create_app_ms"]} ms, '
+              f'total {report["total_ms"]} ms')
+        print(f'heavy modules loaded: {", ".join(report["heavy_modules"]) or "none"}')
+        print(f'{"cumulative ms":>14} {"self ms":>9}  module')
+        for module in report['modules']:
+            print(f'{module["cumulative_ms"]:>14.2f} {module["self_ms"]:>9.2f}  {"  " * module["level"]}'
+                  f'{module["module"]}')
+
+    if arguments.max_ms is not None and report['total_ms'] > arguments.max_ms:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,15 +1,41 @@
 import re
-import requests
-from flask import flash, jsonify, make_response, request, render_template, redirect, session, url_for
+from flask import Blueprint, current_app, flash, jsonify, make_response, request, render_template, redirect, session, \
+    url_for
 
-from jwtblogapp import app
 from jwtblogapp import jwt
-from flask_jwt_extended import jwt_required, get_jwt_identity, set_access_cookies, unset_jwt_cookies
+from jwtblogapp import services
+from flask_jwt_extended import jwt_required, get_jwt, get_jwt_identity, set_access_cookies, unset_jwt_cookies
 
 from jwtblogapp.forms import LoginForm, PostForm, RateForm
-from jwtblogapp.bot import BlogBot
 
-api_url = app.config['API_URL']
+# The web frontend views, registered in the app by create_app
+web = Blueprint('web', __name__)
+
+
+def call_api(endpoint, service, payload=None, method='post', token=None, **service_arguments):
+    """
+    Call the blog API for the web views. By default calls the service layer directly in the same worker,
+    if WEB_API_DISPATCH config is 'http' sends the loopback HTTP request to the API endpoint instead.
+
+    :param endpoint: Gets the API endpoint name
+    :param service: Gets the service function which serves the endpoint
+    :param payload: Gets the dictionary of the endpoint arguments, passed to the service as keyword arguments
+    :param method: Gets the HTTP method of the loopback request
+    :param token: Gets the JW token for the protected endpoints
+    :param service_arguments: Gets the additional keyword arguments of the service, e.g. the current user
+    :return: response body and status code
+    :rtype: tuple
+    """
+    payload = payload or {}
+    if current_app.config['WEB_API_DISPATCH'] == 'http':
+        # requests is imported only when it is used, it is not needed by the default local dispatch
+        import requests
+        headers = {'Authorization': f'Bearer {token}'} if token else None
+        response = requests.request(method, f"{current_app.config['API_URL']}{url_for(endpoint)}", headers=headers,
+                                    json=payload or None)
+        return response.json(), response.status_code
+
+    return service(**service_arguments, **payload)
 
 
 @jwt.expired_token_loader
@@ -25,7 +51,7 @@ def expired_token(jwt_header, jwt_payload):  # noqa
     match = re.search('web', request.full_path)
     if match:
         # make Flask response with redirect to login page
-        response = make_response(redirect(url_for('web_login')))
+        response = make_response(redirect(url_for('web.web_login')))
         # Reset logged in session
         session['logged'] = False
         # show notification message in a web page
@@ -48,7 +74,7 @@ def unauthorized_token(jwt_header, jwt_payload):  # noqa
     match = re.search('web', request.full_path)
     if match:
         # make Flask response with redirect to login page
-        response = make_response(redirect(url_for('web_login')))
+        response = make_response(redirect(url_for('web.web_login')))
         # Reset logged in session
         session['logged'] = False
         # show notification message in a web page
@@ -58,7 +84,30 @@ def unauthorized_token(jwt_header, jwt_payload):  # noqa
     return jsonify(msg='Your token is unauthorized!'), 401
 
 
-@app.route('/')
+@jwt.user_lookup_error_loader
+def unknown_user(jwt_header, jwt_payload):  # noqa
+    """
+    Callback for the token of an unknown user, e.g. deleted after the token was issued
+
+    :param jwt_header: a dictionary containing the header data of the JWT.
+    :param jwt_payload: a dictionary containing the payload data of the JWT.
+    :return: Flask HTML response object if request was from a browser user agent, otherwise returns the JSON response.
+    """
+    # check if a request was from a /web/ route
+    match = re.search('web', request.full_path)
+    if match:
+        # make Flask response with redirect to login page
+        response = make_response(redirect(url_for('web.web_login')))
+        # Reset logged in session
+        session['logged'] = False
+        # show notification message in a web page
+        flash('Your user is not found! Sign up or log in, please', 'danger')
+        return response
+
+    return jsonify(msg=f'Error loading the user {jwt_payload["sub"]}'), 401
+
+
+@web.route('/')
 @jwt_required(optional=True)
 def index():
     """
@@ -68,12 +117,12 @@ def index():
     """
     current_identity = get_jwt_identity()
     if current_identity and session['logged'] is True:
-        return redirect(url_for('blog'))
+        return redirect(url_for('web.blog'))
 
     return render_template('blog_base.j2')
 
 
-@app.route('/web/signup', methods=['GET', 'POST'])
+@web.route('/web/signup', methods=['GET', 'POST'])
 def web_signup():
     """
     View for signup page
@@ -89,24 +138,24 @@ def web_signup():
         password = form.password.data
         # request signup from API
         payload = {'username': username, 'password': password}
-        response = requests.post(f"{api_url}{url_for('api_signup_user')}", json=payload)
-        # check if user already exist
-        if response.status_code == 202:
+        body, status_code = call_api('api_signup_user', services.signup_user, payload)
+        # check if user already exist or the server is busy
+        if status_code != 200:
             form.username.data = ''
             form.password.data = ''
             # show notification message in a web page
-            flash(response.json()['msg'], 'danger')
+            flash(body['msg'], 'danger')
             # if already exists redirect to signup view
-            return redirect(url_for('web_signup'))
+            return redirect(url_for('web.web_signup'))
         # show notification message in a web page
-        flash(response.json()['msg'], 'success')
+        flash(body['msg'], 'success')
         # # if user successfully signed up, redirect to login view
-        return redirect(url_for('web_login'))
+        return redirect(url_for('web.web_login'))
     # render template for signup
     return render_template('blog_signup.j2', form=form)
 
 
-@app.route('/web/login', methods=['GET', 'POST'])
+@web.route('/web/login', methods=['GET', 'POST'])
 def web_login():
     """
     View for login page
@@ -123,21 +172,21 @@ def web_login():
         password = form.password.data
         # make login request from API
         payload = {'username': username, 'password': password}
-        response = requests.post(f"{api_url}{url_for('api_login_user')}", json=payload)
-        # check if login is not authenticate
-        if response.status_code == 401:
+        body, status_code = call_api('api_login_user', services.login_user, payload)
+        # check if login is not authenticate or the server is busy
+        if status_code != 200:
             # show notification message in a web page
-            flash(response.json()['msg'], 'danger')
+            flash(body['msg'], 'danger')
             # redirect to login view
-            return redirect(url_for('web_login'))
+            return redirect(url_for('web.web_login'))
         # if login is authenticated
 
         # Take token from JSON response
-        token = response.json()['token']
+        token = body['token']
         # show notification message in a web page
-        flash(response.json()['msg'], 'success')
+        flash(body['msg'], 'success')
         # make HTML response with saving token in cookies and redirection to blog view
-        response = make_response(redirect(url_for('blog')))
+        response = make_response(redirect(url_for('web.blog')))
         set_access_cookies(response, token)
         # Reset logged in session storage
         session['logged'] = True
@@ -146,7 +195,7 @@ def web_login():
     return render_template('blog_login.j2', form=form)
 
 
-@app.route('/web/logout', methods=['GET', 'POST'])
+@web.route('/web/logout', methods=['GET', 'POST'])
 @jwt_required()  # protect route
 def web_logout():
     """
@@ -157,12 +206,11 @@ def web_logout():
     # get token from cookies
     token = request.cookies.get('access_token_cookie')
     # request API logout endpoint
-    headers = {'Authorization': f'Bearer {token}'}
-    response = requests.post(f"{api_url}{url_for('api_logout_user')}", headers=headers)
+    body, _ = call_api('api_logout_user', services.logout_user, token=token, jwt_payload=get_jwt())
     # show notification message in a web page
-    flash(response.json()['msg'], 'warning')
+    flash(body['msg'], 'warning')
     # make HTML response with erasing token from cookies and redirection to index view
-    response = make_response(redirect(url_for('index')))
+    response = make_response(redirect(url_for('web.index')))
     unset_jwt_cookies(response)
     # Reset logged in session storage
     session['logged'] = False
@@ -170,7 +218,7 @@ def web_logout():
     return response
 
 
-@app.route('/web/blog', methods=['GET', 'POST'])
+@web.route('/web/blog', methods=['GET', 'POST'])
 @jwt_required()  # protect route
 def blog():
     """
@@ -178,47 +226,47 @@ def blog():
 
     :return: Flask HTML response object
     """
-    # get username
+    # get username and identity from the token
     current_user = get_jwt_identity()
+    identity = services.current_identity()
     # instantiate post form object
     form = PostForm()
     # instantiate rate form object
     rate_form = RateForm()
     # get token from cookies
     token = request.cookies.get('access_token_cookie')
-    headers = {'Authorization': f'Bearer {token}'}
     # checks if rate form was submitted
-    if rate_form.is_submitted() and rate_form.like.data:
-        # get values from form POST
-        post_id = rate_form.post_id.data
-        like = rate_form.like.data
-        # request API prostrating endpoint
-        payload = {'post_id': post_id, 'like': like}
-        response = requests.post(f"{api_url}{url_for('api_rating')}", headers=headers, json=payload)
-        # show notification message in a web page
-        flash(response.json()['msg'], 'success')
+    if rate_form.is_submitted() and 'like' in request.form:
+        if rate_form.validate():
+            # request API prostrating endpoint with values from form POST
+            payload = {'post_id': rate_form.post_id.data, 'like': rate_form.like.data}
+            body, _ = call_api('api_rating', services.rate_post, payload, token=token, identity=identity)
+            # show notification message in a web page
+            flash(body['msg'], 'success')
+        else:
+            flash('Bad rating request', 'danger')
         # response with redirect back to blog view
-        return redirect(url_for('blog'))
+        return redirect(url_for('web.blog'))
 
     if form.validate_on_submit():
         # get value from form POST
         post_text = form.post_text.data
         # request API posts endpoint to make new post
         payload = {'post_text': post_text}
-        response = requests.post(f"{api_url}{url_for('api_posts')}", headers=headers, json=payload)
+        body, _ = call_api('api_posts', services.create_post, payload, token=token, identity=identity)
         # show notification message in a web page
-        flash(response.json()['msg'], 'success')
+        flash(body['msg'], 'success')
         # response with redirect back to blog view
-        return redirect(url_for('blog'))
+        return redirect(url_for('web.blog'))
     # request API posts endpoint to obtain all posts data
-    response = requests.get(f"{api_url}{url_for('api_posts')}", headers=headers)
+    body, _ = call_api('api_posts', services.get_posts, method='get', token=token, identity=identity)
     # parse JSON
-    blog_posts = response.json()['posts']
+    blog_posts = body['posts']
     # render template for blog and make HTML response
     return render_template('blog_posts.j2', user=current_user, form=form, rate_form=rate_form, posts=blog_posts)
 
 
-@app.route('/web/bot')
+@web.route('/web/bot')
 @jwt_required()  # protect route
 def bot():
     """
@@ -226,10 +274,12 @@ def bot():
 
     :return: Flask HTML response object
     """
+    # the bot is imported only when it is run, so the web views do not import Faker
+    from jwtblogapp.bot import BlogBot
     # takes parameters from the app config file (config.py) and instantiate BlogBot object
-    blog_bot = BlogBot(api_url, number_of_users=app.config['BOT_NUMBER_OF_USERS'],
-                       max_posts_per_user=app.config['BOT_MAX_POSTS_PER_USER'],
-                       max_likes_per_user=app.config['BOT_MAX_LIKES_PER_USER'])
+    blog_bot = BlogBot(current_app.config['API_URL'], number_of_users=current_app.config['BOT_NUMBER_OF_USERS'],
+                       max_posts_per_user=current_app.config['BOT_MAX_POSTS_PER_USER'],
+                       max_likes_per_user=current_app.config['BOT_MAX_LIKES_PER_USER'])
     # run bot on the background
     blog_bot.background_run()
     # show notification message in a web page
@@ -238,7 +288,7 @@ def bot():
     return redirect(request.referrer)
 
 
-@app.route('/test')
+@web.route('/test')
 @jwt_required(optional=True)
 def test():
     current_user = get_jwt_identity()
@@ -0,0 +1,78 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from jwtblogapp.loadgen import LoadGenerator, parse_mix
+from tests.benchmarks.compare_serving import ROOT, summary, wait_for_port
+
+# Compares the throughput and latencies of the write requests with the per request commits and with the group
+# commit, by the same threaded gunicorn deployment on the same seeded database:
+#   python -m tests.benchmarks.compare_group_commit --workers 2 --threads 8 --users 32 --duration 30
+# the feed requests let the virtual users learn the posts ids to rate
+WRITE_MIX = 'feed=5,rate=75,post=20'
+MODES = {'per_request': '0', 'group': '1'}
+
+
+def run_server(group_commit, arguments, environment):
+    """
+    Start the server in the commit mode, run the load against it and stop it
+
+    :return: the load generator report
+    :rtype: dict
+    """
+    server = subprocess.Popen(['gunicorn', '-w', str(arguments.workers), '--threads', str(arguments.threads),
+                               '-b', f'127.0.0.1:{arguments.port}', 'jwtblogapp:app'], cwd=ROOT,
+                              env=dict(environment, GROUP_COMMIT_ENABLED=group_commit),
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for_port(arguments.port)
+        load_generator = LoadGenerator(f'http://127.0.0.1:{arguments.port}', users=arguments.users,
+                                       duration=arguments.duration, mix=arguments.mix, seed=arguments.seed)
+        return load_generator.run()
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare the per request commits with the group commit')
+    parser.add_argument('--workers', type=int, default=2, help='Worker processes')
+    parser.add_argument('--threads', type=int, default=8, help='Threads of every worker')
+    parser.add_argument('--users', type=int, default=32, help='Number of concurrent virtual users')
+    parser.add_argument('--duration', type=float, default=30, help='Load duration of each mode in seconds')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix(WRITE_MIX),
+                        help='Request mix like feed=5,rate=75,post=20')
+    parser.add_argument('--posts', type=int, default=10000, help='Number of seeded posts')
+    parser.add_argument('--database', default=None, help='Database URI, a temporary SQLite file by default')
+    parser.add_argument('--port', type=int, default=8091, help='Port of the server')
+    parser.add_argument('--seed', type=int, default=1, help='Random seed')
+    arguments = parser.parse_args(argv)
+
+    database_uri = arguments.database or f'sqlite:///{tempfile.mkdtemp()}/compare_group_commit.db'
+    environment = dict(os.environ, DATABASE_URI=database_uri, FLASK_APP='jwtblogapp',
+                       SECRET_KEY=os.getenv('SECRET_KEY', 'benchmark'),
+                       JWT_SECRET_KEY=os.getenv('JWT_SECRET_KEY', 'benchmark'))
+
+    subprocess.run([sys.executable, '-m', 'flask', 'init-db'], cwd=ROOT, env=environment, check=True,
+                   stdout=subprocess.DEVNULL)
+    results = {}
+    for mode, group_commit in MODES.items():
+        # every mode gets the same database content
+        subprocess.run([sys.executable, '-m', 'flask', 'seed', '--reset', '--posts', str(arguments.posts),
+                        '--users', str(max(10, arguments.posts // 100)), '--ratings', str(arguments.posts),
+                        '--seed', str(arguments.seed)], cwd=ROOT, env=environment, check=True,
+                       stdout=subprocess.DEVNULL)
+        results[mode] = summary(run_server(group_commit, arguments, environment))
+
+    results['group_to_per_request_throughput'] = round(
+        results['group']['throughput_rps'] / results['per_request']['throughput_rps'], 2) \
+        if results['per_request']['throughput_rps'] else None
+    print(json.dumps({'workers': arguments.workers, 'threads': arguments.threads, 'users': arguments.users,
+                      'duration_s': arguments.duration, 'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
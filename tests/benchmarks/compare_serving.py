@@ -0,0 +1,98 @@
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+from time import monotonic, sleep
+
+from jwtblogapp.loadgen import DEFAULT_MIX, LoadGenerator, parse_mix
+
+# Compares the throughput and latencies of the sync (gunicorn) and async (uvicorn) deployments of the API
+# with the same number of worker processes on the same seeded database:
+#   python -m tests.benchmarks.compare_serving --workers 4 --users 32 --duration 30
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SERVERS = {
+    'sync': lambda workers, port: ['gunicorn', '-w', str(workers), '-b', f'127.0.0.1:{port}', 'jwtblogapp:app'],
+    'async': lambda workers, port: ['uvicorn', 'asgi:app', '--workers', str(workers), '--host', '127.0.0.1',
+                                    '--port', str(port), '--no-access-log'],
+}
+
+
+def wait_for_port(port, timeout=30):
+    deadline = monotonic() + timeout
+    while monotonic() < deadline:
+        with socket.socket() as connection:
+            if connection.connect_ex(('127.0.0.1', port)) == 0:
+                return
+        sleep(0.2)
+    raise RuntimeError(f'Server did not start on port {port}')
+
+
+def run_server(mode, arguments, environment):
+    """
+    Start the server, run the load against it and stop it
+
+    :return: the load generator report
+    :rtype: dict
+    """
+    server = subprocess.Popen(SERVERS[mode](arguments.workers, arguments.port), cwd=ROOT, env=environment,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for_port(arguments.port)
+        load_generator = LoadGenerator(f'http://127.0.0.1:{arguments.port}', users=arguments.users,
+                                       duration=arguments.duration, mix=arguments.mix, seed=arguments.seed)
+        return load_generator.run()
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+def summary(report):
+    endpoints = report['endpoints']
+    requests = sum(endpoint['requests'] for endpoint in endpoints.values())
+    return {'throughput_rps': round(requests / report['duration_s'], 2),
+            'errors': sum(endpoint['errors'] for endpoint in endpoints.values()),
+            'endpoints': {name: {key: endpoint[key] for key in ('throughput_rps', 'p50_ms', 'p95_ms', 'p99_ms')}
+                          for name, endpoint in endpoints.items()}}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare the sync and async deployments of the blog API')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Worker processes of both servers')
+    parser.add_argument('--users', type=int, default=32, help='Number of concurrent virtual users')
+    parser.add_argument('--duration', type=float, default=30, help='Load duration of each server in seconds')
+    parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX, help='Request mix like feed=70,rate=25,post=5')
+    parser.add_argument('--posts', type=int, default=10000, help='Number of seeded posts')
+    parser.add_argument('--database', default=None, help='Database URI, a temporary SQLite file by default')
+    parser.add_argument('--port', type=int, default=8090, help='Port of the servers')
+    parser.add_argument('--seed', type=int, default=1, help='Random seed')
+    arguments = parser.parse_args(argv)
+
+    database_uri = arguments.database or f'sqlite:///{tempfile.mkdtemp()}/compare_serving.db'
+    environment = dict(os.environ, DATABASE_URI=database_uri, FLASK_APP='jwtblogapp',
+                       SECRET_KEY=os.getenv('SECRET_KEY', 'benchmark'),
+                       JWT_SECRET_KEY=os.getenv('JWT_SECRET_KEY', 'benchmark'))
+
+    subprocess.run([sys.executable, '-m', 'flask', 'init-db'], cwd=ROOT, env=environment, check=True,
+                   stdout=subprocess.DEVNULL)
+    results = {}
+    for mode in SERVERS:
+        # every server gets the same database content
+        subprocess.run([sys.executable, '-m', 'flask', 'seed', '--reset', '--posts', str(arguments.posts),
+                        '--users', str(max(10, arguments.posts // 100)), '--ratings', str(arguments.posts),
+                        '--seed', str(arguments.seed)], cwd=ROOT, env=environment, check=True,
+                       stdout=subprocess.DEVNULL)
+        results[mode] = summary(run_server(mode, arguments, environment))
+
+    results['async_to_sync_throughput'] = round(
+        results['async']['throughput_rps'] / results['sync']['throughput_rps'], 2) \
+        if results['sync']['throughput_rps'] else None
+    print(json.dumps({'workers': arguments.workers, 'users': arguments.users, 'duration_s': arguments.duration,
+                      'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
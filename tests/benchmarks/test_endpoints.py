@@ -0,0 +1,124 @@
+import json
+import os
+import statistics
+import uuid
+from time import perf_counter
+
+import pytest
+from flask_jwt_extended import create_access_token
+
+from jwtblogapp import app
+from jwtblogapp.querylog import QueryRecorder
+from jwtblogapp.seeding import DEFAULT_PASSWORD, Seeder, seed_username
+
+# The benchmarks replace the database content, so they run only on demand:
+#   RUN_BENCHMARKS=1 BENCHMARK_DATASETS=1000,100000,1000000 python -m pytest tests/benchmarks
+# BENCHMARK_UPDATE_BASELINE=1 writes the measured numbers to the baseline instead of comparing with it.
+pytestmark = pytest.mark.skipif(not os.getenv('RUN_BENCHMARKS'), reason='set RUN_BENCHMARKS=1 to run benchmarks')
+
+DATASETS = [int(size) for size in os.getenv('BENCHMARK_DATASETS', '1000').split(',')]
+ITERATIONS = int(os.getenv('BENCHMARK_ITERATIONS', '20'))
+# the full feed is not requested from datasets larger than this
+FULL_FEED_MAX_POSTS = int(os.getenv('BENCHMARK_FULL_FEED_MAX_POSTS', '100000'))
+BASELINE_PATH = os.getenv('BENCHMARK_BASELINE', os.path.join(os.path.dirname(__file__), 'baseline.json'))
+RESULTS_PATH = os.getenv('BENCHMARK_RESULTS', os.path.join(os.path.dirname(__file__), 'results.json'))
+
+client = app.test_client()
+results = {}
+
+
+def load_baseline() -> dict:
+    if not os.path.exists(BASELINE_PATH):
+        return {'thresholds': {'time_ratio': 2.0, 'extra_queries': 0}, 'results': {}}
+    with open(BASELINE_PATH) as baseline_file:
+        return json.load(baseline_file)
+
+
+@pytest.fixture(scope='module', params=DATASETS, ids=[f'{size}_posts' for size in DATASETS])
+def dataset(request) -> dict:
+    size = request.param
+    # one user per 100 posts, as many ratings and revoked tokens as posts
+    seeder = Seeder(users=max(10, size // 100), posts=size, ratings=size, revoked_tokens=size, expired_share=0)
+    with app.app_context():
+        report = seeder.run(reset=True, echo=lambda _: None)
+        user_ids = range(report['first_user_id'], report['first_user_id'] + report['users'])
+        usernames = [seed_username(user_id) for user_id in user_ids]
+        tokens = [create_access_token(identity=username, additional_claims={'user_id': user_id})
+                  for user_id, username in zip(user_ids, usernames)]
+    return {'size': size, 'usernames': usernames, 'tokens': tokens}
+
+
+@pytest.fixture(scope='module', autouse=True)
+def write_results():
+    yield
+    with open(RESULTS_PATH, 'w') as results_file:
+        json.dump(results, results_file, indent=2, sort_keys=True)
+    if os.getenv('BENCHMARK_UPDATE_BASELINE'):
+        baseline = load_baseline()
+        for size, operations in results.items():
+            baseline['results'].setdefault(size, {}).update(operations)
+        with open(BASELINE_PATH, 'w') as baseline_file:
+            json.dump(baseline, baseline_file, indent=2, sort_keys=True)
+
+
+def auth(dataset: dict, number: int) -> dict:
+    return {"Authorization": f'Bearer {dataset["tokens"][number % len(dataset["tokens"])]}'}
+
+
+def prepare_logout(dataset: dict, number: int):
+    # every logout revokes its own fresh token, it is made before the measurement
+    with app.app_context():
+        token = create_access_token(identity=dataset['usernames'][0], additional_claims={'user_id': 1})
+    return lambda: client.post('/api/logout', headers={"Authorization": f'Bearer {token}'})
+
+
+# Every operation takes the dataset and the iteration number and returns the request call to measure
+OPERATIONS = {
+    'signup': lambda dataset, number: lambda: client.post(
+        '/api/signup', json={'username': f'signup-{uuid.uuid4().hex}@example.com', 'password': DEFAULT_PASSWORD}),
+    'login': lambda dataset, number: lambda: client.post(
+        '/api/login', json={'username': dataset['usernames'][number % len(dataset['usernames'])],
+                            'password': DEFAULT_PASSWORD}),
+    'feed_page': lambda dataset, number: lambda: client.get(
+        '/api/posts?limit=20', headers=auth(dataset, number)),
+    'feed_deep_page': lambda dataset, number: lambda: client.get(
+        f'/api/posts?limit=20&before_id={dataset["size"] // 2}', headers=auth(dataset, number)),
+    'feed_full': lambda dataset, number: lambda: client.get(
+        '/api/posts', headers=auth(dataset, number)),
+    'post_create': lambda dataset, number: lambda: client.post(
+        '/api/posts', headers=auth(dataset, number), json={'post_text': f'Benchmark post {number}'}),
+    'rating': lambda dataset, number: lambda: client.post(
+        '/api/rating', headers=auth(dataset, number), json={'post_id': number % dataset['size'] + 1, 'like': 1}),
+    'logout': prepare_logout,
+}
+
+
+@pytest.mark.parametrize('operation', list(OPERATIONS))
+def test_endpoint_benchmark(dataset: dict, operation: str) -> None:
+    if operation == 'feed_full' and dataset['size'] > FULL_FEED_MAX_POSTS:
+        pytest.skip('the full feed is not requested from large datasets')
+
+    durations, queries = [], []
+    for number in range(ITERATIONS):
+        call = OPERATIONS[operation](dataset, number)
+        with QueryRecorder() as recorder:
+            started = perf_counter()
+            response = call()
+            durations.append((perf_counter() - started) * 1000)
+        assert response.status_code < 400, response.data
+        queries.append(recorder.count)
+
+    measured = {'median_ms': round(statistics.median(durations), 3),
+                'p95_ms': round(sorted(durations)[int(len(durations) * 0.95) - 1], 3),
+                'queries': max(queries)}
+    results.setdefault(str(dataset['size']), {})[operation] = measured
+
+    baseline = load_baseline()
+    expected = baseline['results'].get(str(dataset['size']), {}).get(operation)
+    if expected is None or os.getenv('BENCHMARK_UPDATE_BASELINE'):
+        return
+    thresholds = baseline['thresholds']
+    assert measured['queries'] <= expected['queries'] + thresholds['extra_queries'], \
+        f'{operation} runs {measured["queries"]} queries, baseline is {expected["queries"]}'
+    assert measured['median_ms'] <= expected['median_ms'] * thresholds['time_ratio'], \
+        f'{operation} median is {measured["median_ms"]} ms, baseline is {expected["median_ms"]} ms'
@@ -1,5 +1,16 @@
+import pytest
+
+from jwtblogapp import app, database
+
 pytest_plugins = (
     'tests.fixtures.auth',
     'tests.fixtures.posts',
     'tests.fixtures.endpoints',
 )
+
+
+@pytest.fixture(scope='session', autouse=True)
+def database_schema() -> None:
+    # the app does not create the schema itself, 'flask init-db' does it before the app is started
+    with app.app_context():
+        database.create_all()
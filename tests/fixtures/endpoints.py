@@ -19,3 +19,8 @@ def logout_url_path() -> str:
 @pytest.fixture()
 def posts_url_path() -> str:
     return '/api/posts'
+
+
+@pytest.fixture()
+def rating_url_path() -> str:
+    return '/api/rating'
@@ -1,3 +1,5 @@
+from flask_jwt_extended import create_access_token
+
 from jwtblogapp import app
 
 client = app.test_client()
@@ -100,6 +102,18 @@ def test_api_logout_user_expired_token(user_expired_token: dict,
     assert 'expired' in result.json['msg']
 
 
+def test_api_token_of_deleted_user_returned_unauthorized(posts_url_path: str,
+                                                         rating_url_path: str) -> None:
+    # the older tokens without the 'user_id' claim are resolved by username
+    with app.app_context():
+        token = create_access_token(identity='deleted@example.com')
+    headers = {"Authorization": f'Bearer {token}'}
+    result = client.get(posts_url_path, headers=headers)
+    assert (result.status_code, result.json) == (401, {"msg": "Error loading the user deleted@example.com"})
+    assert client.post(posts_url_path, headers=headers, json={"post_text": "Orphan post"}).status_code == 401
+    assert client.post(rating_url_path, headers=headers, json={"post_id": 1, "like": 1}).status_code == 401
+
+
 def test_blank_api_signup_returned_bad_request_code(signup_url_path) -> None:
     result = client.post(signup_url_path)
     assert result.status_code == 400
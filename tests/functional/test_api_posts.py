@@ -1,4 +1,14 @@
-from jwtblogapp import app
+import csv
+import gzip
+import io
+import json
+
+from datetime import datetime
+
+from jwtblogapp import app, database
+from jwtblogapp.models import FeedEvent, FeedVersion, Post
+from sqlalchemy.exc import OperationalError
+from flask_jwt_extended import create_access_token
 
 client = app.test_client()
 
@@ -50,3 +60,203 @@ def test_api_posts_user_can_not_post_empty_message(user_credentials: dict,
                          )
     assert result.status_code == 200
     assert 'successfully created' in result.json['msg']
+
+
+def test_api_posts_user_can_get_posts_by_pages(user_credentials: dict,
+                                               user_post_body: dict,
+                                               login_url_path: str,
+                                               posts_url_path: str
+                                               ) -> None:
+    result = client.post(login_url_path,
+                         json=user_credentials)
+    headers = {"Authorization": f'Bearer {result.json["token"]}'}
+    client.post(posts_url_path, headers=headers, json=user_post_body)
+    all_posts = client.get(posts_url_path, headers=headers).json["posts"]
+
+    result = client.get(f'{posts_url_path}?limit=2', headers=headers)
+    assert result.status_code == 200
+    assert [post["post_id"] for post in result.json["posts"]] == [all_posts[-1]["post_id"], all_posts[-2]["post_id"]]
+    assert result.json["next_cursor"]
+
+    page_ids = []
+    cursor = None
+    while True:
+        query = f'?limit=2&cursor={cursor}' if cursor else '?limit=2'
+        result = client.get(f'{posts_url_path}{query}', headers=headers)
+        page_ids += [post["post_id"] for post in result.json["posts"]]
+        cursor = result.json["next_cursor"]
+        if cursor is None:
+            break
+    assert page_ids == [post["post_id"] for post in reversed(all_posts)]
+
+
+def test_api_posts_bad_cursor_returned_bad_request_code(user_credentials: dict,
+                                                        login_url_path: str,
+                                                        posts_url_path: str
+                                                        ) -> None:
+    result = client.post(login_url_path,
+                         json=user_credentials)
+    result = client.get(f'{posts_url_path}?cursor=bad',
+                        headers={"Authorization": f'Bearer {result.json["token"]}'})
+    assert result.status_code == 400
+
+
+def test_api_posts_user_can_post_with_token_without_user_id_claim(user_credentials: dict,
+                                                                  user_post_body: dict,
+                                                                  posts_url_path: str
+                                                                  ) -> None:
+    with app.app_context():
+        token = create_access_token(identity=user_credentials["username"])
+    result = client.post(posts_url_path,
+                         headers={"Authorization": f'Bearer {token}'},
+                         json=user_post_body
+                         )
+    assert result.status_code == 200
+    result = client.get(f'{posts_url_path}?limit=1',
+                        headers={"Authorization": f'Bearer {token}'})
+    assert result.json["posts"][0]["username"] == user_credentials["username"]
+    assert result.json["posts"][0]["user_id"] == 1
+
+
+def test_api_posts_not_modified_feed_returned_not_modified_code(user_credentials: dict,
+                                                                user_post_body: dict,
+                                                                login_url_path: str,
+                                                                posts_url_path: str
+                                                                ) -> None:
+    result = client.post(login_url_path,
+                         json=user_credentials)
+    headers = {"Authorization": f'Bearer {result.json["token"]}'}
+    result = client.get(posts_url_path, headers=headers)
+    etag = result.headers["ETag"]
+
+    result = client.get(posts_url_path, headers=dict(headers, **{"If-None-Match": etag}))
+    assert result.status_code == 304
+    assert not result.data
+
+    client.post(posts_url_path, headers=headers, json=user_post_body)
+    result = client.get(posts_url_path, headers=dict(headers, **{"If-None-Match": etag}))
+    assert result.status_code == 200
+    assert result.headers["ETag"] != etag
+
+
+def test_api_posts_import_inserts_posts_by_batches_and_reports_line_errors(monkeypatch,
+                                                                           user_credentials: dict,
+                                                                           login_url_path: str,
+                                                                           posts_url_path: str
+                                                                           ) -> None:
+    monkeypatch.setitem(app.config, 'POSTS_IMPORT_BATCH_SIZE', 2)
+    monkeypatch.setitem(app.config, 'POSTS_IMPORT_MAX_LINE_BYTES', 100)
+    result = client.post(login_url_path,
+                         json=user_credentials)
+    headers = {"Authorization": f'Bearer {result.json["token"]}'}
+    lines = [json.dumps({"post_text": "Imported 1"}),
+             'not json',
+             '',
+             json.dumps({"post_text": "Imported 2", "created_time": "2015-05-01T10:20:30"}),
+             json.dumps({"post_text": "x" * 200}),
+             json.dumps({"created_time": "2015-05-01"}),
+             json.dumps({"post_text": "Imported 3", "created_time": "yesterday"}),
+             json.dumps({"post_text": "Imported 3"})]
+    result = client.post(f'{posts_url_path}/import', headers=headers, data='\n'.join(lines).encode(),
+                         content_type='application/x-ndjson')
+    assert result.status_code == 200
+    assert result.mimetype == 'application/x-ndjson'
+    reports = [json.loads(line) for line in result.get_data(as_text=True).splitlines()]
+    assert [report["line"] for report in reports if "error" in report] == [2, 5, 6, 7]
+    assert [report for report in reports if "imported" in report and "done" not in report] == [
+        {"imported": 2, "line": 4}]
+    assert reports[-1] == {"done": True, "imported": 3, "errors": 4, "failed": 0, "lines": 8}
+
+    posts = client.get(f'{posts_url_path}?limit=3', headers=headers).json["posts"]
+    assert [post["post_text"] for post in posts] == ["Imported 3", "Imported 2", "Imported 1"]
+    assert posts[1]["created_time"] == "01-05-2015 10:20:30"
+    # the streaming clients get the imported posts like the created ones
+    with app.app_context():
+        events = FeedEvent.after(0, 100000)
+    assert [json.loads(event["data"])["post_id"] for event in events if event["event"] == "post_created"][-3:] == \
+        sorted(post["post_id"] for post in posts)
+
+
+def test_api_posts_import_reports_lines_of_failed_batch(monkeypatch,
+                                                        user_credentials: dict,
+                                                        login_url_path: str,
+                                                        posts_url_path: str
+                                                        ) -> None:
+    monkeypatch.setitem(app.config, 'POSTS_IMPORT_BATCH_SIZE', 2)
+    bump = FeedVersion.bump
+    calls = []
+
+    def failing_bump():
+        calls.append(1)
+        if len(calls) == 2:
+            raise OperationalError('UPDATE feed_version', {}, Exception('Lock wait timeout exceeded'))
+        bump()
+
+    monkeypatch.setattr(FeedVersion, 'bump', staticmethod(failing_bump))
+    result = client.post(login_url_path,
+                         json=user_credentials)
+    headers = {"Authorization": f'Bearer {result.json["token"]}'}
+    lines = [json.dumps({"post_text": f"Batch import {number}"}) for number in range(1, 6)]
+    result = client.post(f'{posts_url_path}/import', headers=headers, data='\n'.join(lines).encode(),
+                         content_type='application/x-ndjson')
+    reports = [json.loads(line) for line in result.get_data(as_text=True).splitlines()]
+    assert {"error": "Database error, the lines are not imported", "not_imported": [3, 4]} in reports
+    assert reports[-1] == {"done": True, "imported": 3, "errors": 0, "failed": 2, "lines": 5}
+    posts = client.get(f'{posts_url_path}?limit=3', headers=headers).json["posts"]
+    assert [post["post_text"] for post in posts] == ["Batch import 5", "Batch import 2", "Batch import 1"]
+
+
+def test_api_posts_export_streams_all_posts_as_ndjson_or_gzipped_csv(monkeypatch,
+                                                                    user_credentials: dict,
+                                                                    login_url_path: str,
+                                                                    posts_url_path: str
+                                                                    ) -> None:
+    monkeypatch.setitem(app.config, 'EXPORT_BATCH_SIZE', 2)
+    result = client.post(login_url_path,
+                         json=user_credentials)
+    headers = {"Authorization": f'Bearer {result.json["token"]}'}
+    posts = client.get(posts_url_path, headers=headers).json["posts"]
+
+    result = client.get(f'{posts_url_path}/export', headers=headers)
+    assert result.status_code == 200
+    assert result.mimetype == 'application/x-ndjson'
+    assert result.is_streamed
+    exported = [json.loads(line) for line in result.get_data(as_text=True).splitlines()]
+    assert [post["post_id"] for post in exported] == sorted(post["post_id"] for post in posts)
+    assert exported[-1]["post_text"] == {post["post_id"]: post for post in posts}[exported[-1]["post_id"]]["post_text"]
+    assert "like_it" not in exported[-1]
+
+    result = client.get(f'{posts_url_path}/export?format=csv', headers=dict(headers, **{"Accept-Encoding": "gzip"}))
+    assert result.status_code == 200
+    assert result.mimetype == 'text/csv'
+    assert result.headers["Content-Encoding"] == 'gzip'
+    rows = list(csv.DictReader(io.StringIO(gzip.decompress(result.data).decode())))
+    assert [int(row["post_id"]) for row in rows] == [post["post_id"] for post in exported]
+    assert rows[-1]["created_time"] == exported[-1]["created_time"]
+
+    assert client.get(f'{posts_url_path}/export?format=xml', headers=headers).status_code == 400
+
+
+def test_api_posts_feed_is_not_stale_after_write_of_other_worker(user_credentials: dict,
+                                                                 login_url_path: str,
+                                                                 posts_url_path: str
+                                                                 ) -> None:
+    result = client.post(login_url_path,
+                         json=user_credentials)
+    headers = {"Authorization": f'Bearer {result.json["token"]}'}
+    result = client.get(posts_url_path, headers=headers)
+    etag = result.headers["ETag"]
+
+    # the write of another worker does not invalidate the feed cache of this one
+    with app.app_context():
+        FeedVersion.bump()
+        database.session.add(Post(user_id=1, username='other@example.com', text='Post of other worker', likes=0,
+                                  dislikes=0, created_time=datetime.now()))
+        database.session.commit()
+
+    result = client.get(posts_url_path, headers=dict(headers, **{"If-None-Match": etag}))
+    assert result.status_code == 200
+    assert result.headers["ETag"] != etag
+    assert 'Post of other worker' in [post["post_text"] for post in result.json["posts"]]
+    result = client.get(f'{posts_url_path}?limit=1', headers=headers)
+    assert result.json["posts"][0]["post_text"] == 'Post of other worker'
@@ -0,0 +1,144 @@
+import json
+
+from jwtblogapp import app
+from jwtblogapp.querylog import QueryRecorder
+
+client = app.test_client()
+
+
+def test_api_rating_user_can_like_dislike_and_reset_post(user_credentials: dict,
+                                                         user_post_body: dict,
+                                                         login_url_path: str,
+                                                         posts_url_path: str,
+                                                         rating_url_path: str
+                                                         ) -> None:
+    result = client.post(login_url_path,
+                         json=user_credentials)
+    headers = {"Authorization": f'Bearer {result.json["token"]}'}
+    client.post(posts_url_path, headers=headers, json=user_post_body)
+    post = client.get(f'{posts_url_path}?limit=1', headers=headers).json["posts"][0]
+
+    result = client.post(rating_url_path, headers=headers, json={"post_id": post["post_id"], "like": 1})
+    assert result.status_code == 200
+    assert 'successfully created' in result.json['msg']
+    assert (result.json["like_it"], result.json["likes"], result.json["dislikes"]) == (1, 1, 0)
+
+    result = client.post(rating_url_path, headers=headers, json={"post_id": post["post_id"], "like": 0})
+    assert 'Dislike' in result.json['msg']
+    assert (result.json["like_it"], result.json["likes"], result.json["dislikes"]) == (-1, 0, 1)
+
+    result = client.post(rating_url_path, headers=headers, json={"post_id": post["post_id"], "like": 0})
+    assert 'indifferent' in result.json['msg']
+    assert (result.json["like_it"], result.json["likes"], result.json["dislikes"]) == (0, 0, 0)
+
+    result = client.post(rating_url_path, headers=headers, json={"post_id": post["post_id"], "like": 1})
+    assert 'successfully created' in result.json['msg']
+    post = client.get(f'{posts_url_path}?limit=1', headers=headers).json["posts"][0]
+    assert (post["like_it"], post["likes"], post["dislikes"]) == (1, 1, 0)
+
+
+def test_api_rating_not_existing_post_returned_not_found_code(user_credentials: dict,
+                                                             login_url_path: str,
+                                                             rating_url_path: str
+                                                             ) -> None:
+    result = client.post(login_url_path,
+                         json=user_credentials)
+    result = client.post(rating_url_path,
+                         headers={"Authorization": f'Bearer {result.json["token"]}'},
+                         json={"post_id": 100000, "like": 1})
+    assert result.status_code == 404
+
+
+def test_api_rating_and_feed_page_query_counts(user_credentials: dict,
+                                               login_url_path: str,
+                                               posts_url_path: str,
+                                               rating_url_path: str
+                                               ) -> None:
+    result = client.post(login_url_path,
+                         json=user_credentials)
+    headers = {"Authorization": f'Bearer {result.json["token"]}'}
+    post = client.get(f'{posts_url_path}?limit=1', headers=headers).json["posts"][0]
+
+    with QueryRecorder() as recorder:
+        client.post(rating_url_path, headers=headers, json={"post_id": post["post_id"], "like": 1})
+    # the feed version bump, the rating lock, the counts update returning the counts, the upsert and the event
+    recorder.assert_max_queries(5)
+
+    with QueryRecorder() as recorder:
+        client.get(f'{posts_url_path}?limit=20', headers=headers)
+    # the feed version, the page of posts and the user's ratings of the page
+    recorder.assert_max_queries(3)
+
+
+def test_api_rating_batch_applies_ratings_and_reports_every_item(user_credentials: dict,
+                                                                 login_url_path: str,
+                                                                 posts_url_path: str,
+                                                                 rating_url_path: str
+                                                                 ) -> None:
+    result = client.post(login_url_path,
+                         json=user_credentials)
+    headers = {"Authorization": f'Bearer {result.json["token"]}'}
+    client.post(posts_url_path, headers=headers, json={"post_text": "First batch rated post"})
+    client.post(posts_url_path, headers=headers, json={"post_text": "Second batch rated post"})
+    second, first = [post["post_id"] for post in client.get(f'{posts_url_path}?limit=2', headers=headers).json["posts"]]
+
+    ratings = [{"post_id": first, "like": 1}, {"post_id": 100000, "like": 1}, {"post_id": second, "like": 0},
+               {"post_id": "first", "like": 1}, {"post_id": first, "like": 0}]
+    with QueryRecorder() as recorder:
+        result = client.post(f'{rating_url_path}/batch', headers=headers, json={"ratings": ratings})
+    assert result.status_code == 200
+    results = result.json["results"]
+    assert [item["status"] for item in results] == [200, 404, 200, 400, 200]
+    assert (results[0]["like_it"], results[2]["like_it"], results[4]["like_it"]) == (1, -1, -1)
+    # the counts are the ones after the whole batch
+    assert (results[4]["likes"], results[4]["dislikes"]) == (0, 1)
+    assert 'Dislike' in results[4]["msg"]
+    # one statement per query whatever the number of ratings, and a rating upsert per affected post
+    recorder.assert_max_queries(10)
+
+    posts = client.get(f'{posts_url_path}?limit=2', headers=headers).json["posts"]
+    assert [(post["like_it"], post["likes"], post["dislikes"]) for post in posts] == [(-1, 0, 1), (-1, 0, 1)]
+
+
+def test_api_rating_batch_without_valid_ratings_changes_nothing(user_credentials: dict,
+                                                                login_url_path: str,
+                                                                rating_url_path: str
+                                                                ) -> None:
+    result = client.post(login_url_path,
+                         json=user_credentials)
+    headers = {"Authorization": f'Bearer {result.json["token"]}'}
+    result = client.post(f'{rating_url_path}/batch', headers=headers,
+                         json={"ratings": [{"post_id": 100000, "like": 1}, {"like": 1}]})
+    assert [item["status"] for item in result.json["results"]] == [404, 400]
+
+    result = client.post(f'{rating_url_path}/batch', headers=headers, json={"ratings": [{}] * 101})
+    assert result.status_code == 400
+
+
+def test_api_rating_export_streams_only_own_ratings(user_credentials: dict,
+                                                   login_url_path: str,
+                                                   posts_url_path: str,
+                                                   rating_url_path: str
+                                                   ) -> None:
+    result = client.post(login_url_path,
+                         json=user_credentials)
+    headers = {"Authorization": f'Bearer {result.json["token"]}'}
+    post_id = client.get(f'{posts_url_path}?limit=1', headers=headers).json["posts"][0]["post_id"]
+    client.post(rating_url_path, headers=headers, json={"post_id": post_id, "like": 1})
+    other_credentials = {"username": "exporter@example.com", "password": "Secret123"}
+    client.post('/api/signup', json=other_credentials)
+    other = client.post(login_url_path, json=other_credentials)
+    client.post(rating_url_path, headers={"Authorization": f'Bearer {other.json["token"]}'},
+                json={"post_id": post_id, "like": 0})
+
+    result = client.get(f'{posts_url_path}/export?table=ratings', headers=headers)
+    ratings = [json.loads(line) for line in result.get_data(as_text=True).splitlines()]
+    assert len({rating["user_id"] for rating in ratings}) == 1
+    assert {"post_id": post_id, "value": 1}.items() <= [rating for rating in ratings
+                                                       if rating["post_id"] == post_id][0].items()
+    assert all(rating["value"] in (1, -1) for rating in ratings)
+
+    # rating the post the same way again makes it indifferent, so it is not exported
+    client.post(rating_url_path, headers=headers, json={"post_id": post_id, "like": 1})
+    result = client.get(f'{posts_url_path}/export?table=ratings', headers=headers)
+    assert post_id not in [json.loads(line)["post_id"] for line in result.get_data(as_text=True).splitlines()]
@@ -0,0 +1,112 @@
+import json
+import os
+
+import pytest
+
+from jwtblogapp import app, event_broker
+from jwtblogapp.models import FeedEvent
+
+client = app.test_client()
+
+
+@pytest.fixture()
+def events_url_path() -> str:
+    return '/api/posts/events'
+
+
+@pytest.fixture()
+def broker(monkeypatch):
+    # the test polls the events table itself instead of the background thread
+    monkeypatch.setattr(event_broker, 'pid', os.getpid())
+    monkeypatch.setattr(event_broker, 'stream_timeout', 0.2)
+    return event_broker
+
+
+def parse_events(text):
+    events = []
+    for message in text.split('\n\n'):
+        fields = dict(line.split(': ', 1) for line in message.splitlines() if not line.startswith(':'))
+        if 'event' in fields:
+            events.append({'id': int(fields['id']), 'event': fields['event'], 'data': json.loads(fields['data'])})
+    return events
+
+
+def login_headers(user_credentials, login_url_path):
+    result = client.post(login_url_path, json=user_credentials)
+    return {"Authorization": f'Bearer {result.json["token"]}'}
+
+
+def test_api_events_stream_resumes_after_last_event_id(broker,
+                                                       user_credentials: dict,
+                                                       login_url_path: str,
+                                                       posts_url_path: str,
+                                                       rating_url_path: str,
+                                                       events_url_path: str
+                                                       ) -> None:
+    headers = login_headers(user_credentials, login_url_path)
+    client.post(posts_url_path, headers=headers, json={"post_text": "Streamed post"})
+    post = client.get(f'{posts_url_path}?limit=1', headers=headers).json["posts"][0]
+    client.post(rating_url_path, headers=headers, json={"post_id": post["post_id"], "like": 1})
+    with app.app_context():
+        broker.poll()
+
+    result = client.get(events_url_path, headers=dict(headers, **{"Last-Event-ID": "0"}))
+    assert result.status_code == 200
+    assert result.mimetype == 'text/event-stream'
+    events = parse_events(result.get_data(as_text=True))
+    created = [event for event in events if event['event'] == 'post_created'][-1]
+    assert created['data']['post_text'] == "Streamed post"
+    assert events[-1]['event'] == 'rating_changed'
+    assert events[-1]['data'] == {'post_id': post["post_id"], 'likes': 1, 'dislikes': 0}
+
+    result = client.get(f'{events_url_path}?last_event_id={created["id"]}', headers=headers)
+    assert parse_events(result.get_data(as_text=True)) == events[-1:]
+
+
+def test_api_events_stream_without_last_event_id_sends_new_events_only(broker,
+                                                                       user_credentials: dict,
+                                                                       login_url_path: str,
+                                                                       events_url_path: str
+                                                                       ) -> None:
+    headers = login_headers(user_credentials, login_url_path)
+    result = client.get(events_url_path, headers=headers)
+    assert result.get_data(as_text=True) == f'retry: {broker.retry_ms}\n\n: keepalive\n\n'
+
+
+def test_api_events_stream_resets_client_behind_pruned_log(broker,
+                                                           user_credentials: dict,
+                                                           login_url_path: str,
+                                                           posts_url_path: str,
+                                                           events_url_path: str
+                                                           ) -> None:
+    headers = login_headers(user_credentials, login_url_path)
+    client.post(posts_url_path, headers=headers, json={"post_text": "First post"})
+    client.post(posts_url_path, headers=headers, json={"post_text": "Second post"})
+    with app.app_context():
+        broker.poll()
+        FeedEvent.prune(1)
+    broker.buffer.clear()
+
+    result = client.get(events_url_path, headers=dict(headers, **{"Last-Event-ID": "0"}))
+    events = parse_events(result.get_data(as_text=True))
+    assert events[0]['event'] == 'reset'
+    assert events[0]['id'] == broker.last_id
+    assert len(events) == 1
+
+
+def test_api_events_log_is_pruned_by_writes_without_stream_clients(monkeypatch,
+                                                                   user_credentials: dict,
+                                                                   login_url_path: str,
+                                                                   posts_url_path: str
+                                                                   ) -> None:
+    # no client is connected, so the polling thread of the worker is not started
+    monkeypatch.setattr(event_broker, 'pid', None)
+    monkeypatch.setattr(event_broker, 'published', 0)
+    monkeypatch.setattr(event_broker, 'buffer_size', 2)
+    monkeypatch.setattr(event_broker, 'log_size', 3)
+    headers = login_headers(user_credentials, login_url_path)
+    for number in range(6):
+        client.post(posts_url_path, headers=headers, json={"post_text": f"Unstreamed post {number}"})
+    assert event_broker.pid is None
+    with app.app_context():
+        assert FeedEvent.query.count() == 3
@@ -0,0 +1,107 @@
+import json
+
+import pytest
+
+from jwtblogapp import app
+
+client = app.test_client()
+
+
+@pytest.fixture()
+def changes_url_path() -> str:
+    return '/api/posts/changes'
+
+
+def login_headers(credentials, login_url_path):
+    result = client.post(login_url_path, json=credentials)
+    return {"Authorization": f'Bearer {result.json["token"]}'}
+
+
+def test_api_changes_return_new_posts_and_counts_changes(user_credentials: dict,
+                                                         signup_url_path: str,
+                                                         login_url_path: str,
+                                                         posts_url_path: str,
+                                                         rating_url_path: str,
+                                                         changes_url_path: str
+                                                         ) -> None:
+    headers = login_headers(user_credentials, login_url_path)
+    version = client.get(f'{changes_url_path}?since=0', headers=headers).json["version"]
+
+    client.post(posts_url_path, headers=headers, json={"post_text": "Synced post"})
+    result = client.get(f'{changes_url_path}?since={version}', headers=headers)
+    assert result.status_code == 200
+    assert [post["post_text"] for post in result.json["posts"]] == ["Synced post"]
+    assert result.json["like_it_changes"] == []
+    assert result.json["version"] > version
+    post_id, version = result.json["posts"][0]["post_id"], result.json["version"]
+
+    client.post(rating_url_path, headers=headers, json={"post_id": post_id, "like": 1})
+    result = client.get(f'{changes_url_path}?since={version}', headers=headers)
+    assert [(post["post_id"], post["likes"], post["like_it"]) for post in result.json["posts"]] == [(post_id, 1, 1)]
+    assert result.json["like_it_changes"] == [{"post_id": post_id, "like_it": 1}]
+    version = result.json["version"]
+
+    # the other user's rating changes the counts only, the user's rating is still returned with the post
+    other_credentials = {"username": "syncer@mtv.tv", "password": "password"}
+    client.post(signup_url_path, json=other_credentials)
+    client.post(rating_url_path, headers=login_headers(other_credentials, login_url_path),
+                json={"post_id": post_id, "like": 1})
+    result = client.get(f'{changes_url_path}?since={version}', headers=headers)
+    assert [(post["post_id"], post["likes"], post["like_it"]) for post in result.json["posts"]] == [(post_id, 2, 1)]
+    assert result.json["like_it_changes"] == []
+
+    result = client.get(f'{changes_url_path}?since={result.json["version"]}', headers=headers)
+    assert result.json["posts"] == []
+
+
+def test_api_changes_are_limited_and_continued_by_version(user_credentials: dict,
+                                                          login_url_path: str,
+                                                          posts_url_path: str,
+                                                          changes_url_path: str
+                                                          ) -> None:
+    headers = login_headers(user_credentials, login_url_path)
+    version = client.get(f'{changes_url_path}?since=0', headers=headers).json["version"]
+    client.post(posts_url_path, headers=headers, json={"post_text": "First synced"})
+    client.post(posts_url_path, headers=headers, json={"post_text": "Second synced"})
+
+    result = client.get(f'{changes_url_path}?since={version}&limit=1', headers=headers)
+    assert [post["post_text"] for post in result.json["posts"]] == ["First synced"]
+    assert result.json["has_more"] is True
+
+    result = client.get(f'{changes_url_path}?since={result.json["version"]}&limit=1', headers=headers)
+    assert [post["post_text"] for post in result.json["posts"]] == ["Second synced"]
+    assert result.json["has_more"] is False
+
+
+def test_api_changes_are_continued_within_version_of_many_posts(user_credentials: dict,
+                                                              login_url_path: str,
+                                                              posts_url_path: str,
+                                                              changes_url_path: str
+                                                              ) -> None:
+    headers = login_headers(user_credentials, login_url_path)
+    version = client.get(f'{changes_url_path}?since=0', headers=headers).json["version"]
+    # the import batch creates the posts with one version
+    lines = [json.dumps({"post_text": f"Batch synced {number}"}) for number in range(3)]
+    client.post(f'{posts_url_path}/import', headers=headers, data='\n'.join(lines).encode(),
+                content_type='application/x-ndjson')
+
+    texts, after_id, has_more = [], None, True
+    while has_more:
+        query = f'since={version}&limit=2' + (f'&after_id={after_id}' if after_id is not None else '')
+        result = client.get(f'{changes_url_path}?{query}', headers=headers).json
+        texts += [post["post_text"] for post in result["posts"]]
+        version, after_id, has_more = result["version"], result["after_id"], result["has_more"]
+    assert texts == ["Batch synced 0", "Batch synced 1", "Batch synced 2"]
+    assert after_id is None
+
+
+def test_api_changes_with_version_ahead_of_feed_return_conflict(user_credentials: dict,
+                                                                login_url_path: str,
+                                                                changes_url_path: str
+                                                                ) -> None:
+    headers = login_headers(user_credentials, login_url_path)
+    version = client.get(f'{changes_url_path}?since=0', headers=headers).json["version"]
+    result = client.get(f'{changes_url_path}?since={version + 1}', headers=headers)
+    assert result.status_code == 409
+    result = client.get(changes_url_path, headers=headers)
+    assert result.status_code == 400
@@ -0,0 +1,141 @@
+import asyncio
+import json
+
+import pytest
+from flask_jwt_extended import create_access_token
+from sqlalchemy import event
+
+from jwtblogapp import app
+from jwtblogapp.asgi import async_database_uri, create_asgi_app
+
+
+class AsgiClient:
+    """
+    Calls the ASGI application in the event loop of the test
+    """
+
+    def __init__(self, asgi_app):
+        self.app = asgi_app
+        self.loop = asyncio.new_event_loop()
+
+    def lifespan(self, event: str) -> None:
+        messages = asyncio.Queue()
+
+        async def receive():
+            return {'type': f'lifespan.{event}'}
+
+        async def send(message):
+            await messages.put(message)
+
+        async def run():
+            task = asyncio.ensure_future(self.app({'type': 'lifespan'}, receive, send))
+            message = await messages.get()
+            task.cancel()
+            return message
+
+        assert self.loop.run_until_complete(run())['type'] == f'lifespan.{event}.complete'
+
+    def request(self, method: str, path: str, json_body=None, headers=None) -> tuple:
+        path, _, query_string = path.partition('?')
+        body = b'' if json_body is None else json.dumps(json_body).encode()
+        raw_headers = [(name.lower().encode(), value.encode()) for name, value in (headers or {}).items()]
+        if json_body is not None:
+            raw_headers.append((b'content-type', b'application/json'))
+        scope = {'type': 'http', 'method': method, 'path': path, 'query_string': query_string.encode(),
+                 'headers': raw_headers}
+        sent = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+
+        async def send(message):
+            sent.append(message)
+
+        self.loop.run_until_complete(self.app(scope, receive, send))
+        status = sent[0]['status']
+        response_headers = {name.decode(): value.decode() for name, value in sent[0]['headers']}
+        payload = sent[1]['body']
+        return status, json.loads(payload) if payload else None, response_headers
+
+
+@pytest.fixture(scope='module')
+def asgi_client(tmp_path_factory) -> AsgiClient:
+    database_path = tmp_path_factory.mktemp('asgi') / 'blog.db'
+    client = AsgiClient(create_asgi_app({'ASYNC_DATABASE_URI': f'sqlite+aiosqlite:///{database_path}',
+                                         'HASHING_EXECUTOR': 'inline', 'CREATE_SCHEMA_ON_STARTUP': True}))
+    client.lifespan('startup')
+    yield client
+    client.lifespan('shutdown')
+    client.loop.close()
+
+
+def test_async_database_uri_uses_async_drivers():
+    assert async_database_uri('mysql+pymysql://user:secret@db/blog') == 'mysql+aiomysql://user:secret@db/blog'
+    assert async_database_uri('sqlite:///blog.db') == 'sqlite+aiosqlite:///blog.db'
+
+
+def test_asgi_api_keeps_routes_and_json_shapes(asgi_client: AsgiClient, user_credentials: dict,
+                                               user_post_body: dict) -> None:
+    assert asgi_client.request('POST', '/api/signup', user_credentials)[:2] == \
+        (200, {'msg': f'User {user_credentials["username"]} successfully signed up'})
+    assert asgi_client.request('POST', '/api/signup', user_credentials)[0] == 202
+    assert asgi_client.request('POST', '/api/signup', {'username': 'x'})[:2] == \
+        (400, {'message': {'password': 'Can not be blank'}})
+
+    status, body, _ = asgi_client.request('POST', '/api/login', user_credentials)
+    assert status == 200 and body['token']
+    headers = {'Authorization': f'Bearer {body["token"]}'}
+
+    assert asgi_client.request('POST', '/api/posts', user_post_body, headers)[:2] == \
+        (200, {'msg': 'Post successfully created'})
+    status, body, response_headers = asgi_client.request('GET', '/api/posts?limit=1', headers=headers)
+    assert status == 200 and body['next_cursor'] is None
+    post = body['posts'][0]
+    assert set(post) == {'post_id', 'user_id', 'username', 'post_text', 'likes', 'dislikes', 'like_it',
+                         'created_time'}
+    assert asgi_client.request('GET', '/api/posts', headers=dict(
+        headers, **{'If-None-Match': response_headers['etag']}))[0] == 304
+
+    status, body, _ = asgi_client.request('POST', '/api/rating', {'post_id': post['post_id'], 'like': 1}, headers)
+    assert (status, body['like_it'], body['likes'], body['dislikes']) == (200, 1, 1, 0)
+    assert asgi_client.request('POST', '/api/rating', {'post_id': 100000, 'like': 1}, headers)[0] == 404
+    assert asgi_client.request('GET', '/api/posts', headers=headers)[1]['posts'][0]['like_it'] == 1
+
+    assert asgi_client.request('POST', '/api/logout', headers=headers)[:2] == \
+        (200, {'msg': 'You are successfully logged out'})
+    assert asgi_client.request('GET', '/api/posts', headers=headers)[:2] == \
+        (401, {'msg': 'Token has been revoked'})
+
+
+def test_asgi_api_accepts_tokens_of_flask_app(asgi_client: AsgiClient, user_expired_token: dict) -> None:
+    with app.app_context():
+        token = create_access_token(identity='flask@example.com', additional_claims={'user_id': 1})
+    assert asgi_client.request('GET', '/api/posts?limit=1', headers={'Authorization': f'Bearer {token}'})[0] == 200
+    assert asgi_client.request('GET', '/api/posts', headers={
+        'Authorization': f'Bearer {user_expired_token["token"]}'})[:2] == (401, {'msg': 'Token has expired'})
+    assert asgi_client.request('GET', '/api/posts')[0] == 401
+    with app.app_context():
+        token = create_access_token(identity='deleted@example.com')
+    assert asgi_client.request('GET', '/api/posts', headers={'Authorization': f'Bearer {token}'})[:2] == \
+        (401, {'msg': 'Error loading the user deleted@example.com'})
+
+
+def test_asgi_api_rating_takes_feed_version_lock_first(asgi_client: AsgiClient) -> None:
+    asgi_client.request('POST', '/api/signup', {'username': 'locks@example.com', 'password': 'secret'})
+    token = asgi_client.request('POST', '/api/login', {'username': 'locks@example.com', 'password': 'secret'})[1]
+    headers = {'Authorization': f'Bearer {token["token"]}'}
+    asgi_client.request('POST', '/api/posts', {'post_text': 'Locks order'}, headers)
+    post_id = asgi_client.request('GET', '/api/posts?limit=1', headers=headers)[1]['posts'][0]['post_id']
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):  # noqa
+        statements.append(statement)
+
+    event.listen(asgi_client.app.engine.sync_engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        assert asgi_client.request('POST', '/api/rating', {'post_id': post_id, 'like': 1}, headers)[0] == 200
+    finally:
+        event.remove(asgi_client.app.engine.sync_engine, 'before_cursor_execute', before_cursor_execute)
+    # the rating is locked (SELECT ... FOR UPDATE on the server databases) after the feed version
+    bump = next(number for number, statement in enumerate(statements) if statement.startswith('UPDATE feed_version'))
+    assert all('post_ratings' not in statement for statement in statements[:bump])
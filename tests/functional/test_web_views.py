@@ -0,0 +1,40 @@
+from jwtblogapp import app
+
+client = app.test_client()
+
+
+def test_web_blog_renders_posts_without_loopback_requests(user_credentials: dict,
+                                                          user_post_body: dict,
+                                                          monkeypatch) -> None:
+    monkeypatch.setitem(app.config, 'WTF_CSRF_ENABLED', False)
+    monkeypatch.setitem(app.config, 'WEB_API_DISPATCH', 'local')
+    result = client.post('/web/login', data=user_credentials)
+    assert result.status_code == 302
+    assert result.location.endswith('/web/blog')
+
+    result = client.post('/web/blog', data=user_post_body)
+    assert result.status_code == 302
+
+    result = client.get('/web/blog')
+    assert result.status_code == 200
+    assert user_post_body["post_text"] in result.text
+
+    result = client.get('/web/logout')
+    assert result.status_code == 302
+
+
+def test_web_blog_rejects_tampered_rate_form(user_credentials: dict,
+                                             monkeypatch) -> None:
+    monkeypatch.setitem(app.config, 'WTF_CSRF_ENABLED', False)
+    monkeypatch.setitem(app.config, 'WEB_API_DISPATCH', 'local')
+    client.post('/web/login', data=user_credentials)
+
+    for form in ({'post_id': 'first', 'like': '1'}, {'post_id': '', 'like': '1'}, {'post_id': '1', 'like': '5'}):
+        result = client.post('/web/blog', data=form)
+        assert result.status_code == 302
+        assert 'Bad rating request' in client.get('/web/blog').text
+
+    result = client.post('/web/blog', data={'post_id': '1', 'like': '0'})
+    assert result.status_code == 302
+    assert 'Bad rating request' not in client.get('/web/blog').text
+    client.get('/web/logout')
@@ -0,0 +1,103 @@
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import func
+
+from jwtblogapp import app, database
+from jwtblogapp.blocklist import RevokedTokenCache
+from jwtblogapp.models import RevokedToken
+
+# the identifiers of the tokens are unique per run, so the tests can be re-run on the same database
+RUN = uuid.uuid4().hex
+
+
+def jti(name):
+    return f'{RUN}-{name}'
+
+
+def test_revoked_token_cache_sees_token_revoked_by_other_worker():
+    with app.app_context():
+        cache = RevokedTokenCache(app)
+        cache.negative_ttl = 0
+        assert cache.is_revoked(jti('other-worker-jti')) is False
+        # store the token as if it was revoked by another worker
+        RevokedToken(jti=jti('other-worker-jti')).store()
+        assert cache.is_revoked(jti('other-worker-jti')) is True
+        assert cache.stats()['refreshes'] == 2
+
+
+def test_revoked_token_cache_remembers_not_revoked_token():
+    with app.app_context():
+        cache = RevokedTokenCache(app)
+        assert cache.is_revoked(jti('fresh-jti')) is False
+        assert cache.is_revoked(jti('fresh-jti')) is False
+        stats = cache.stats()
+        assert stats['misses'] == 1
+        assert stats['hits'] == 1
+
+
+def test_revoked_token_cache_looks_up_database_when_evicted():
+    with app.app_context():
+        cache = RevokedTokenCache(app)
+        cache.max_size = 1
+        database.session.add_all([RevokedToken(jti=jti('evicted-jti-1')), RevokedToken(jti=jti('evicted-jti-2'))])
+        database.session.commit()
+        cache.refresh()
+        assert cache.complete is False
+        assert cache.is_revoked(jti('evicted-jti-1')) is True
+        assert cache.stats()['db_lookups'] == 1
+
+
+def test_revoked_token_cache_skips_lookup_for_expired_token():
+    with app.app_context():
+        cache = RevokedTokenCache(app)
+        assert cache.is_revoked(jti('expired-jti'), datetime.utcnow() - timedelta(minutes=1)) is True
+        stats = cache.stats()
+        assert stats['expired'] == 1
+        assert stats['refreshes'] == 0
+
+
+def test_prune_expired_revoked_tokens_in_batches():
+    # the database may have the expired tokens of other tests, so the assertions are scoped to the test's tokens
+    pruned_jtis = [jti(f'pruned-{number}') for number in range(5)]
+    kept_jti = jti('kept')
+    with app.app_context():
+        now = datetime.utcnow()
+        database.session.add_all([RevokedToken(jti=pruned_jti, expires_time=now - timedelta(hours=1))
+                                  for pruned_jti in pruned_jtis])
+        database.session.add(RevokedToken(jti=kept_jti, expires_time=now + timedelta(hours=1)))
+        database.session.commit()
+        try:
+            assert RevokedToken.prune_expired(now, batch_size=2) >= 5
+            assert RevokedToken.query.filter(RevokedToken.jti.in_(pruned_jtis)).count() == 0
+            assert RevokedToken.query.filter_by(jti=kept_jti).first() is not None
+        finally:
+            RevokedToken.query.filter(RevokedToken.jti.in_(pruned_jtis + [kept_jti])).delete(
+                synchronize_session=False)
+            database.session.commit()
+
+
+def test_revoked_token_cache_sees_token_committed_out_of_id_order():
+    with app.app_context():
+        cache = RevokedTokenCache(app)
+        cache.negative_ttl = 0
+        last_id = RevokedToken.query.with_entities(func.max(RevokedToken.id)).scalar() or 0
+        RevokedToken(id=last_id + 10, jti=jti('later-committed-jti')).store()
+        cache.refresh()
+        assert cache.high_water_id == last_id + 10
+        # the lower id is committed by a concurrent transaction after the higher one was seen
+        RevokedToken(id=last_id + 5, jti=jti('earlier-id-jti')).store()
+        assert cache.is_revoked(jti('earlier-id-jti')) is True
+        assert cache.stats()['db_lookups'] == 0
+
+
+def test_revoked_token_cache_rescan_skips_tokens_left_by_first_load():
+    with app.app_context():
+        now = datetime.utcnow()
+        database.session.add_all([RevokedToken(jti=jti('left-expired'), expires_time=now - timedelta(hours=1)),
+                                  RevokedToken(jti=jti('left-fresh'), expires_time=now + timedelta(hours=1))])
+        database.session.commit()
+        cache = RevokedTokenCache(app)
+        cache.refresh()
+        cache.refresh()
+        assert jti('left-expired') not in cache.revoked
@@ -0,0 +1,92 @@
+from datetime import datetime
+
+from jwtblogapp import app, database, post_counters
+from jwtblogapp.counters import reconcile
+from jwtblogapp.models import Post, Rating, FeedVersion, PostCounterDelta
+from jwtblogapp.services import Identity, feed_etag, rate_post, rate_posts
+
+
+def make_post(text):
+    post = Post(user_id=1, username='counter@example.com', text=text, likes=0, dislikes=0,
+                created_time=datetime.now())
+    post.store()
+    return post.id
+
+
+def post_counts(post_id):
+    return Post.query.with_entities(Post.likes, Post.dislikes).filter_by(id=post_id).one()
+
+
+def test_write_behind_ratings_change_counts_by_flush(monkeypatch):
+    monkeypatch.setattr(post_counters, 'write_behind', True)
+    with app.test_request_context():
+        post_id = make_post('Hot post')
+        version = FeedVersion.current()
+        for user_id in range(1, 4):
+            body, status = rate_post(Identity(user_id, f'liker{user_id}'), post_id, 1)
+            assert status == 200
+        # the response counts include the pending changes, the post's record is not changed yet
+        assert (body['likes'], body['dislikes'], body['like_it']) == (3, 0, 1)
+        assert tuple(post_counts(post_id)) == (0, 0)
+        assert FeedVersion.current() == version
+
+        assert rate_post(Identity(1, 'liker1'), post_id, 0)[0]['dislikes'] == 1
+        assert post_counters.flush() == 4
+        assert tuple(post_counts(post_id)) == (2, 1)
+        assert PostCounterDelta.query.count() == 0
+        assert FeedVersion.current() == version + 1
+        assert database.session.get(Post, post_id).change_version == version + 1
+        assert post_counters.flush() == 0
+        assert FeedVersion.current() == version + 1
+
+
+def test_write_behind_rating_of_not_existing_post_returned_not_found(monkeypatch):
+    monkeypatch.setattr(post_counters, 'write_behind', True)
+    with app.test_request_context():
+        assert rate_post(Identity(1, 'liker1'), 999999, 1)[1] == 404
+        assert PostCounterDelta.query.count() == 0
+
+
+def test_write_behind_batch_rating_records_one_change_per_post(monkeypatch):
+    monkeypatch.setattr(post_counters, 'write_behind', True)
+    with app.test_request_context():
+        post_id = make_post('Batch rated hot post')
+        body, status = rate_posts(Identity(1, 'liker1'), [{'post_id': post_id, 'like': 1},
+                                                          {'post_id': post_id, 'like': 0}])
+        assert [(item['like_it'], item['likes'], item['dislikes']) for item in body['results']] == [(1, 0, 1),
+                                                                                                     (-1, 0, 1)]
+        assert PostCounterDelta.query.filter_by(post_id=post_id).count() == 1
+        assert post_counters.flush() == 1
+        assert tuple(post_counts(post_id)) == (0, 1)
+
+
+def test_reconcile_repairs_drifted_counts_keeping_pending_changes():
+    with app.app_context():
+        post_id = make_post('Drifted post')
+        database.session.add_all([Rating(user_id=user_id, post_id=post_id, value=1) for user_id in (1, 2, 3)])
+        # one like is still pending in the write-behind changes
+        PostCounterDelta.record(3, post_id, 1, 0)
+        database.session.query(Post).filter_by(id=post_id).update({'likes': 7, 'dislikes': 1})
+        database.session.commit()
+
+        assert reconcile(batch_size=2, dry_run=True) == 1
+        assert tuple(post_counts(post_id)) == (7, 1)
+        assert reconcile(batch_size=2) == 1
+        assert tuple(post_counts(post_id)) == (2, 0)
+        assert post_counters.flush() == 1
+        assert tuple(post_counts(post_id)) == (3, 0)
+        assert reconcile() == 0
+
+
+def test_write_behind_rating_changes_raters_feed_etag(monkeypatch):
+    monkeypatch.setattr(post_counters, 'write_behind', True)
+    with app.test_request_context():
+        post_id = make_post('Etag rated post')
+        rater, other = Identity(1, 'liker1'), Identity(2, 'liker2')
+        etags = feed_etag(rater), feed_etag(other)
+        rate_post(rater, post_id, 1)
+        # the version is not bumped until the flush, but the rater's own 'like_it' changed
+        assert feed_etag(rater) != etags[0]
+        assert feed_etag(other) == etags[1]
+        post_counters.flush()
+        assert feed_etag(other) != etags[1]
@@ -0,0 +1,32 @@
+import gzip
+import json
+
+from jwtblogapp import app, database
+from jwtblogapp.exporting import encode_batches, gzip_chunks
+from jwtblogapp.models import Post
+
+
+def test_export_encodes_and_compresses_batches_as_they_are_read():
+    read = []
+
+    def batches():
+        for rows in ([(1, 'a')], [(2, 'b,c')]):
+            read.append(rows)
+            yield rows
+
+    chunks = encode_batches(batches(), ['post_id', 'post_text'], 'csv')
+    assert next(chunks) == b'post_id,post_text\r\n'
+    assert next(chunks) == b'1,a\r\n'
+    assert len(read) == 1
+    assert gzip.decompress(b''.join(gzip_chunks(chunks))) == b'2,"b,c"\r\n'
+
+
+def test_export_command_writes_gzipped_ndjson_file(tmp_path):
+    output = tmp_path / 'posts.ndjson.gz'
+    result = app.test_cli_runner().invoke(args=['export', 'posts', '--gzip', '--batch-size', '3',
+                                                '--output', str(output)])
+    assert result.exit_code == 0, result.output
+    exported = [json.loads(line) for line in gzip.decompress(output.read_bytes()).splitlines()]
+    with app.app_context():
+        assert [post['post_id'] for post in exported] == [post_id for post_id, in database.session.query(
+            Post.id).order_by(Post.id)]
@@ -0,0 +1,61 @@
+from datetime import datetime
+
+import pytest
+
+from jwtblogapp import app, database, feed_cache
+from jwtblogapp.feed_cache import FeedCache, MemoryBackend, SQLiteBackend
+from jwtblogapp.models import Post
+from jwtblogapp.services import feed_page
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def cache(request, tmp_path) -> FeedCache:
+    feed_cache = FeedCache()
+    if request.param == 'memory':
+        feed_cache.backend = MemoryBackend(max_entries=2, ttl=30)
+    else:
+        feed_cache.backend = SQLiteBackend(str(tmp_path / 'feed_cache.sqlite'), max_entries=2, ttl=30)
+    return feed_cache
+
+
+def test_feed_cache_hits_misses_and_evictions(cache: FeedCache):
+    generation = cache.generation()
+    assert cache.get(generation, 'all') is None
+    cache.set(generation, 'all', {'posts': [{'post_id': 1}]})
+    assert cache.get(generation, 'all') == {'posts': [{'post_id': 1}]}
+    cache.set(generation, '20:None', {'posts': []})
+    cache.set(generation, '20:10', {'posts': []})
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['evictions'], stats['entries']) == (1, 1, 1, 2)
+
+
+def test_feed_cache_invalidation_starts_new_generation(cache: FeedCache):
+    generation = cache.generation()
+    cache.invalidate()
+    # the page built before the write is cached under the old generation and never served
+    cache.set(generation, 'all', {'posts': []})
+    assert cache.get(cache.generation(), 'all') is None
+    assert cache.generation() == generation + 1
+
+
+def test_memory_cache_drops_entries_of_older_feed_versions():
+    backend = MemoryBackend(max_entries=10, ttl=30)
+    backend.set('v1:all', {'posts': []}, 1)
+    backend.set('v1:20:None', {'posts': []}, 1)
+    assert backend.set('v2:all', {'posts': []}, 2) == 2
+    # a page built before the newer version was cached is not kept
+    backend.set('v1:20:10', {'posts': []}, 1)
+    assert list(backend.entries) == ['v2:all']
+
+
+def test_feed_of_all_posts_is_not_cached_above_size_limit(monkeypatch):
+    monkeypatch.setitem(app.config, 'FEED_CACHE_MAX_POSTS', 0)
+    with app.app_context():
+        database.session.add(Post(user_id=1, username='cache@example.com', text='Not cached', likes=0, dislikes=0,
+                                     created_time=datetime.now()))
+        database.session.commit()
+        sets = feed_cache.stats()['sets']
+        assert feed_page()['posts']
+        assert feed_cache.stats()['sets'] == sets
+        feed_page(limit=1)
+        assert feed_cache.stats()['sets'] == sets + 1
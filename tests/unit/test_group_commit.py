@@ -0,0 +1,64 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import pytest
+
+from jwtblogapp import app, database
+from jwtblogapp.groupcommit import GroupCommit, WriteRollback
+from jwtblogapp.models import FeedVersion
+
+
+def bumping_write(result, rollback=False):
+    def write():
+        FeedVersion.bump()
+        if rollback:
+            raise WriteRollback(result)
+        return result
+    return write
+
+
+def test_group_commit_batch_rolls_back_only_the_failed_write():
+    group_commit = GroupCommit(app)
+    batch = [(bumping_write('first'), Future()), (bumping_write('rolled back', rollback=True), Future()),
+             (bumping_write('third'), Future())]
+    with app.app_context():
+        version = FeedVersion.current()
+        group_commit.commit_batch(batch)
+        database.session.rollback()
+        assert FeedVersion.current() == version + 2
+    assert [future.result() for _, future in batch] == ['first', 'rolled back', 'third']
+    stats = group_commit.stats()
+    assert (stats['batches'], stats['writes'], stats['max_batch_size']) == (1, 3, 3)
+
+
+def test_group_commit_batch_sets_write_error_to_its_request_only():
+    group_commit = GroupCommit(app)
+
+    def failing_write():
+        raise ValueError('bad write')
+
+    batch = [(failing_write, Future()), (bumping_write('ok'), Future())]
+    with app.app_context():
+        group_commit.commit_batch(batch)
+    with pytest.raises(ValueError):
+        batch[0][1].result()
+    assert batch[1][1].result() == 'ok'
+
+
+def test_group_commit_commits_concurrent_writes_together():
+    group_commit = GroupCommit(app)
+    group_commit.enabled = True
+    group_commit.max_wait = 0.2
+
+    def request(number):
+        with app.app_context():
+            return group_commit.run_write(bumping_write(number))
+
+    with app.app_context():
+        version = FeedVersion.current()
+        database.session.rollback()
+    with ThreadPoolExecutor(4) as executor:
+        assert sorted(executor.map(request, range(4))) == [0, 1, 2, 3]
+    with app.app_context():
+        assert FeedVersion.current() == version + 4
+    assert group_commit.stats()['writes'] == 4
+    assert group_commit.stats()['batches'] < 4
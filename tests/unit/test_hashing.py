@@ -0,0 +1,59 @@
+import os
+import signal
+from time import monotonic, sleep
+
+import pytest
+
+from jwtblogapp.hashing import HashingBusy, PasswordHasher
+
+
+def test_password_hasher_hashes_and_verifies_in_process_pool():
+    hasher = PasswordHasher()
+    try:
+        password_hash = hasher.hash('password')
+        assert hasher.verify('password', password_hash) is True
+        assert hasher.verify('pasword', password_hash) is False
+    finally:
+        hasher.shutdown()
+    stats = hasher.stats()
+    assert stats['tasks'] == 3
+    assert stats['in_flight'] == 0
+    assert sum(stats['latency_buckets'].values()) == 3
+
+
+def test_password_hasher_rejects_when_saturated():
+    hasher = PasswordHasher()
+    hasher.pool_size, hasher.queue_size = 1, 0
+    hasher.slots = None
+    hasher.run(len, 'warm up slots')
+    hasher.slots.acquire()
+    try:
+        with pytest.raises(HashingBusy):
+            hasher.hash('password')
+    finally:
+        hasher.slots.release()
+        hasher.shutdown()
+    assert hasher.stats()['rejected'] == 1
+
+
+def test_password_hasher_replaces_broken_pool():
+    hasher = PasswordHasher()
+    try:
+        hasher.run(len, 'start the pool')
+        broken = hasher.executor
+        process = next(iter(broken._processes.values()))
+        os.kill(process.pid, signal.SIGKILL)
+        process.join()
+        # the pool management thread marks the pool broken when it notices the dead process
+        deadline = monotonic() + 5
+        while not broken._broken and monotonic() < deadline:
+            sleep(0.01)
+        with pytest.raises(HashingBusy):
+            hasher.run(len, 'broken pool')
+        assert hasher.run(len, 'new pool') == 8
+        assert hasher.executor is not broken
+    finally:
+        hasher.shutdown()
+    stats = hasher.stats()
+    assert stats['broken_pools'] == 1
+    assert stats['in_flight'] == 0
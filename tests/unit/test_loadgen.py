@@ -0,0 +1,27 @@
+import random
+from collections import Counter
+
+import pytest
+
+from jwtblogapp.loadgen import ZipfChooser, parse_mix, percentile
+
+
+def test_parse_mix():
+    assert parse_mix('feed=80,rate=20') == {'feed': 80, 'rate': 20}
+    with pytest.raises(ValueError):
+        parse_mix('delete=1')
+
+
+def test_zipf_chooser_prefers_top_ranked_posts():
+    chooser = ZipfChooser(exponent=1.2)
+    rng = random.Random(1)
+    assert chooser.choice(rng) is None
+    chooser.update([30, 20, 10])
+    counts = Counter(chooser.choice(rng) for _ in range(3000))
+    assert counts[30] > counts[20] > counts[10] > 0
+
+
+def test_percentile():
+    values = list(range(1, 101))
+    assert (percentile(values, 50), percentile(values, 95), percentile(values, 99)) == (50, 95, 99)
+    assert percentile([], 50) == 0
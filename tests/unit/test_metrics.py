@@ -0,0 +1,57 @@
+import copy
+import json
+
+import pytest
+from flask import g
+from flask_jwt_extended import create_access_token
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from jwtblogapp import app, database, request_metrics
+from jwtblogapp.metrics import RequestMetrics, render
+
+client = app.test_client()
+
+
+def test_metrics_count_requests_and_sql_statements():
+    with app.app_context():
+        access_token = create_access_token(identity='metrics@example.com', additional_claims={'user_id': 1})
+    request_metrics.reset()
+    client.get('/api/posts?limit=5', headers={"Authorization": f'Bearer {access_token}'})
+    text = client.get('/metrics').text
+    assert 'jwtblogapp_http_requests_total{endpoint="api_posts",method="GET",status="200"} 1' in text
+    assert 'jwtblogapp_http_request_duration_seconds_count{endpoint="api_posts"} 1' in text
+    # the feed page runs at least the feed version and the posts queries
+    assert 'jwtblogapp_http_request_queries_bucket{endpoint="api_posts",le="1"} 0' in text
+    assert 'jwtblogapp_http_request_queries_bucket{endpoint="api_posts",le="+Inf"} 1' in text
+
+
+def test_metrics_are_summed_across_worker_files(tmp_path):
+    metrics = RequestMetrics()
+    metrics.directory = str(tmp_path)
+    other_worker = {'requests': {'api_rating|POST|200': 2},
+                    'histograms': {'jwtblogapp_http_request_queries': {
+                        'api_rating': {'buckets': [0, 0, 0, 0, 2, 2, 2, 2, 2], 'sum': 8, 'count': 2}}}}
+    (tmp_path / 'metrics_1.json').write_text(json.dumps(other_worker))
+    metrics.requests['api_rating|POST|200'] += 1
+    metrics.flush()
+
+    text = render(metrics.collect())
+    assert 'jwtblogapp_http_requests_total{endpoint="api_rating",method="POST",status="200"} 3' in text
+    assert 'jwtblogapp_http_request_queries_count{endpoint="api_rating"} 2' in text
+
+
+def test_metrics_failed_statement_leaves_nothing_on_connection():
+    with app.test_request_context():
+        RequestMetrics.start_request()
+        connection = database.session.connection()
+        info = copy.deepcopy(connection.info)
+        for _ in range(3):
+            with pytest.raises(OperationalError):
+                database.session.execute(text('SELECT * FROM missing_table'))
+            database.session.rollback()
+            connection = database.session.connection()
+        database.session.execute(text('SELECT 1'))
+        assert connection.info == info
+        assert g.metrics_queries == 1
+        database.session.rollback()
@@ -0,0 +1,55 @@
+import pytest
+
+from jwtblogapp import app, database, migrations
+from jwtblogapp.models import FeedVersion, Post
+
+
+def test_schema_upgrade_and_downgrade_of_indexes():
+    with app.app_context():
+        assert migrations.upgrade(echo=lambda _: None) == migrations.LATEST_VERSION
+        assert migrations.downgrade(2, echo=lambda _: None) == 2
+        with database.engine.connect() as connection:
+            assert not migrations.has_index(connection, 'revoked_tokens', 'ix_revoked_tokens_jti')
+        assert migrations.upgrade(echo=lambda _: None) == migrations.LATEST_VERSION
+        with database.engine.connect() as connection:
+            assert migrations.current_version(connection) == migrations.LATEST_VERSION
+            assert migrations.has_index(connection, 'revoked_tokens', 'ix_revoked_tokens_jti')
+
+
+def test_hot_queries_use_indexes():
+    with app.app_context():
+        plans = {name: ' '.join(str(row) for row in rows) for name, _, rows in migrations.explain_hot_queries()}
+    assert 'ix_revoked_tokens_jti' in plans['revoked token by jti']
+    assert 'ix_post_ratings_post_id' in plans['ratings of post']
+
+
+def test_schema_upgrade_inserts_missing_feed_version_record():
+    with app.app_context():
+        migrations.upgrade(echo=lambda _: None)
+        assert migrations.downgrade(7, echo=lambda _: None) == 7
+        database.session.query(FeedVersion).delete()
+        database.session.commit()
+        with pytest.raises(RuntimeError):
+            FeedVersion.bump()
+        database.session.rollback()
+
+        assert migrations.upgrade(echo=lambda _: None) == migrations.LATEST_VERSION
+        FeedVersion.bump()
+        database.session.commit()
+        assert FeedVersion.current() == 1
+
+
+def test_schema_upgrade_backfills_change_versions():
+    with app.app_context():
+        migrations.upgrade(echo=lambda _: None)
+        database.session.add(Post(user_id=1, username='legacy@example.com', text='Legacy post', likes=0, dislikes=0))
+        database.session.commit()
+        database.session.query(Post).update({'change_version': None})
+        database.session.commit()
+        version = FeedVersion.current()
+
+        assert migrations.downgrade(8, echo=lambda _: None) == 8
+        assert migrations.upgrade(echo=lambda _: None) == migrations.LATEST_VERSION
+        assert FeedVersion.current() == version + 1
+        assert database.session.query(Post).filter(Post.change_version.is_(None)).count() == 0
+        assert database.session.query(Post).filter(Post.change_version == version + 1).count() > 0
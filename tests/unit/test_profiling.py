@@ -0,0 +1,59 @@
+import os
+import pstats
+
+from werkzeug.test import Client
+
+from jwtblogapp import app
+from jwtblogapp.profiling import RequestProfiler
+
+
+def make_profiler(directory, **options) -> RequestProfiler:
+    profiler = RequestProfiler()
+    profiler.directory = str(directory)
+    profiler.token = 'secret'
+    for name, value in options.items():
+        setattr(profiler, name, value)
+    profiler.url_map = app.url_map
+    profiler.wsgi_app = app.wsgi_app
+    return profiler
+
+
+def test_profiler_writes_profile_only_with_token(tmp_path):
+    client = Client(make_profiler(tmp_path).middleware)
+    client.get('/', headers={'X-Profile': 'wrong'}, buffered=True)
+    assert os.listdir(tmp_path) == []
+    client.get('/', headers={'X-Profile': 'secret'}, buffered=True)
+    profiles = os.listdir(tmp_path)
+    assert len(profiles) == 1 and profiles[0].startswith('get-web.index-') and profiles[0].endswith('.prof')
+
+
+def test_profiler_rotation_keeps_directory_size_bounded(tmp_path):
+    profiler = make_profiler(tmp_path, sample_rate=1.0)
+    client = Client(profiler.middleware)
+    client.get('/', buffered=True)
+    profiler.max_bytes = os.path.getsize(tmp_path / os.listdir(tmp_path)[0]) * 2
+    for _ in range(5):
+        client.get('/not-existing', buffered=True)
+    assert sum(os.path.getsize(tmp_path / name) for name in os.listdir(tmp_path)) <= profiler.max_bytes
+    assert all(name.startswith('get-unmatched-') for name in os.listdir(tmp_path))
+
+
+def streamed_work():
+    return b'chunk'
+
+
+def test_profiler_profiles_streamed_body_until_it_is_closed(tmp_path):
+    def streaming_app(environ, start_response):
+        start_response('200 OK', [('Content-Type', 'text/plain')])
+        return (streamed_work() for _ in range(3))
+
+    profiler = make_profiler(tmp_path, sample_rate=1.0)
+    profiler.wsgi_app = streaming_app
+    response = Client(profiler.middleware).get('/stream')
+    assert os.listdir(tmp_path) == []
+    assert response.data == b'chunk' * 3
+    response.close()
+    profiles = os.listdir(tmp_path)
+    assert len(profiles) == 1
+    calls = {function: stat[1] for (_, _, function), stat in pstats.Stats(str(tmp_path / profiles[0])).stats.items()}
+    assert calls['streamed_work'] == 3
@@ -0,0 +1,48 @@
+import pytest
+from flask import Response, g
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+from jwtblogapp import app
+from jwtblogapp.querylog import QueryLog, listen_statements, statement_shape, summarize
+
+
+def test_statement_shape_ignores_parameters_and_in_list_length():
+    assert statement_shape('SELECT * FROM posts WHERE id IN (?, ?, ?) AND user_id = 5') == \
+        statement_shape("SELECT * FROM posts WHERE id IN (%s, %s)  AND user_id = 'x'")
+
+
+def test_summary_reports_repeated_and_slow_statements():
+    queries = [('SELECT 1 FROM posts WHERE id = ?', 0.001)] * 3 + [('SELECT * FROM blog_users', 0.2)]
+    summary = summarize(queries, slow_threshold=0.1, repeat_threshold=3)
+    assert summary['queries'] == 4
+    assert summary['repeated'] == [{'shape': 'SELECT ? FROM posts WHERE id = ?', 'count': 3}]
+    assert summary['slow'] == [{'statement': 'SELECT * FROM blog_users', 'ms': 200.0}]
+
+
+def test_query_log_adds_summary_headers():
+    query_log = QueryLog()
+    query_log.slow_threshold = 0.1
+    with app.test_request_context('/api/posts'):
+        query_log.start_request()
+        g.query_log += [('SELECT 1 FROM posts WHERE id = ?', 0.001)] * 3
+        response = query_log.finish_request(Response())
+    assert (response.headers['X-Query-Count'], response.headers['X-Query-Repeated'],
+            response.headers['X-Query-Slow']) == ('3', '1', '0')
+
+
+def test_listen_statements_skips_failed_statement():
+    engine = create_engine('sqlite://')
+    queries = []
+    remove_listeners = listen_statements(engine, lambda *query: queries.append(query))
+    with engine.connect() as connection:
+        info = dict(connection.info)
+        for _ in range(3):
+            with pytest.raises(OperationalError):
+                connection.execute(text('SELECT * FROM missing_table'))
+        connection.execute(text('SELECT 1'))
+        assert connection.info == info
+    remove_listeners()
+    with engine.connect() as connection:
+        connection.execute(text('SELECT 2'))
+    assert [statement for statement, _ in queries] == ['SELECT 1']
@@ -0,0 +1,48 @@
+from sqlalchemy import func
+
+from jwtblogapp import app, database
+from jwtblogapp.models import Post, Rating, FeedVersion, FeedEvent, PostCounterDelta
+from jwtblogapp.seeding import Seeder
+
+
+def test_seeding_is_deterministic_and_ratings_match_counts():
+    seeder = Seeder(users=5, posts=20, ratings=200, revoked_tokens=10, zipf_exponent=1.5, seed=7)
+    generated = list(seeder.generate_posts(first_user_id=1, first_post_id=1))
+    assert generated == list(seeder.generate_posts(first_user_id=1, first_post_id=1))
+    assert list(seeder.generate_revoked_tokens()) == list(seeder.generate_revoked_tokens())
+    # the ratings are limited by users * posts and every pair of user and post is rated once
+    ratings = [rating for _, post_ratings in generated for rating in post_ratings]
+    assert len(ratings) == 100
+    assert len({(rating['user_id'], rating['post_id']) for rating in ratings}) == 100
+    for post, post_ratings in generated:
+        assert post['likes'] == sum(1 for rating in post_ratings if rating['value'] == 1)
+        assert post['dislikes'] == sum(1 for rating in post_ratings if rating['value'] == -1)
+
+
+def test_seeding_appends_to_existing_content():
+    seeder = Seeder(users=3, posts=10, ratings=15, revoked_tokens=5, batch_size=4)
+    with app.app_context():
+        posts_before = database.session.query(func.count(Post.id)).scalar()
+        report = seeder.run(echo=lambda _: None)
+        assert (report['users'], report['posts'], report['ratings'], report['revoked_tokens']) == (3, 10, 15, 5)
+        assert database.session.query(func.count(Post.id)).scalar() == posts_before + 10
+        likes, dislikes = database.session.query(func.sum(Post.likes), func.sum(Post.dislikes)).filter(
+            Post.id >= report['first_post_id']).one()
+        assert likes + dislikes == database.session.query(func.count(Rating.id)).filter(
+            Rating.post_id >= report['first_post_id'], Rating.value != 0).scalar()
+
+
+def test_seeding_reset_keeps_feed_version_increasing():
+    with app.app_context():
+        FeedEvent.record('post_created', {'post_id': 1})
+        PostCounterDelta.record(1, 1, 1, 0)
+        database.session.commit()
+        version = FeedVersion.current()
+        Seeder(users=2, posts=3, ratings=2, revoked_tokens=1).run(reset=True, echo=lambda _: None)
+        assert FeedVersion.current() > version
+        assert database.session.query(func.count(Post.id)).scalar() == 3
+        # the seeded posts and ratings are returned by the changes since the version before seeding
+        assert database.session.query(func.count(Post.id)).filter(Post.change_version > version).scalar() == 3
+        assert database.session.query(func.count(Rating.id)).filter(Rating.change_version.is_(None)).scalar() == 0
+        assert database.session.query(func.count(FeedEvent.id)).scalar() == 0
+        assert database.session.query(func.count(PostCounterDelta.id)).scalar() == 0
@@ -0,0 +1,28 @@
+from sqlalchemy import inspect
+
+from jwtblogapp import create_app, database
+from jwtblogapp.startup import parse_import_times, startup_report
+
+
+def test_create_app_does_not_create_schema():
+    new_app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite://'})
+    endpoints = {rule.endpoint for rule in new_app.url_map.iter_rules()}
+    assert {'api_posts', 'api_rating', 'web.blog', 'metrics'} <= endpoints
+    with new_app.app_context():
+        assert not inspect(database.engine).has_table('posts')
+
+
+def test_parse_import_times():
+    output = 'import time: self [us] | cumulative | imported package\n' \
+             'import time:       150 |        150 |   jwtblogapp.config\n' \
+             'import time:      2000 |       5000 | jwtblogapp\n'
+    assert parse_import_times(output) == [
+        {'module': 'jwtblogapp.config', 'level': 1, 'self_ms': 0.15, 'cumulative_ms': 0.15},
+        {'module': 'jwtblogapp', 'level': 0, 'self_ms': 2.0, 'cumulative_ms': 5.0},
+    ]
+
+
+def test_startup_does_not_import_faker():
+    report = startup_report(top=5)
+    assert 'faker' not in report['heavy_modules']
+    assert report['modules'][0]['module'] == 'jwtblogapp'